@@ -0,0 +1,111 @@
+''' CPU throughput and accuracy of float32 against bf16 autocast, for training and inference on FI-2010.
+The accuracy is the macro f1 score on the test split after train_steps steps with the same seed and batch order,
+it needs the preprocessed FI-2010 data in data/FI_2010.
+
+usage: python -m benchmarks.bf16_comparison --models TLOB MLPLOB --train_steps 1000
+'''
+import argparse
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+from sklearn.metrics import f1_score
+import constants as cst
+from preprocessing.dataset import load_split
+from utils.utils_model import pick_model
+from utils.utils_benchmark import MODEL_CONFIGS, default_model_args, random_input, logits, time_calls, latency_summary
+
+
+def autocast(precision):
+    return torch.autocast("cpu", dtype=torch.bfloat16, enabled=precision == "bf16")
+
+
+def throughput(model_args, precision, batch_size, iters, warmup):
+    torch.manual_seed(0)
+    model = pick_model(**model_args)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    loss_function = nn.CrossEntropyLoss()
+    x = random_input(batch_size, model_args["seq_size"], model_args["num_features"])
+    y = torch.randint(0, 3, (batch_size,))
+
+    def train_step():
+        optimizer.zero_grad()
+        with autocast(precision):
+            output = logits(model(x))
+        loss = loss_function(output.float(), y)
+        loss.backward()
+        optimizer.step()
+
+    def inference_step():
+        with torch.inference_mode(), autocast(precision):
+            model(x)
+
+    model.train()
+    train = latency_summary(time_calls(train_step, iters, warmup), batch_size)["throughput"]
+    model.eval()
+    inference = latency_summary(time_calls(inference_step, iters, warmup), batch_size)["throughput"]
+    return train, inference
+
+
+def accuracy(model_args, precision, lr, train_set, test_set, batch_size, train_steps):
+    torch.manual_seed(0)
+    model = pick_model(**model_args)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    loss_function = nn.CrossEntropyLoss()
+    generator = torch.Generator().manual_seed(0)
+    loader = DataLoader(train_set, batch_size=batch_size, shuffle=True, generator=generator, drop_last=True)
+    model.train()
+    step = 0
+    while step < train_steps:
+        for x, y in loader:
+            optimizer.zero_grad()
+            with autocast(precision):
+                output = logits(model(x))
+            loss = loss_function(output.float(), y)
+            loss.backward()
+            optimizer.step()
+            step += 1
+            if step == train_steps:
+                break
+    model.eval()
+    targets, predictions = [], []
+    with torch.inference_mode(), autocast(precision):
+        for x, y in DataLoader(test_set, batch_size=batch_size * 4, shuffle=False):
+            predictions.append(logits(model(x)).float().argmax(dim=1).numpy())
+            targets.append(y.numpy())
+    return f1_score(np.concatenate(targets), np.concatenate(predictions), average="macro")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", default=[cst.ModelType.TLOB.value, cst.ModelType.MLPLOB.value])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--train_steps", type=int, default=1000, help="0 skips the accuracy comparison")
+    parser.add_argument("--horizon", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    print(f"CPU capability: {torch.backends.cpu.get_cpu_capability()}")
+    print(f"{'model':<10}{'precision':<11}{'train samples/s':>18}{'infer samples/s':>18}{'test f1':>10}")
+    for model_type in args.models:
+        model_args = default_model_args(model_type, cst.Dataset.FI_2010.value)
+        hp = MODEL_CONFIGS[model_type]().hyperparameters_fixed
+        if args.train_steps > 0:
+            train_set = load_split(cst.Dataset.FI_2010.value, "train", model_args["seq_size"], args.horizon, hp["all_features"])
+            test_set = load_split(cst.Dataset.FI_2010.value, "test", model_args["seq_size"], args.horizon, hp["all_features"])
+        results = {}
+        for precision in ["32", "bf16"]:
+            train, inference = throughput(model_args, precision, args.batch_size, args.iters, args.warmup)
+            f1 = accuracy(model_args, precision, hp["lr"], train_set, test_set, args.batch_size, args.train_steps) if args.train_steps > 0 else float("nan")
+            results[precision] = (train, inference, f1)
+            print(f"{model_type:<10}{precision:<11}{train:>18.1f}{inference:>18.1f}{f1:>10.4f}")
+        train_speedup = results["bf16"][0] / results["32"][0]
+        inference_speedup = results["bf16"][1] / results["32"][1]
+        f1_delta = results["bf16"][2] - results["32"][2]
+        print(f"{model_type:<10}{'bf16 vs 32':<11}{train_speedup:>17.2f}x{inference_speedup:>17.2f}x{f1_delta:>+10.4f}")
+
+
+if __name__ == "__main__":
+    main()
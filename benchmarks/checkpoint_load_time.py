@@ -0,0 +1,74 @@
+''' startup time of loading a checkpoint: the previous path of an evaluation run, which read the file once for the
+hyperparameters and once more in Engine.load_from_checkpoint, against the single memory-mapped read of read_checkpoint
+with the Engine or the bare model rebuilt from the stored hyperparameters. Without --checkpoint a weights only checkpoint
+of a randomly initialized model is written to a temporary directory. The first load of each runner is timed separately,
+the other loads find the file in the page cache.
+
+usage: python -m benchmarks.checkpoint_load_time --model TLOB --iters 20
+       python -m benchmarks.checkpoint_load_time --checkpoint path/to/model.ckpt
+'''
+import argparse
+import os
+import tempfile
+import time
+import torch
+import constants as cst
+from models.engine import Engine, build_engine
+from utils.utils_checkpoint import read_checkpoint, weights_only_checkpoint
+from utils.utils_model import load_model
+from utils.utils_benchmark import default_model_args, time_calls, latency_summary
+
+
+def write_random_checkpoint(model_type, path):
+    engine = Engine(
+        horizon=10,
+        max_epochs=1,
+        is_wandb=False,
+        experiment_type=["EVALUATION"],
+        lr=0.0001,
+        optimizer="Adam",
+        filename_ckpt="benchmark",
+        **default_model_args(model_type),
+    )
+    torch.save(weights_only_checkpoint(engine, 0, 0), path)
+
+
+def previous_load(path):
+    checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+    hparams = checkpoint["hyper_parameters"]
+    return Engine.load_from_checkpoint(path, map_location="cpu", weights_only=False, experiment_type=hparams["experiment_type"])
+
+
+def engine_load(path):
+    return build_engine(read_checkpoint(path))
+
+
+def model_load(path):
+    return load_model(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=cst.ModelType.TLOB.value)
+    parser.add_argument("--checkpoint", default="", help="loaded instead of a randomly initialized model")
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.checkpoint
+        if path == "":
+            path = os.path.join(tmp_dir, f"{args.model}.ckpt")
+            write_random_checkpoint(args.model, path)
+        print(f"{path}, {os.path.getsize(path) / 2**20:.1f} MB")
+        print(f"{'runner':<24}{'first ms':>10}{'p50 ms':>10}{'p90 ms':>10}")
+        for name, runner in [("torch.load + Lightning", previous_load), ("single read Engine", engine_load), ("single read model", model_load)]:
+            start = time.perf_counter()
+            runner(path)
+            first = time.perf_counter() - start
+            summary = latency_summary(time_calls(lambda: runner(path), args.iters, warmup=0))
+            print(f"{name:<24}{first * 1000:>10.1f}{summary['p50_ms']:>10.1f}{summary['p90_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
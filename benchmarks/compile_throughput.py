@@ -0,0 +1,70 @@
+''' CPU throughput of the eager and the torch.compile variants of the models, for training and inference.
+
+usage: python -m benchmarks.compile_throughput --models TLOB MLPLOB --batch_size 32
+'''
+import argparse
+import torch
+from torch import nn
+import constants as cst
+from utils.utils_model import pick_model
+from utils.utils_benchmark import default_model_args, random_input, logits, time_calls, latency_summary
+
+
+def benchmark_model(model_type, dataset_type, batch_size, iters, warmup):
+    args = default_model_args(model_type, dataset_type)
+    x = random_input(batch_size, args["seq_size"], args["num_features"], dataset_type)
+    y = torch.randint(0, 3, (batch_size,))
+    results = {}
+    for compile in [False, True]:
+        torch.manual_seed(0)
+        model = pick_model(**args, compile=compile)
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+        loss_function = nn.CrossEntropyLoss()
+
+        def train_step():
+            optimizer.zero_grad()
+            loss = loss_function(logits(model(x)), y)
+            loss.backward()
+            optimizer.step()
+
+        def inference_step():
+            with torch.inference_mode():
+                model(x)
+
+        model.train()
+        train_times = time_calls(train_step, iters, warmup)
+        model.eval()
+        inference_times = time_calls(inference_step, iters, warmup)
+        name = "compiled" if compile else "eager"
+        results[name] = {
+            "train": latency_summary(train_times, batch_size)["throughput"],
+            "inference": latency_summary(inference_times, batch_size)["throughput"],
+        }
+    model = pick_model(**args).eval()
+    explanation = torch._dynamo.explain(model)(x)
+    results["graph_breaks"] = explanation.graph_break_count
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", default=[m.value for m in cst.ModelType])
+    parser.add_argument("--dataset_type", default=cst.Dataset.FI_2010.value)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    print(f"{'model':<10}{'mode':<12}{'train samples/s':>18}{'infer samples/s':>18}")
+    for model_type in args.models:
+        results = benchmark_model(model_type, args.dataset_type, args.batch_size, args.iters, args.warmup)
+        for mode in ["eager", "compiled"]:
+            print(f"{model_type:<10}{mode:<12}{results[mode]['train']:>18.1f}{results[mode]['inference']:>18.1f}")
+        train_speedup = results["compiled"]["train"] / results["eager"]["train"]
+        inference_speedup = results["compiled"]["inference"] / results["eager"]["inference"]
+        print(f"{model_type:<10}{'speedup':<12}{train_speedup:>17.2f}x{inference_speedup:>17.2f}x   graph breaks: {results['graph_breaks']}")
+
+
+if __name__ == "__main__":
+    main()
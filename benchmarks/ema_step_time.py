@@ -0,0 +1,83 @@
+''' CPU cost of the EMA of the Engine: per-step update with torch_ema against the foreach update, with and without
+an update interval, and the swap of the average in the validation per batch against once per epoch.
+torch_ema is needed only for the baseline, if it is not installed that row is skipped.
+
+usage: python -m benchmarks.ema_step_time --models TLOB MLPLOB --update_every 4
+'''
+import argparse
+import torch
+from torch import nn
+import constants as cst
+from utils.utils_model import pick_model
+from utils.utils_ema import ExponentialMovingAverage
+from utils.utils_benchmark import default_model_args, random_input, logits, time_calls, latency_summary
+
+
+def train_step_time(model_args, ema_factory, batch_size, iters, warmup):
+    ''' returns the p50 ms of a training step followed by the EMA update and of the EMA update alone '''
+    torch.manual_seed(0)
+    model = pick_model(**model_args).train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    loss_function = nn.CrossEntropyLoss()
+    x = random_input(batch_size, model_args["seq_size"], model_args["num_features"])
+    y = torch.randint(0, 3, (batch_size,))
+    ema = ema_factory(model.parameters()) if ema_factory is not None else None
+
+    def step():
+        optimizer.zero_grad()
+        loss_function(logits(model(x)), y).backward()
+        optimizer.step()
+        if ema is not None:
+            ema.update()
+
+    step_ms = latency_summary(time_calls(step, iters, warmup))["mean_ms"]
+    update_ms = latency_summary(time_calls(ema.update, iters, warmup))["mean_ms"] if ema is not None else 0.0
+    return step_ms, update_ms
+
+
+def swap_time(model_args, num_batches, iters):
+    ''' returns the ms spent swapping the average in and out for a validation of num_batches batches '''
+    model = pick_model(**model_args)
+    ema = ExponentialMovingAverage(model.parameters())
+
+    def swap():
+        with ema.average_parameters():
+            pass
+    cycle_ms = latency_summary(time_calls(swap, iters))["mean_ms"]
+    return cycle_ms * num_batches, cycle_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", default=[cst.ModelType.TLOB.value, cst.ModelType.MLPLOB.value])
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--update_every", type=int, default=4)
+    parser.add_argument("--val_batches", type=int, default=1000, help="number of validation batches of an epoch")
+    parser.add_argument("--iters", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    try:
+        import torch_ema
+    except ImportError:
+        torch_ema = None
+    variants = {"no ema": None}
+    if torch_ema is not None:
+        variants["torch_ema"] = lambda parameters: torch_ema.ExponentialMovingAverage(parameters, decay=0.999)
+    variants["foreach"] = lambda parameters: ExponentialMovingAverage(parameters)
+    variants[f"foreach/{args.update_every}"] = lambda parameters: ExponentialMovingAverage(parameters, update_every=args.update_every)
+
+    for model_type in args.models:
+        model_args = default_model_args(model_type, cst.Dataset.FI_2010.value)
+        print(f"{model_type}")
+        print(f"{'ema':<14}{'step ms':>10}{'update ms':>11}")
+        for name, factory in variants.items():
+            step_ms, update_ms = train_step_time(model_args, factory, args.batch_size, args.iters, args.warmup)
+            print(f"{name:<14}{step_ms:>10.3f}{update_ms:>11.4f}")
+        per_batch_ms, per_epoch_ms = swap_time(model_args, args.val_batches, args.iters)
+        print(f"EMA swap for {args.val_batches} validation batches: {per_batch_ms:.2f} ms per batch, {per_epoch_ms:.3f} ms once per epoch")
+
+
+if __name__ == "__main__":
+    main()
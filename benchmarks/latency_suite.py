@@ -0,0 +1,179 @@
+''' CPU inference latency of the four models at the configurations of config/config.py. For every model, number of
+threads, seq_size and hidden_dim the batch-1 and batch-N latency percentiles, the throughput and the peak resident memory
+are measured in a separate process, so that the memory and the thread pool of a configuration do not affect the others.
+The results are written as JSON. With --compare two result files are matched by configuration and the latencies,
+throughputs and memory that got worse by more than --threshold are flagged, the exit code is 1 if there are any.
+
+usage: python -m benchmarks.latency_suite --models TLOB MLPLOB --threads 1 4 --output results.json
+       python -m benchmarks.latency_suite --compare baseline.json results.json --threshold 0.1
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import torch
+import constants as cst
+from utils.utils_model import pick_model
+from utils.utils_benchmark import default_model_args, peak_rss_mb, random_input, time_calls, latency_summary
+
+HIDDEN_DIM_MODELS = [cst.ModelType.MLPLOB.value, cst.ModelType.TLOB.value]
+# the metrics of a result that are compared, with True when higher is better
+COMPARED_METRICS = {
+    "batch_1.p50_ms": False,
+    "batch_1.p99_ms": False,
+    "batch_n.p50_ms": False,
+    "batch_n.p99_ms": False,
+    "batch_n.throughput": True,
+    "peak_rss_mb": False,
+}
+
+
+def benchmark_config(config):
+    ''' runs in the worker process, returns the results of one configuration '''
+    torch.set_num_threads(config["threads"])
+    model_args = default_model_args(config["model"], config["dataset_type"])
+    for key in ["seq_size", "hidden_dim"]:
+        if config[key] is not None:
+            model_args[key] = config[key]
+    hidden_dim = model_args["hidden_dim"] if config["model"] in HIDDEN_DIM_MODELS else None
+    config = {**config, "seq_size": model_args["seq_size"], "hidden_dim": hidden_dim}
+    baseline_rss = peak_rss_mb()
+    torch.manual_seed(0)
+    model = pick_model(**model_args).eval()
+    results = {**config, "num_parameters": sum(p.numel() for p in model.parameters())}
+    for name, batch_size in [("batch_1", 1), ("batch_n", config["batch_size"])]:
+        x = random_input(batch_size, model_args["seq_size"], model_args["num_features"], config["dataset_type"])
+
+        def predict():
+            with torch.inference_mode():
+                model(x)
+        results[name] = latency_summary(time_calls(predict, config["iters"], config["warmup"]), batch_size)
+    results["baseline_rss_mb"] = baseline_rss
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def run_config(config):
+    ''' runs benchmark_config in a new process and returns its results '''
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.latency_suite", "--worker", json.dumps(config)],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        return {**config, "error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}"}
+    # the results are the last line of the output of the worker
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def config_key(result):
+    return (result["model"], result["dataset_type"], result["threads"], result["seq_size"], result["hidden_dim"], result["batch_size"])
+
+
+def metric(result, name):
+    value = result
+    for key in name.split("."):
+        value = value[key]
+    return value
+
+
+def compare(baseline, candidate, threshold):
+    ''' returns the rows of the comparison of the results of the configurations in both files, and the regressions '''
+    baseline_results = {config_key(r): r for r in baseline["results"] if "error" not in r}
+    rows, regressions = [], []
+    for result in candidate["results"]:
+        if "error" in result or config_key(result) not in baseline_results:
+            continue
+        base = baseline_results[config_key(result)]
+        for name, higher_is_better in COMPARED_METRICS.items():
+            old, new = metric(base, name), metric(result, name)
+            change = (new - old) / old if old != 0 else 0.0
+            regressed = change < -threshold if higher_is_better else change > threshold
+            row = {"config": config_key(result), "metric": name, "baseline": old, "candidate": new, "change": change, "regression": regressed}
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", default=[m.value for m in cst.ModelType])
+    parser.add_argument("--dataset_type", default=cst.Dataset.FI_2010.value)
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, torch.get_num_threads()])
+    parser.add_argument("--seq_sizes", nargs="+", type=int, default=None, help="seq_size of the model configs if not set")
+    parser.add_argument("--hidden_dims", nargs="+", type=int, default=None, help="hidden_dim of the model configs if not set")
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--iters", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", default=f"{cst.DIR_EXPERIMENTS}/latency_suite.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"))
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged as a regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(benchmark_config(json.loads(args.worker))))
+        return
+
+    if args.compare is not None:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            candidate = json.load(f)
+        rows, regressions = compare(baseline, candidate, args.threshold)
+        print(f"{'model':<10}{'threads':>8}{'seq':>6}{'hidden':>8}  {'metric':<20}{'baseline':>12}{'candidate':>12}{'change':>9}")
+        for row in rows:
+            model, _, threads, seq_size, hidden_dim, _ = row["config"]
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{model:<10}{threads:>8}{seq_size:>6}{str(hidden_dim):>8}  {row['metric']:<20}{row['baseline']:>12.3f}{row['candidate']:>12.3f}{row['change']:>+9.1%}{flag}")
+        print(f"{len(regressions)} regressions over {args.threshold:.0%} in {len(rows)} compared metrics")
+        sys.exit(1 if regressions else 0)
+
+    results = []
+    for model_type in args.models:
+        for threads in args.threads:
+            for seq_size in args.seq_sizes or [None]:
+                # BiN-CTABL and DeepLOB do not have a hidden_dim
+                for hidden_dim in (args.hidden_dims if model_type in HIDDEN_DIM_MODELS else None) or [None]:
+                    config = {
+                        "model": model_type,
+                        "dataset_type": args.dataset_type,
+                        "threads": threads,
+                        "seq_size": seq_size,
+                        "hidden_dim": hidden_dim,
+                        "batch_size": args.batch_size,
+                        "iters": args.iters,
+                        "warmup": args.warmup,
+                    }
+                    result = run_config(config)
+                    results.append(result)
+                    if "error" in result:
+                        print(f"{model_type} threads {threads} seq_size {seq_size} hidden_dim {hidden_dim} failed: {result['error']}")
+                        continue
+                    print(f"{model_type:<10} threads {threads:<3} seq {result['seq_size']:<5} hidden {str(result['hidden_dim']):<5} "
+                          f"b1 p50 {result['batch_1']['p50_ms']:.3f} p99 {result['batch_1']['p99_ms']:.3f} ms  "
+                          f"b{args.batch_size} p50 {result['batch_n']['p50_ms']:.2f} ms {result['batch_n']['throughput']:.0f}/s  "
+                          f"peak {result['peak_rss_mb']:.0f} MB")
+    output = {
+        "metadata": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results saved in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+''' end-to-end replay of a LOBSTER trading day: the rows of the message and orderbook files are fed one by one through
+the streaming preprocessing (event filter, sampling, time differences, depth, z-score with the stored statistics) into
+the model, and the latency of each event from its arrival to the output is measured. The rows and the probabilities
+are checked against the batch preprocessing of LOBSTERDataBuilder and a batched forward over the same day.
+The statistics are those saved by the preprocessing of --stock, or those of the replayed day without it.
+
+usage: python -m benchmarks.lobster_replay --messages INTC_2015-01-30_message_10.csv --orderbook INTC_2015-01-30_orderbook_10.csv --checkpoint path/to/model.ckpt --stock INTC
+'''
+import argparse
+import numpy as np
+import torch
+import constants as cst
+from inference.multi_ticker import MultiTickerEngine
+from inference.replay import read_lobster_day, batch_preprocess, batch_probabilities, replay_day
+from inference.scoring import split_input
+from utils.utils_data import load_normalization_stats
+from utils.utils_model import pick_model, load_model
+from utils.utils_benchmark import default_model_args, latency_summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", required=True)
+    parser.add_argument("--orderbook", required=True)
+    parser.add_argument("--checkpoint", default="", help="replayed instead of a randomly initialized model")
+    parser.add_argument("--model", default=cst.ModelType.TLOB.value)
+    parser.add_argument("--stock", default="", help="stock of the normalization statistics")
+    parser.add_argument("--sampling_type", default="quantity")
+    parser.add_argument("--sampling_time", default="")
+    parser.add_argument("--sampling_quantity", type=int, default=500)
+    parser.add_argument("--events", type=int, default=0, help="replays only the first events of the day if set")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    if args.checkpoint != "":
+        model, hparams = load_model(args.checkpoint)
+        model_type, seq_size, num_features = hparams["model_type"], hparams["seq_size"], hparams["num_features"]
+    else:
+        torch.manual_seed(0)
+        model_args = default_model_args(args.model, cst.Dataset.LOBSTER.value)
+        model = pick_model(**model_args).eval()
+        model_type, seq_size, num_features = args.model, model_args["seq_size"], model_args["num_features"]
+    sampling = dict(sampling_type=args.sampling_type, sampling_time=args.sampling_time, sampling_quantity=args.sampling_quantity)
+
+    messages, orderbooks = read_lobster_day(args.messages, args.orderbook)
+    if args.events > 0:
+        messages, orderbooks = messages.iloc[:args.events], orderbooks.iloc[:args.events]
+    stats = load_normalization_stats(args.stock) if args.stock != "" else None
+    batch_rows, stats = batch_preprocess(messages, orderbooks, stats, **sampling)
+    latencies, sampled, events, outputs = replay_day(model, model_type, seq_size, num_features, stats, messages, orderbooks, **sampling)
+
+    print(f"{model_type}, {len(messages)} events, {sampled.sum()} sampled, {outputs.shape[0]} predictions")
+    if events.shape[0] != batch_rows.shape[0]:
+        print(f"PARITY FAILED: {events.shape[0]} streamed rows against {batch_rows.shape[0]} batch rows")
+    else:
+        streamed_rows = MultiTickerEngine(model, model_type, 1, seq_size, num_features, [stats]).normalize(torch.zeros(len(events), dtype=torch.long), torch.from_numpy(events))
+        batch_input = torch.from_numpy(np.concatenate(split_input(batch_rows, cst.Dataset.LOBSTER.value, num_features), axis=1)).float()
+        print(f"max difference of the model rows: {(streamed_rows - batch_input).abs().max().item() if len(events) else 0.0:.2e}")
+        if outputs.shape[0] > 0:
+            batch_probs = batch_probabilities(model, model_type, seq_size, num_features, batch_rows)
+            print(f"max difference of the probabilities: {(outputs - batch_probs).abs().max().item():.2e}")
+
+    print(f"{'events':<18}{'count':>8}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'mean us':>10}")
+    for name, mask in [("all", np.ones_like(sampled)), ("filtered out", ~sampled), ("sampled", sampled)]:
+        if mask.sum() == 0:
+            continue
+        summary = latency_summary(latencies[mask])
+        print(f"{name:<18}{mask.sum():>8}{summary['p50_ms'] * 1000:>10.1f}{summary['p90_ms'] * 1000:>10.1f}{summary['p99_ms'] * 1000:>10.1f}{summary['mean_ms'] * 1000:>10.1f}")
+    print(f"replay throughput: {len(latencies) / latencies.sum():.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
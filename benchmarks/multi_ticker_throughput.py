@@ -0,0 +1,71 @@
+''' events per second of one model over many tickers: a separate window and forward call for each ticker against the
+MultiTickerEngine, which runs one batched forward per tick over the tickers that received an event. On every tick a
+random share of the tickers receives an event. The max difference of the probabilities of the two is also printed.
+
+usage: python -m benchmarks.multi_ticker_throughput --model MLPLOB --tickers 200 --ticks 50
+'''
+import argparse
+import time
+from collections import deque
+import torch
+import constants as cst
+from inference.multi_ticker import MultiTickerEngine
+from utils.utils_model import pick_model, probabilities
+from utils.utils_benchmark import default_model_args, random_input
+
+
+def per_ticker_loop(model, model_type, seq_size, events, active):
+    ''' one deque and one forward for each ticker, returns the seconds and the probabilities of the last tick '''
+    windows = [deque(maxlen=seq_size) for _ in range(events.shape[1])]
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for tick in range(events.shape[0]):
+            last = {}
+            for ticker in active[tick].tolist():
+                windows[ticker].append(events[tick, ticker])
+                if len(windows[ticker]) == seq_size:
+                    last[ticker] = probabilities(model_type, model(torch.stack(list(windows[ticker]))[None]))[0]
+    return time.perf_counter() - start, last
+
+
+def engine_loop(model, model_type, seq_size, events, active):
+    engine = MultiTickerEngine(model, model_type, events.shape[1], seq_size, events.shape[2])
+    start = time.perf_counter()
+    for tick in range(events.shape[0]):
+        ready, probs = engine.push(active[tick], events[tick, active[tick]])
+    last = dict(zip(ready.tolist(), probs)) if probs is not None else {}
+    return time.perf_counter() - start, last
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=cst.ModelType.MLPLOB.value)
+    parser.add_argument("--dataset", default=cst.Dataset.LOBSTER.value)
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=50, help="ticks after the windows are full")
+    parser.add_argument("--active", type=float, default=0.5, help="share of the tickers with an event on each tick")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model_args = default_model_args(args.model, args.dataset)
+    model = pick_model(**model_args).eval()
+    seq_size = model_args["seq_size"]
+    num_ticks = seq_size + args.ticks
+    events = random_input(num_ticks, args.tickers, model_args["num_features"], args.dataset)
+    # every ticker receives the first seq_size events, so that all the windows are full for the timed ticks
+    active = [torch.arange(args.tickers) if tick < seq_size else torch.nonzero(torch.rand(args.tickers) < args.active).flatten() for tick in range(num_ticks)]
+    num_events = sum(len(a) for a in active)
+
+    loop_seconds, loop_last = per_ticker_loop(model, args.model, seq_size, events, active)
+    engine_seconds, engine_last = engine_loop(model, args.model, seq_size, events, active)
+    max_diff = max([(loop_last[ticker] - probs).abs().max().item() for ticker, probs in engine_last.items()] + [0.0])
+    print(f"{args.model}, {args.tickers} tickers, {num_events} events")
+    print(f"{'runner':<12}{'events/s':>12}")
+    print(f"{'per ticker':<12}{num_events / loop_seconds:>12.0f}")
+    print(f"{'engine':<12}{num_events / engine_seconds:>12.0f}")
+    print(f"max difference of the probabilities of the last tick: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
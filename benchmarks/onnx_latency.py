@@ -0,0 +1,55 @@
+''' CPU latency of eager PyTorch against ONNX Runtime for the same model.
+
+usage: python -m benchmarks.onnx_latency --checkpoint path/to/model.ckpt
+       python -m benchmarks.onnx_latency --model_type TLOB --dataset_type FI_2010
+'''
+import argparse
+import os
+import tempfile
+import torch
+import constants as cst
+from inference.onnx_backend import LogitsOnly, OnnxBackend, export_onnx, max_abs_difference
+from utils.utils_model import pick_model, load_model
+from utils.utils_benchmark import default_model_args, random_input, time_calls, latency_summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default="")
+    parser.add_argument("--model_type", default=cst.ModelType.TLOB.value)
+    parser.add_argument("--dataset_type", default=cst.Dataset.FI_2010.value)
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 64])
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    if args.checkpoint != "":
+        model, hparams = load_model(args.checkpoint)
+        seq_size, num_features, dataset_type = hparams["seq_size"], hparams["num_features"], hparams["dataset_type"]
+    else:
+        model_args = default_model_args(args.model_type, args.dataset_type)
+        model = pick_model(**model_args).eval()
+        seq_size, num_features, dataset_type = model_args["seq_size"], model_args["num_features"], args.dataset_type
+    eager = LogitsOnly(model).eval()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = export_onnx(model, os.path.join(tmp_dir, "model.onnx"), seq_size, num_features)
+        backend = OnnxBackend(onnx_path, num_threads=args.threads)
+        print(f"{'backend':<14}{'batch':>6}{'p50 ms':>10}{'p99 ms':>10}{'samples/s':>12}")
+        for batch_size in args.batch_sizes:
+            x = random_input(batch_size, seq_size, num_features, dataset_type)
+            x_numpy = x.numpy()
+            print(f"max abs difference at batch {batch_size}: {max_abs_difference(model, backend, x):.2e}")
+
+            def eager_call():
+                with torch.inference_mode():
+                    eager(x)
+
+            for name, fn in [("pytorch", eager_call), ("onnxruntime", lambda: backend(x_numpy))]:
+                summary = latency_summary(time_calls(fn, args.iters), batch_size)
+                print(f"{name:<14}{batch_size:>6}{summary['p50_ms']:>10.3f}{summary['p99_ms']:>10.3f}{summary['throughput']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+''' local load test of the inference server: the server and the clients run in the same event loop, each client sends
+its windows one after the other on its own connection. The latency percentiles, the batch sizes and the throughput are
+compared with the micro-batching disabled (max batch size 1).
+
+usage: python -m benchmarks.serve_load --model TLOB --clients 32 --requests 20
+'''
+import argparse
+import asyncio
+import time
+import torch
+import constants as cst
+from inference.server import InferenceServer, request_json
+from utils.utils_model import pick_model, load_model
+from utils.utils_benchmark import default_model_args, random_input
+
+
+async def run_load(model, model_type, seq_size, num_features, max_batch_size, max_wait_ms, clients, requests, port):
+    server = InferenceServer(model, model_type, seq_size, num_features, max_batch_size, max_wait_ms)
+    await server.start(port=port)
+    windows = random_input(clients, seq_size, num_features).tolist()
+
+    async def client(i):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for j in range(requests):
+            response = await request_json(reader, writer, {"id": j, "window": windows[i]})
+            if "error" in response:
+                raise RuntimeError(response["error"])
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(clients)])
+    seconds = time.perf_counter() - start
+    summary = server.stats.summary()
+    await server.stop()
+    summary["throughput"] = clients * requests / seconds
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=cst.ModelType.TLOB.value)
+    parser.add_argument("--checkpoint", default="", help="served instead of a randomly initialized model")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="requests of each client")
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--max_wait_ms", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+    if args.checkpoint != "":
+        model, hparams = load_model(args.checkpoint)
+        model_type, seq_size, num_features = hparams["model_type"], hparams["seq_size"], hparams["num_features"]
+    else:
+        model_args = default_model_args(args.model)
+        model = pick_model(**model_args).eval()
+        model_type, seq_size, num_features = args.model, model_args["seq_size"], model_args["num_features"]
+
+    print(f"{model_type}, {args.clients} clients, {args.requests} requests each")
+    print(f"{'max batch':<11}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}  batch sizes")
+    for max_batch_size in [1, args.max_batch_size]:
+        summary = asyncio.run(run_load(model, model_type, seq_size, num_features, max_batch_size, args.max_wait_ms, args.clients, args.requests, args.port))
+        print(f"{max_batch_size:<11}{summary['p50_ms']:>9.2f}{summary['p99_ms']:>9.2f}{summary['throughput']:>9.1f}  {summary['batch_sizes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+''' per-event latency of the streaming runners against the batch forward on the full window.
+
+usage: python -m benchmarks.streaming_latency --model DEEPLOB --dataset_type LOBSTER --events 2000
+'''
+import argparse
+import time
+import numpy as np
+import torch
+import constants as cst
+from inference.streaming import MLPLOBStream, DeepLOBStream, compare_with_batch_forward
+from utils.utils_model import pick_model, load_model
+from utils.utils_benchmark import default_model_args, random_input, latency_summary
+
+
+def per_event_latency(fn, events, seq_size):
+    times = []
+    for i in range(events.shape[0]):
+        start = time.perf_counter()
+        fn(i)
+        if i >= seq_size - 1:
+            times.append(time.perf_counter() - start)
+    return latency_summary(np.array(times))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=cst.ModelType.MLPLOB.value, choices=[cst.ModelType.MLPLOB.value, cst.ModelType.DEEPLOB.value])
+    parser.add_argument("--checkpoint", default="")
+    parser.add_argument("--dataset_type", default=cst.Dataset.FI_2010.value)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    if args.checkpoint != "":
+        model, hparams = load_model(args.checkpoint)
+        model_type, seq_size, num_features, dataset_type = hparams["model_type"], hparams["seq_size"], hparams["num_features"], hparams["dataset_type"]
+    else:
+        model_type = args.model
+        model_args = default_model_args(model_type, args.dataset_type)
+        model = pick_model(**model_args).eval()
+        seq_size, num_features, dataset_type = model_args["seq_size"], model_args["num_features"], args.dataset_type
+    events = random_input(1, args.events + seq_size - 1, num_features, dataset_type)[0]
+    if model_type == cst.ModelType.MLPLOB.value:
+        streams = {"streaming": MLPLOBStream(model)}
+    elif model_type == cst.ModelType.DEEPLOB.value:
+        streams = {"stream exact": DeepLOBStream(model, seq_size, "exact"), "stream approx": DeepLOBStream(model, seq_size, "approximate")}
+    else:
+        raise ValueError("Streaming is available only for MLPLOB and DEEPLOB")
+    for name, stream in streams.items():
+        comparison = compare_with_batch_forward(stream, events)
+        print(f"{name}: max absolute difference with the batch forward {comparison['max_abs_diff']:.2e}, same prediction on {comparison['agreement']:.2%} of the events")
+
+    def batch_forward(i):
+        if i >= seq_size - 1:
+            with torch.inference_mode():
+                model(events[i - seq_size + 1:i + 1].unsqueeze(0))
+
+    results = {"batch forward": per_event_latency(batch_forward, events, seq_size)}
+    for name, stream in streams.items():
+        stream.reset()
+        results[name] = per_event_latency(lambda i: stream.push(events[i]), events, seq_size)
+    print(f"{'runner':<16}{'p50 ms':>10}{'p99 ms':>10}{'events/s':>12}")
+    for name, summary in results.items():
+        print(f"{name:<16}{summary['p50_ms']:>10.3f}{summary['p99_ms']:>10.3f}{summary['throughput']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ class Model:
     hyperparameters_fixed: dict = MISSING
     hyperparameters_sweep: dict = MISSING
     type: ModelType = MISSING
+    compile: bool = False
     
 
 @dataclass
@@ -21,7 +22,7 @@ class MLPLOB(Model):
     
 @dataclass
 class TLOB(Model):
-    hyperparameters_fixed: dict = field(default_factory=lambda: {"num_layers": 4, "hidden_dim": 144, "num_heads": 1, "is_sin_emb": True, "lr": 0.0001, "seq_size": 128, "all_features": True})
+    hyperparameters_fixed: dict = field(default_factory=lambda: {"num_layers": 4, "hidden_dim": 144, "num_heads": 1, "is_sin_emb": True, "lr": 0.0001, "seq_size": 128, "all_features": True, "early_exit": False})
     hyperparameters_sweep: dict = field(default_factory=lambda: {"num_layers": [4, 6], "hidden_dim": [128, 256], "num_heads": [1], "is_sin_emb": [True], "lr": [0.0001], "seq_size": [128]})
     type: ModelType = ModelType.TLOB
     
@@ -53,6 +54,7 @@ class Experiment:
     testing_stocks: list = field(default_factory=lambda: ["INTC"])
     seed: int = 42
     horizon: int = 5
+    horizons: list = field(default_factory=list)    #horizons of the multi-head MLPLOB and TLOB trained in one run, empty trains only horizon
     max_epochs: int = 10
     if dataset_type == Dataset.FI_2010:
         batch_size: int = 32
@@ -60,6 +62,46 @@ class Experiment:
         batch_size: int = 128 
     filename_ckpt: str = "model.ckpt"
     optimizer: str = "Adam"
+    precision: str = "32"    #32 or bf16
+    ema_decay: float = 0.999
+    ema_update_every: int = 1
+    num_processes: int = 1    #processes per node of the data parallel training with gloo
+    num_nodes: int = 1
+    checkpoint_weights_only: bool = True    #weights only checkpoints written in background, False saves the full trainer state
+    checkpoint_keep_best: int = 1
+    sweep_method: str = "grid"    #grid or random, used by the local sweep when is_sweep is True and is_wandb is False
+    sweep_trials: int = 10    #number of trials of the random search
+    sweep_processes: int = 0    #0 runs one process per trial up to the number of cores
+    sweep_early_terminate: bool = True    #successive halving of the trials of the local sweep
+    sweep_min_iter: int = 3    #epochs of the first rung of the successive halving, also used by the wandb hyperband
+    sweep_eta: float = 1.5
+    quantization_mode: str = "dynamic"    #dynamic or static
+    calibration_samples: int = 2048
+    scoring_input: str = ""    #preprocessed .npy split scored by the SCORING experiment type
+    scoring_output: str = ""    #.npy file of the probabilities, next to the input by default
+    scoring_batch_size: int = 4096
+    serve_host: str = "127.0.0.1"
+    serve_port: int = 8765
+    serve_socket: str = ""    #path of a Unix socket, used instead of the port when set
+    serve_max_batch_size: int = 64
+    serve_max_wait_ms: float = 2.0    #latency budget of a micro-batch from its first request
+    evaluation_checkpoints: list = field(default_factory=list)    #checkpoints evaluated in one pass by the MULTI_EVALUATION experiment type
+    evaluation_batch_size: int = 1024
+    num_threads: int = 0    #intra-op threads of torch, 0 uses the autotuned value or the torch default
+    num_interop_threads: int = 0    #inter-op threads of torch, 0 uses the autotuned value or the torch default
+    num_workers: int = -1    #DataLoader workers, -1 uses the autotuned value or 4
+    use_autotune: bool = True    #applies the settings saved by the AUTOTUNE experiment type for the model config
+    autotune_threads: list = field(default_factory=list)    #intra-op threads swept by AUTOTUNE, empty sweeps the powers of 2 up to the cores
+    autotune_interop_threads: list = field(default_factory=lambda: [1])
+    autotune_workers: list = field(default_factory=lambda: [0, 2, 4])    #DataLoader workers swept for the training
+    autotune_batch_sizes: list = field(default_factory=lambda: [32, 128, 512])
+    autotune_steps: int = 20    #timed batches of each setting
+    autotune_memory_mb: float = 0    #peak memory budget of a setting, 0 is no budget
+    teacher_checkpoint: str = ""    #checkpoint of a teacher, a TRAINING run with it distills the teacher into the model of the config
+    distillation_alpha: float = 0.5    #weight of the loss on the soft targets of the teacher, the labels have 1 - alpha
+    distillation_temperature: float = 2.0
+    exit_threshold: float = 0.0    #confidence of the early exit of the TLOB checkpoints with exit heads when serving or scoring, 0 runs all the layers
+    exit_thresholds: list = field(default_factory=lambda: [0.5, 0.6, 0.7, 0.8, 0.9, 0.95])    #thresholds compared by the EARLY_EXIT experiment type
     
 defaults = [Model, Experiment]
 
@@ -48,6 +48,7 @@ INTC_EVENT_STD_DEPTH = 2.333747222206966
 
 
 LOBSTER_HORIZONS = [10, 20, 50, 100]
+FI_2010_HORIZONS = [1, 2, 3, 5, 10]
 PRECISION = 32
 N_LOB_LEVELS = 10
 LEN_LEVEL = 4
@@ -0,0 +1,68 @@
+import time
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+from preprocessing.dataset import load_test_sets
+from utils.utils_model import load_model
+from utils.utils_metrics import MetricAccumulator
+
+
+def evaluate_threshold(model, loader, threshold, latency_windows):
+    ''' returns the metrics of the early exit at threshold on the windows of loader, as classification_metrics, the mean
+    number of pairs of layers run, the mean latency per batch and the latencies of each of latency_windows alone '''
+    metrics = MetricAccumulator()
+    num_layers_run, batch_times = [], []
+    with torch.inference_mode():
+        for x, y in loader:
+            start = time.perf_counter()
+            output, layers = model.early_exit(x, threshold)
+            batch_times.append(time.perf_counter() - start)
+            loss = nn.functional.cross_entropy(output.transpose(1, 2) if output.dim() == 3 else output, y)
+            metrics.update(loss, y.flatten(), output.argmax(dim=-1).flatten())
+            num_layers_run.append(layers)
+        window_times = np.empty(len(latency_windows))
+        for i, window in enumerate(latency_windows):
+            start = time.perf_counter()
+            model.early_exit(window, threshold)
+            window_times[i] = time.perf_counter() - start
+    return metrics.compute(), torch.cat(num_layers_run).float().mean().item(), float(np.mean(batch_times) * 1000), window_times * 1000
+
+
+def early_exit_report(config):
+    ''' compares the early exit of the TLOB of experiment.checkpoint_reference at each of experiment.exit_thresholds
+    with the run of all the layers, on the test sets: F1 score, mean number of pairs of layers run and latency '''
+    model, hparams = load_model(config.experiment.checkpoint_reference)
+    if not getattr(model, "exit_heads", None):
+        raise ValueError("Exit heads not found in " + config.experiment.checkpoint_reference)
+    dataset_type = config.experiment.dataset_type.value
+    seq_size = hparams["seq_size"]
+    horizon = list(hparams.get("horizons") or []) or hparams["horizon"]
+    all_features = config.model.hyperparameters_fixed["all_features"]
+    batch_size = config.experiment.batch_size * 4
+    test_sets = load_test_sets(dataset_type, seq_size, horizon, all_features, config.experiment.testing_stocks)
+    # an infinite threshold is never reached, every window runs all the layers
+    thresholds = [float("inf")] + sorted(config.experiment.exit_thresholds)
+    results = {}
+    for name, test_set in test_sets.items():
+        loader = DataLoader(test_set, batch_size=batch_size, shuffle=False)
+        # the batch-1 latency depends on where each window exits, it is measured on windows spread over the test set
+        indices = torch.linspace(0, len(test_set) - 1, min(500, len(test_set))).long().tolist()
+        latency_windows = [test_set[i][0].unsqueeze(0) for i in indices]
+        print(f"Test set {name}, {model.num_layers} pairs of layers")
+        print(f"{'threshold':<11}{'f1':>8}{'accuracy':>10}{'layers':>8}{'ms/batch':>10}{'p50 ms':>9}{'p99 ms':>9}")
+        results[name] = {}
+        for threshold in thresholds:
+            metrics, mean_layers, batch_latency, window_latencies = evaluate_threshold(model, loader, threshold, latency_windows)
+            label = "all" if threshold == float("inf") else f"{threshold:.2f}"
+            results[name][label] = {
+                "macro_f1": metrics["macro_f1"],
+                "accuracy": metrics["accuracy"],
+                "mean_layers": mean_layers,
+                "ms_per_batch": batch_latency,
+                "p50_ms": float(np.percentile(window_latencies, 50)),
+                "p99_ms": float(np.percentile(window_latencies, 99)),
+            }
+            r = results[name][label]
+            print(f"{label:<11}{r['macro_f1']:>8.4f}{r['accuracy']:>10.4f}{r['mean_layers']:>8.2f}{r['ms_per_batch']:>10.3f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}")
+    return results
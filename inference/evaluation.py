@@ -0,0 +1,119 @@
+import os
+import time
+import torch
+from torch import nn
+import constants as cst
+from preprocessing.dataset import load_test_sets
+from utils.utils_model import load_model, probabilities
+from utils.utils_metrics import MetricAccumulator
+
+
+def checkpoint_horizons(hparams):
+    ''' horizons of the heads of a checkpoint, in the order of its outputs '''
+    return list(hparams.get("horizons") or []) or [hparams["horizon"]]
+
+
+def load_test_rows(dataset_type, horizons, stocks):
+    ''' returns, by the name of each test set, the rows of the test split with all the features and the labels of each
+    horizon by the last row of their windows, -1 where a row has no label. The label of a window depends only on its
+    last row, so the split is loaded once for the models of any seq_size '''
+    # the smallest seq_size of the loaders, the first label is the one of the window ending at row seq_size - 1
+    seq_size = cst.LEN_SMOOTH if dataset_type == cst.Dataset.LOBSTER.value else 1
+    test_rows = {}
+    for name, test_set in load_test_sets(dataset_type, seq_size, list(horizons), True, stocks).items():
+        num_labels = min(test_set.y.shape[0], test_set.x.shape[0] - seq_size + 1)
+        labels = torch.full((test_set.x.shape[0], len(horizons)), -1, dtype=torch.long)
+        labels[seq_size - 1:seq_size - 1 + num_labels] = test_set.y[:num_labels]
+        test_rows[name] = (test_set.x, {horizon: labels[:, i] for i, horizon in enumerate(horizons)})
+    return test_rows
+
+
+class MultiModelEvaluator:
+    ''' evaluates many models in one pass over the test windows. The windows are built once for the largest seq_size
+    and every batch goes through all the models, each taking its last seq_size events and its first num_features
+    features. The models are compared on the same windows, those ending at the rows where every model has a full
+    window and every horizon a label, and the models of the same horizon are ensembled by averaging their class
+    probabilities '''
+    def __init__(self, models, hparams, names):
+        datasets = {h["dataset_type"] for h in hparams}
+        if len(datasets) > 1:
+            raise ValueError("The checkpoints must be trained on the same dataset, found " + ", ".join(sorted(datasets)))
+        self.models = [model.eval() for model in models]
+        self.hparams = hparams
+        self.names = names
+        self.dataset_type = datasets.pop()
+        self.max_seq_size = max(h["seq_size"] for h in hparams)
+        self.horizons = sorted({horizon for h in hparams for horizon in checkpoint_horizons(h)})
+
+    @classmethod
+    def from_checkpoints(cls, checkpoint_paths):
+        loaded = [load_model(path) for path in checkpoint_paths]
+        names = [f"{i}_{hparams['model_type']}" for i, (_, hparams) in enumerate(loaded)]
+        return cls([model for model, _ in loaded], [hparams for _, hparams in loaded], names)
+
+    @torch.inference_mode()
+    def evaluate(self, input, labels, batch_size=1024):
+        ''' input and labels as returned by load_test_rows. Returns the metrics of every model and horizon and of the
+        ensemble of each horizon with more than one model, as classification_metrics with the mean batch loss, the
+        cross entropy of the outputs for the models and of the averaged probabilities for the ensembles '''
+        valid = torch.stack([labels[horizon] >= 0 for horizon in self.horizons], dim=1).all(dim=1)
+        valid[:self.max_seq_size - 1] = False
+        end_rows = torch.nonzero(valid).flatten()
+        if end_rows.numel() == 0:
+            raise ValueError("No window of the test split has a label for every horizon")
+        first, stop = end_rows[0].item(), end_rows[-1].item() + 1
+        model_metrics = {(name, horizon): MetricAccumulator() for name, h in zip(self.names, self.hparams) for horizon in checkpoint_horizons(h)}
+        members = {horizon: [key for key in model_metrics if key[1] == horizon] for horizon in self.horizons}
+        ensemble_metrics = {horizon: MetricAccumulator() for horizon, keys in members.items() if len(keys) > 1}
+
+        start = time.perf_counter()
+        for batch_first in range(first, stop, batch_size):
+            batch_stop = min(batch_first + batch_size, stop)
+            # the windows ending at the rows of the batch, as views on the rows
+            windows = input[batch_first - self.max_seq_size + 1:batch_stop].unfold(0, self.max_seq_size, 1).transpose(1, 2)
+            mask = valid[batch_first:batch_stop]
+            targets = {horizon: labels[horizon][batch_first:batch_stop] for horizon in self.horizons}
+            if not mask.all():
+                windows = windows[mask]
+                targets = {horizon: target[mask] for horizon, target in targets.items()}
+            probs = {}
+            for model, name, hparams in zip(self.models, self.names, self.hparams):
+                output = model(windows[:, -hparams["seq_size"]:, :hparams["num_features"]])
+                output = (output[0] if isinstance(output, tuple) else output).float()
+                model_probs = probabilities(hparams["model_type"], output)
+                for i, horizon in enumerate(checkpoint_horizons(hparams)):
+                    head = output[:, i] if output.dim() == 3 else output
+                    loss = nn.functional.cross_entropy(head, targets[horizon])
+                    model_metrics[(name, horizon)].update(loss, targets[horizon], head.argmax(dim=-1))
+                    probs[(name, horizon)] = model_probs[:, i] if model_probs.dim() == 3 else model_probs
+            for horizon, metrics in ensemble_metrics.items():
+                mean_probs = torch.stack([probs[key] for key in members[horizon]]).mean(dim=0)
+                loss = nn.functional.nll_loss(torch.log(mean_probs.clamp_min(1e-12)), targets[horizon])
+                metrics.update(loss, targets[horizon], mean_probs.argmax(dim=-1))
+        seconds = time.perf_counter() - start
+        print(f"Evaluated {len(self.models)} models on {end_rows.numel()} windows in {seconds:.2f} s")
+
+        results = {f"{name} h{horizon}": metrics.compute() for (name, horizon), metrics in model_metrics.items()}
+        results.update({f"ensemble h{horizon}": metrics.compute() for horizon, metrics in ensemble_metrics.items()})
+        return results
+
+
+def print_results(results):
+    print(f"{'model':<22}{'loss':>9}{'accuracy':>10}{'f1':>9}{'precision':>11}{'recall':>9}")
+    for name, result in results.items():
+        print(f"{name:<22}{result['loss']:>9.4f}{result['accuracy']:>10.4f}{result['macro_f1']:>9.4f}{result['macro_precision']:>11.4f}{result['macro_recall']:>9.4f}")
+
+
+def evaluate_checkpoints(config):
+    ''' evaluates the checkpoints of experiment.evaluation_checkpoints on the test split of FI-2010 or of each testing
+    stock, with one pass over the windows for all of them '''
+    evaluator = MultiModelEvaluator.from_checkpoints(list(config.experiment.evaluation_checkpoints))
+    for name, path in zip(evaluator.names, config.experiment.evaluation_checkpoints):
+        print(f"{name}: {os.path.basename(path)}")
+    all_results = {}
+    for name, (input, labels) in load_test_rows(evaluator.dataset_type, evaluator.horizons, config.experiment.testing_stocks).items():
+        print(f"Test set {name}")
+        results = evaluator.evaluate(input, labels, config.experiment.evaluation_batch_size)
+        print_results(results)
+        all_results[name] = results
+    return all_results
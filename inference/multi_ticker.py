@@ -0,0 +1,98 @@
+import torch
+import constants as cst
+from utils.utils_data import load_normalization_stats
+from utils.utils_model import load_model, probabilities
+
+# columns of the raw events, as the rows of the LOBSTER splits before the normalization: the order
+# (time, event_type, size, price, direction, depth) followed by the 10 levels of the book (sell, vsell, buy, vbuy)
+LEN_RAW_EVENT = cst.LEN_ORDER + cst.N_LOB_LEVELS * cst.LEN_LEVEL
+# order type of the LOBSTER event types kept by the preprocessing, 1 limit order, 3 cancellation, 4 execution
+EVENT_TYPES = torch.tensor([-1, 0, -1, 1, 2])
+
+
+def event_stats(stats):
+    ''' returns the mean and the std of each column of a raw event from the statistics of load_normalization_stats,
+    the prices of LOBSTER are in units of 1/10000 dollars and the statistics in dollars '''
+    mean = torch.zeros(LEN_RAW_EVENT, dtype=torch.float64)
+    std = torch.ones(LEN_RAW_EVENT, dtype=torch.float64)
+    for column, name, scale in [(0, "time", 1), (2, "size", 1), (3, "price", 10000), (5, "depth", 1)]:
+        mean[column] = stats[f"message_mean_{name}"] * scale
+        std[column] = stats[f"message_std_{name}"] * scale
+    mean[cst.LEN_ORDER::2] = stats["orderbook_mean_price"] * 10000
+    std[cst.LEN_ORDER::2] = stats["orderbook_std_price"] * 10000
+    mean[cst.LEN_ORDER + 1::2] = stats["orderbook_mean_size"]
+    std[cst.LEN_ORDER + 1::2] = stats["orderbook_std_size"]
+    return mean, std
+
+
+class MultiTickerEngine:
+    ''' rolling-window inference of one model over many tickers. The windows of all the tickers are kept in a
+    preallocated (tickers, seq_size, features) ring buffer, and each push writes the new events of some tickers and runs
+    a single batched forward over the tickers whose windows changed. With stats, one dict of load_normalization_stats
+    for each ticker, the events are raw LOBSTER rows normalized with the statistics of their ticker, without stats they
+    are rows of the model input '''
+    def __init__(self, model, model_type, num_tickers, seq_size, num_features, stats=None):
+        self.model = model.eval()
+        self.model_type = model_type
+        self.num_tickers = num_tickers
+        self.seq_size = seq_size
+        self.num_features = num_features
+        self.buffer = torch.zeros(num_tickers, seq_size, num_features)
+        # position of the next event of each ticker, which is also the oldest event of a full window
+        self.head = torch.zeros(num_tickers, dtype=torch.long)
+        self.count = torch.zeros(num_tickers, dtype=torch.long)
+        self.positions = torch.arange(seq_size)
+        self.mean, self.std = None, None
+        if stats is not None:
+            if len(stats) != num_tickers:
+                raise ValueError("stats must have the statistics of every ticker")
+            columns = [event_stats(ticker_stats) for ticker_stats in stats]
+            self.mean = torch.stack([mean for mean, _ in columns])
+            self.std = torch.stack([std for _, std in columns])
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint_path, tickers, stats=None):
+        ''' the statistics of the LOBSTER tickers are loaded from the preprocessed data when not given '''
+        model, hparams = load_model(checkpoint_path)
+        if stats is None and hparams["dataset_type"] == cst.Dataset.LOBSTER.value:
+            stats = [load_normalization_stats(ticker) for ticker in tickers]
+        return cls(model, hparams["model_type"], len(tickers), hparams["seq_size"], hparams["num_features"], stats)
+
+    def normalize(self, ticker_ids, events):
+        ''' returns the model rows of the raw events of ticker_ids, the book first and then the order '''
+        if self.mean is None:
+            return events.float()
+        events = events.double()
+        event_types = events[:, 1].long()
+        order_types = EVENT_TYPES[event_types.clamp(0, len(EVENT_TYPES) - 1)]
+        if (event_types != event_types.clamp(0, len(EVENT_TYPES) - 1)).any() or (order_types < 0).any():
+            raise ValueError("Event type not found, only limit orders, cancellations and executions are supported")
+        z = (events - self.mean[ticker_ids]) / self.std[ticker_ids]
+        z[:, 1] = order_types.double()
+        rows = torch.cat([z[:, cst.LEN_ORDER:], z[:, :cst.LEN_ORDER]], dim=1)
+        return rows[:, :self.num_features].float()
+
+    def reset(self, ticker_ids=None):
+        if ticker_ids is None:
+            ticker_ids = torch.arange(self.num_tickers)
+        self.head[ticker_ids] = 0
+        self.count[ticker_ids] = 0
+
+    @torch.inference_mode()
+    def push(self, ticker_ids, events):
+        ''' adds one event for each of ticker_ids, events of shape (len(ticker_ids), features). Returns the ids of the
+        tickers with a full window and the class probabilities of their windows, computed in one forward '''
+        ticker_ids = torch.as_tensor(ticker_ids, dtype=torch.long)
+        if torch.unique(ticker_ids).numel() != ticker_ids.numel():
+            raise ValueError("A push can have only one event for each ticker")
+        rows = self.normalize(ticker_ids, torch.as_tensor(events))
+        self.buffer[ticker_ids, self.head[ticker_ids]] = rows
+        self.head[ticker_ids] = (self.head[ticker_ids] + 1) % self.seq_size
+        self.count[ticker_ids] = (self.count[ticker_ids] + 1).clamp(max=self.seq_size)
+        ready = ticker_ids[self.count[ticker_ids] == self.seq_size]
+        if ready.numel() == 0:
+            return ready, None
+        # the windows in time order, from the oldest event of each ring
+        indices = (self.head[ready, None] + self.positions) % self.seq_size
+        x = self.buffer[ready[:, None], indices]
+        return ready, probabilities(self.model_type, self.model(x))
@@ -0,0 +1,75 @@
+import numpy as np
+import torch
+from torch import nn
+import onnxruntime as ort
+from utils.utils_model import load_model
+
+
+class LogitsOnly(nn.Module):
+    ''' wraps a model so that it returns only the logits, TLOB returns also the attention maps '''
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        output = self.model(x)
+        if isinstance(output, tuple):
+            return output[0]
+        return output
+
+
+def export_onnx(model, path, seq_size, num_features, opset_version=18):
+    model = LogitsOnly(model).eval()
+    example = torch.randn(2, seq_size, num_features)
+    torch.onnx.export(
+        model,
+        (example,),
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_shapes={"x": {0: torch.export.Dim("batch_size")}},
+        opset_version=opset_version,
+        external_data=False,
+    )
+    return path
+
+
+def export_checkpoint(checkpoint_path, onnx_path=None, atol=1e-4):
+    ''' rebuilds the model of a Lightning checkpoint, exports it to ONNX and checks that ONNX Runtime gives the same logits '''
+    model, hparams = load_model(checkpoint_path)
+    if onnx_path is None:
+        onnx_path = checkpoint_path.rsplit(".ckpt", 1)[0] + ".onnx"
+    export_onnx(model, onnx_path, hparams["seq_size"], hparams["num_features"])
+    print(f"ONNX model saved in {onnx_path}")
+    backend = OnnxBackend(onnx_path)
+    x = torch.randn(8, hparams["seq_size"], hparams["num_features"])
+    if hparams["dataset_type"] == "LOBSTER":
+        x[:, :, 41] = torch.randint(0, 3, (8, hparams["seq_size"])).float()
+    max_diff = max_abs_difference(model, backend, x)
+    print(f"Max absolute difference between PyTorch and ONNX Runtime logits: {max_diff}")
+    if max_diff > atol:
+        raise ValueError(f"ONNX Runtime logits differ from PyTorch ones by {max_diff} > {atol}")
+    return onnx_path
+
+
+class OnnxBackend:
+    ''' CPU inference with ONNX Runtime, it takes and returns numpy arrays '''
+    def __init__(self, onnx_path, num_threads=None):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        if isinstance(x, torch.Tensor):
+            x = x.numpy()
+        return self.session.run(None, {self.input_name: x.astype(np.float32, copy=False)})[0]
+
+
+def max_abs_difference(model, backend, x):
+    model = LogitsOnly(model).eval()
+    with torch.inference_mode():
+        expected = model(x).numpy()
+    return float(np.abs(expected - backend(x)).max())
@@ -0,0 +1,113 @@
+import copy
+import time
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Subset
+from torch.ao.quantization import QuantWrapper, get_default_qconfig, prepare, convert, quantize_dynamic
+from sklearn.metrics import f1_score
+from preprocessing.dataset import load_split, load_test_sets
+from utils.utils_model import load_model
+from utils.utils_benchmark import logits, time_calls, latency_summary
+
+
+def set_quantized_engine():
+    for engine in ["x86", "fbgemm", "qnnpack"]:
+        if engine in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("No quantized engine is available on this machine")
+
+
+def quantize_dynamic_int8(model):
+    ''' int8 weights and activations quantized on the fly, every nn.Linear outside the attention modules is quantized '''
+    set_quantized_engine()
+    # the output projection of nn.MultiheadAttention is a Linear subclass that quantize_dynamic leaves in float
+    return quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_int8(model, calibration_loader):
+    ''' int8 weights and activations with scales calibrated on calibration_loader, each nn.Linear is wrapped with its own quant/dequant stubs '''
+    engine = set_quantized_engine()
+    model = copy.deepcopy(model).eval()
+    qconfig = get_default_qconfig(engine)
+    wrappers = {}
+    for parent in list(model.modules()):
+        if isinstance(parent, nn.MultiheadAttention):
+            continue
+        for name, child in list(parent.named_children()):
+            if type(child) is nn.Linear:
+                # the same layer can be registered twice, e.g. MLPLOB.first_layer is also MLPLOB.layers[0]
+                if child not in wrappers:
+                    wrappers[child] = QuantWrapper(child)
+                    wrappers[child].qconfig = qconfig
+                setattr(parent, name, wrappers[child])
+    prepare(model, inplace=True)
+    with torch.inference_mode():
+        for x, _ in calibration_loader:
+            model(x)
+    convert(model, inplace=True)
+    return model
+
+
+def evaluate(model, loader):
+    ''' returns the macro f1 score and the mean latency per batch in ms '''
+    targets, predictions, times = [], [], []
+    with torch.inference_mode():
+        for x, y in loader:
+            start = time.perf_counter()
+            output = logits(model(x))
+            times.append(time.perf_counter() - start)
+            # the multi-horizon outputs are (batch, horizons, 3), their f1 score is pooled over the horizons
+            targets.append(y.flatten().numpy())
+            predictions.append(output.argmax(dim=-1).flatten().numpy())
+    f1 = f1_score(np.concatenate(targets), np.concatenate(predictions), average="macro")
+    return f1, float(np.mean(times) * 1000)
+
+
+def single_event_latency(model, x, iters=200):
+    ''' p50 latency in ms of a batch of one window '''
+    def predict():
+        with torch.inference_mode():
+            model(x)
+    return latency_summary(time_calls(predict, iters))["p50_ms"]
+
+
+def quantize_checkpoint(config):
+    ''' quantizes the model of experiment.checkpoint_reference, calibrating on a slice of the validation split,
+    and reports the f1 score and latency against the float model on the test sets '''
+    model, hparams = load_model(config.experiment.checkpoint_reference)
+    dataset_type = config.experiment.dataset_type.value
+    seq_size = hparams["seq_size"]
+    horizon = list(hparams.get("horizons") or []) or hparams["horizon"]
+    all_features = config.model.hyperparameters_fixed["all_features"]
+    batch_size = config.experiment.batch_size * 4
+    mode = config.experiment.quantization_mode
+    if mode == "static":
+        val_set = load_split(dataset_type, "val", seq_size, horizon, all_features, config.experiment.training_stocks[0])
+        # the calibration windows are spread over the whole validation split
+        num_samples = min(config.experiment.calibration_samples, len(val_set))
+        indices = torch.linspace(0, len(val_set) - 1, num_samples).long().tolist()
+        calibration_loader = DataLoader(Subset(val_set, indices), batch_size=batch_size, shuffle=False)
+        quantized = quantize_static_int8(model, calibration_loader)
+    elif mode == "dynamic":
+        quantized = quantize_dynamic_int8(model)
+    else:
+        raise ValueError("Quantization mode not found")
+    path = config.experiment.checkpoint_reference.rsplit(".ckpt", 1)[0] + f"_int8_{mode}.pt"
+    torch.save(quantized, path)
+    print(f"Quantized model saved in {path}")
+
+    test_sets = load_test_sets(dataset_type, seq_size, horizon, all_features, config.experiment.testing_stocks)
+    print(f"{'test set':<10}{'model':<8}{'f1':>8}{'ms/batch':>10}{'ms/event':>10}")
+    for name, test_set in test_sets.items():
+        loader = DataLoader(test_set, batch_size=batch_size, shuffle=False)
+        x = test_set[0][0].unsqueeze(0)
+        results = {}
+        for model_name, m in [("float", model), ("int8", quantized)]:
+            f1, batch_latency = evaluate(m, loader)
+            results[model_name] = (f1, batch_latency, single_event_latency(m, x))
+            print(f"{name:<10}{model_name:<8}{f1:>8.4f}{batch_latency:>10.3f}{results[model_name][2]:>10.3f}")
+        deltas = [results["int8"][i] - results["float"][i] for i in range(3)]
+        print(f"{name:<10}{'delta':<8}{deltas[0]:>+8.4f}{deltas[1]:>+10.3f}{deltas[2]:>+10.3f}")
+    return quantized
@@ -0,0 +1,132 @@
+import time
+import numpy as np
+import pandas as pd
+import torch
+import constants as cst
+from inference.multi_ticker import MultiTickerEngine, LEN_RAW_EVENT
+from inference.scoring import split_input
+from preprocessing.lobster import COLUMNS_NAMES
+from utils.utils_data import preprocess_data, z_score_orderbook, normalize_messages
+from utils.utils_model import probabilities
+
+# event types dropped by preprocess_data: partial deletions, executions of hidden orders, cross trades and trading halts
+DROPPED_EVENT_TYPES = {2, 5, 6, 7}
+# keys of the statistics of save_normalization_stats, in the order of the arguments of z_score_orderbook and normalize_messages
+ORDERBOOK_STATS = ["orderbook_mean_size", "orderbook_mean_price", "orderbook_std_size", "orderbook_std_price"]
+MESSAGE_STATS = [
+    "message_mean_size", "message_mean_price", "message_std_size", "message_std_price",
+    "message_mean_time", "message_std_time", "message_mean_depth", "message_std_depth",
+]
+
+
+class StreamingPreprocessor:
+    ''' the preprocessing of preprocess_data for one event at a time, in the order of the LOBSTER files of a day. push
+    takes a row of the message file and the row of the orderbook file after the event, and returns the event as a raw
+    row of the split, the order (time difference, event type, size, price, direction, depth) followed by the book, or
+    None if the event is filtered out or not sampled. The first sampled event of the day has no depth and is dropped
+    as in the batch preprocessing '''
+    def __init__(self, sampling_type="quantity", sampling_time="", sampling_quantity=500, n_lob_levels=cst.N_LOB_LEVELS):
+        if sampling_type not in ["quantity", "time"]:
+            raise ValueError("Sampling type not found")
+        self.sampling_type = sampling_type
+        self.sampling_quantity = sampling_quantity
+        self.sampling_ns = pd.Timedelta(sampling_time).value if sampling_type == "time" else None
+        self.num_book_columns = n_lob_levels * cst.LEN_LEVEL
+        self.reset()
+
+    def reset(self):
+        ''' starts a new trading day '''
+        self.cumulative_size = 0
+        self.bucket = None
+        self.previous_time = None
+        self.previous_book = None
+
+    def push(self, message, orderbook):
+        event_time, event_type, _, size, price, direction = message
+        if event_type in DROPPED_EVENT_TYPES:
+            return None
+        if self.sampling_type == "quantity":
+            # the events where the cumulative size crosses a multiple of the quantity, as sampling_quantity
+            self.cumulative_size += size
+            if not self.cumulative_size % self.sampling_quantity < size:
+                return None
+        else:
+            # the first event of each interval, with the time of the start of the interval, as sampling_time
+            bucket = pd.Timestamp(event_time, unit="s").value // self.sampling_ns
+            if bucket == self.bucket:
+                return None
+            self.bucket = bucket
+            microseconds = bucket * self.sampling_ns // 1000 % (86400 * 10**6)
+            event_time = microseconds // 10**6 + microseconds % 10**6 / 1e6
+        book = np.asarray(orderbook[:self.num_book_columns], dtype=np.float64)
+        previous_time, previous_book = self.previous_time, self.previous_book
+        self.previous_time, self.previous_book = event_time, book
+        if previous_book is None:
+            return None
+        # the depth of a new limit order is measured on the book after it, of the other events on the book before
+        reference_book = book if event_type == 1 else previous_book
+        if direction == 1:
+            depth = (reference_book[2] - price) // 100
+        else:
+            depth = (price - reference_book[0]) // 100
+        event = np.empty(LEN_RAW_EVENT)
+        event[:cst.LEN_ORDER] = [event_time - previous_time, event_type, size, price, direction * (-1 if event_type == 4 else 1), max(depth, 0)]
+        event[cst.LEN_ORDER:] = book
+        return event
+
+
+def read_lobster_day(message_path, orderbook_path, n_lob_levels=cst.N_LOB_LEVELS):
+    ''' the message and orderbook files of a day, as read by LOBSTERDataBuilder '''
+    messages = pd.read_csv(message_path, names=COLUMNS_NAMES["message"])
+    orderbooks = pd.read_csv(orderbook_path, names=COLUMNS_NAMES["orderbook"][:n_lob_levels * cst.LEN_LEVEL], usecols=range(n_lob_levels * cst.LEN_LEVEL))
+    return messages, orderbooks
+
+
+def batch_preprocess(messages, orderbooks, stats=None, sampling_type="quantity", sampling_time="", sampling_quantity=500):
+    ''' the split rows of a day with the batch preprocessing of LOBSTERDataBuilder, normalized with stats, a dict of
+    save_normalization_stats, or with the statistics of the day when None. Returns the rows and the statistics '''
+    orderbooks, messages = preprocess_data([messages.copy(), orderbooks.copy()], cst.N_LOB_LEVELS, sampling_type, sampling_time, sampling_quantity)
+    messages["price"] = messages["price"] / 10000
+    # the prices of the files are integers, recent versions of pandas do not divide them in place
+    orderbooks = orderbooks.astype(np.float64)
+    orderbooks.loc[:, ::2] /= 10000
+    stats = stats or {}
+    orderbooks, *orderbook_stats = z_score_orderbook(orderbooks, *[stats.get(key) for key in ORDERBOOK_STATS])
+    messages, *message_stats = normalize_messages(messages, *[stats.get(key) for key in MESSAGE_STATS])
+    stats = {key: float(value) for key, value in zip(ORDERBOOK_STATS + MESSAGE_STATS, orderbook_stats + message_stats)}
+    return np.concatenate([messages.values, orderbooks.values], axis=1), stats
+
+
+def batch_probabilities(model, model_type, seq_size, num_features, rows, batch_size=1024):
+    ''' class probabilities of every window of the split rows, one for each row from the seq_size-th '''
+    x = torch.from_numpy(np.concatenate(split_input(rows, cst.Dataset.LOBSTER.value, num_features), axis=1).astype(np.float32))
+    windows = x.unfold(0, seq_size, 1).transpose(1, 2)
+    with torch.inference_mode():
+        return torch.cat([probabilities(model_type, model(windows[i:i + batch_size])) for i in range(0, windows.shape[0], batch_size)])
+
+
+def replay_day(model, model_type, seq_size, num_features, stats, messages, orderbooks, sampling_type="quantity", sampling_time="", sampling_quantity=500):
+    ''' feeds the events of a day one by one through the StreamingPreprocessor and the model. Returns the seconds from
+    the arrival of each event to its output, whether the model ran on it, the raw rows of the sampled events and the
+    class probabilities of their full windows '''
+    preprocessor = StreamingPreprocessor(sampling_type, sampling_time, sampling_quantity)
+    engine = MultiTickerEngine(model, model_type, 1, seq_size, num_features, [stats])
+    ticker = torch.zeros(1, dtype=torch.long)
+    message_rows, orderbook_rows = messages.to_numpy(), orderbooks.to_numpy()
+    latencies = np.empty(len(message_rows))
+    sampled = np.zeros(len(message_rows), dtype=bool)
+    events, outputs = [], []
+    for i in range(len(message_rows)):
+        start = time.perf_counter()
+        event = preprocessor.push(message_rows[i], orderbook_rows[i])
+        if event is not None:
+            _, probs = engine.push(ticker, torch.from_numpy(event)[None])
+            if probs is not None:
+                outputs.append(probs[0])
+        latencies[i] = time.perf_counter() - start
+        if event is not None:
+            sampled[i] = True
+            events.append(event)
+    events = np.stack(events) if events else np.empty((0, LEN_RAW_EVENT))
+    outputs = torch.stack(outputs) if outputs else torch.empty(0)
+    return latencies, sampled, events, outputs
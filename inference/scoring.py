@@ -0,0 +1,55 @@
+import time
+import numpy as np
+import torch
+import constants as cst
+from utils.utils_model import load_model, probabilities
+
+
+def split_input(split, dataset_type, num_features):
+    ''' returns the model input columns of a memory mapped split without reading them. The LOBSTER splits are laid out
+    as saved by LOBSTERDataBuilder, with the orders before the book, the FI-2010 splits are taken as (rows, features) '''
+    if dataset_type == cst.Dataset.LOBSTER.value:
+        book = split[:, cst.LEN_ORDER:cst.LEN_ORDER + 40]
+        if num_features == 40:
+            return [book]
+        # the same column order of lobster_load with all_features
+        return [book, split[:, :cst.LEN_ORDER]]
+    return [split[:, :num_features]]
+
+
+def score_split(checkpoint_path, input_path, output_path, batch_size=4096, exit_threshold=0.0):
+    ''' writes the class probabilities of every window of seq_size rows of the .npy split in input_path to a .npy file
+    in output_path, of shape (windows, 3) or (windows, horizons, 3) for the multi-horizon models. The split is memory
+    mapped and read one batch of windows at a time, the output is memory mapped and written in place '''
+    model, hparams = load_model(checkpoint_path, exit_threshold=exit_threshold)
+    model_type, seq_size = hparams["model_type"], hparams["seq_size"]
+    split = np.load(input_path, mmap_mode="r")
+    columns = split_input(split, hparams["dataset_type"], hparams["num_features"])
+    num_windows = split.shape[0] - seq_size + 1
+    if num_windows <= 0:
+        raise ValueError(f"The split has {split.shape[0]} rows, fewer than the sequence size {seq_size}")
+    horizons = hparams.get("horizons") or []
+    shape = (num_windows, len(horizons), 3) if horizons else (num_windows, 3)
+    output = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=shape)
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for first in range(0, num_windows, batch_size):
+            last = min(first + batch_size, num_windows)
+            # the rows of the windows of the batch, the windows are views on them
+            rows = np.concatenate([column[first:last + seq_size - 1] for column in columns], axis=1)
+            x = torch.from_numpy(rows.astype(np.float32, copy=False)).unfold(0, seq_size, 1).transpose(1, 2)
+            output[first:last] = probabilities(model_type, model(x)).numpy()
+    seconds = time.perf_counter() - start
+    output.flush()
+    print(f"Scored {num_windows} windows of {input_path} in {seconds:.2f} s, {num_windows / seconds:.0f} rows/sec")
+    print(f"Probabilities saved in {output_path}")
+    return output_path
+
+
+def score_checkpoint(config):
+    ''' scores experiment.scoring_input with the model of experiment.checkpoint_reference '''
+    output_path = config.experiment.scoring_output
+    if output_path == "":
+        output_path = config.experiment.scoring_input.rsplit(".npy", 1)[0] + "_probabilities.npy"
+    return score_split(config.experiment.checkpoint_reference, config.experiment.scoring_input, output_path, config.experiment.scoring_batch_size, config.experiment.exit_threshold)
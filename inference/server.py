@@ -0,0 +1,217 @@
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from utils.utils_model import load_model, probabilities
+
+# max length of a request line, a window of 384 events of 144 features is about 1 MB of JSON
+STREAM_LIMIT = 64 * 2**20
+
+
+class ServerStats:
+    ''' latencies of the last max_samples requests, from the arrival to the response, and the histogram of the batch sizes '''
+    def __init__(self, max_samples=10000):
+        self.latencies = collections.deque(maxlen=max_samples)
+        self.batch_sizes = collections.Counter()
+        self.num_requests = 0
+
+    def record_batch(self, batch_size):
+        self.batch_sizes[batch_size] += 1
+
+    def record_request(self, seconds):
+        self.latencies.append(seconds)
+        self.num_requests += 1
+
+    def summary(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": self.num_requests,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+
+class MicroBatcher:
+    ''' coalesces the windows submitted by concurrent requests into batches of at most max_batch_size windows. A batch
+    is run as soon as it is full or max_wait_ms after its first window arrived, on a single inference thread so that
+    the event loop keeps accepting requests while the model runs '''
+    def __init__(self, model, model_type, max_batch_size=64, max_wait_ms=2.0, stats=None):
+        self.model = model
+        self.model_type = model_type
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats if stats is not None else ServerStats()
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown()
+
+    async def predict(self, window):
+        ''' window: tensor of shape (seq_size, num_features), returns its class probabilities '''
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((window, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            x = torch.stack([window for window, _ in batch])
+            self.stats.record_batch(len(batch))
+            try:
+                output = await loop.run_in_executor(self.executor, self._forward, x)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), probs in zip(batch, output):
+                if not future.done():
+                    future.set_result(probs)
+
+    def _forward(self, x):
+        with torch.inference_mode():
+            return probabilities(self.model_type, self.model(x)).numpy()
+
+
+class InferenceServer:
+    ''' asyncio server of newline delimited JSON requests on a localhost port or a Unix socket. A request has an "id" and
+    either a "window", a list of seq_size events of num_features values, or a "stream" name and an "event". The events of
+    a stream are collected by the server and, once seq_size of them have arrived, each event is answered with the
+    prediction of the window that ends with it. {"stats": true} returns the latency percentiles and the batch sizes '''
+    def __init__(self, model, model_type, seq_size, num_features, max_batch_size=64, max_wait_ms=2.0):
+        self.seq_size = seq_size
+        self.num_features = num_features
+        self.stats = ServerStats()
+        self.batcher = MicroBatcher(model, model_type, max_batch_size, max_wait_ms, self.stats)
+        self.streams = {}
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8765, socket_path=""):
+        self.batcher.start()
+        if socket_path != "":
+            self.server = await asyncio.start_unix_server(self._handle, path=socket_path, limit=STREAM_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=STREAM_LIMIT)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle(self, reader, writer):
+        lock = asyncio.Lock()
+        # the pending responses, referenced until done so that they are not garbage collected
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # every request of a connection is answered concurrently, the responses carry the id of the request
+                task = asyncio.get_running_loop().create_task(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            # a client that half-closes after its requests still gets their responses
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _respond(self, line, writer, lock):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            response = await self.answer(request)
+            if "probabilities" in response:
+                self.stats.record_request(time.perf_counter() - start)
+        except Exception as e:
+            response = {"error": repr(e)}
+        response["id"] = request_id
+        async with lock:
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+    async def answer(self, request):
+        if request.get("stats"):
+            return self.stats.summary()
+        if "window" in request:
+            window = torch.tensor(request["window"], dtype=torch.float32)
+            if window.shape != (self.seq_size, self.num_features):
+                raise ValueError(f"The window must have shape ({self.seq_size}, {self.num_features})")
+        elif "event" in request:
+            event = torch.tensor(request["event"], dtype=torch.float32)
+            if event.shape != (self.num_features,):
+                raise ValueError(f"The event must have {self.num_features} values")
+            events = self.streams.setdefault(request["stream"], collections.deque(maxlen=self.seq_size))
+            events.append(event)
+            if len(events) < self.seq_size:
+                return {"ready": False}
+            window = torch.stack(list(events))
+        else:
+            raise ValueError("The request must contain a window or an event")
+        probs = await self.batcher.predict(window)
+        # one prediction, or one for each horizon of the multi-horizon models
+        return {"probabilities": probs.tolist(), "prediction": probs.argmax(axis=-1).tolist()}
+
+
+async def request_json(reader, writer, request):
+    ''' sends one request on a connection and returns the response, for clients that wait for each answer '''
+    writer.write((json.dumps(request) + "\n").encode())
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def serve_checkpoint(config):
+    ''' serves the model of experiment.checkpoint_reference until interrupted '''
+    model, hparams = load_model(config.experiment.checkpoint_reference, exit_threshold=config.experiment.exit_threshold)
+    server = InferenceServer(
+        model,
+        hparams["model_type"],
+        hparams["seq_size"],
+        hparams["num_features"],
+        config.experiment.serve_max_batch_size,
+        config.experiment.serve_max_wait_ms,
+    )
+
+    async def main():
+        await server.start(config.experiment.serve_host, config.experiment.serve_port, config.experiment.serve_socket)
+        address = config.experiment.serve_socket or f"{config.experiment.serve_host}:{config.experiment.serve_port}"
+        print(f"Serving {hparams['model_type']} on {address}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            print(server.stats.summary())
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
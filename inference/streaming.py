@@ -0,0 +1,176 @@
+from collections import deque
+import torch
+from torch import nn
+
+
+class MLPLOBStream:
+    ''' Rolling-window inference for MLPLOB, one LOB event at a time.
+
+    The first layer of MLPLOB is linear, so it is split over the two BiN branches. The feature normalization
+    of an event does not depend on the rest of the window, its projection W @ z is computed once and kept in a
+    ring buffer together with the event, and only the position dependent scale and bias of BiN are applied at
+    every step. The temporal normalization uses mean and variance over the whole window, they are kept as
+    rolling sums, but its projection has to be recomputed. Everything after the first temporal MLP mixes all
+    the timesteps, so it is run on the whole window as in MLPLOB.forward.
+    '''
+    def __init__(self, model):
+        self.model = model.eval()
+        self.seq_size = model.norm_layer.t1
+        self.num_features = model.norm_layer.d1
+        self.hidden_dim = model.first_layer.out_features
+        self.reset()
+
+    def reset(self):
+        self.events = torch.zeros(self.seq_size, self.num_features)
+        self.projections = torch.zeros(self.seq_size, self.hidden_dim)
+        self.sum = torch.zeros(self.num_features, dtype=torch.float64)
+        self.sum_sq = torch.zeros(self.num_features, dtype=torch.float64)
+        # position of the oldest event in the ring buffers
+        self.head = 0
+        self.count = 0
+
+    @torch.inference_mode()
+    def push(self, event):
+        ''' adds an event, with the same features of a row of the model input, and returns the logits of the
+        window that ends with it, or None until seq_size events have been pushed '''
+        x = self._embed(event.float())
+        if self.count == self.seq_size:
+            old = self.events[self.head].double()
+            self.sum -= old
+            self.sum_sq -= old * old
+            position = self.head
+            self.head = (self.head + 1) % self.seq_size
+        else:
+            position = self.count
+            self.count += 1
+        self.sum += x.double()
+        self.sum_sq += x.double() * x.double()
+        # normalization along the feature dimension, it depends only on the event
+        z = (x - x.mean()) / x.std()
+        self.events[position] = x
+        self.projections[position] = self.model.first_layer.weight @ z
+        if self.count < self.seq_size:
+            return None
+        return self._window_logits()
+
+    def _embed(self, event):
+        if not self.model.is_lobster:
+            return event
+        order_type = self.model.order_type_embedder(event[41].long().unsqueeze(0))
+        return torch.cat([event[self.model.continuous_features], order_type.squeeze(0)])
+
+    def _window_logits(self):
+        bin_layer = self.model.norm_layer
+        first_layer = self.model.first_layer
+        order = (self.head + torch.arange(self.seq_size)) % self.seq_size
+        events = self.events[order]
+        projections = self.projections[order]
+
+        # normalization along the temporal dimension, with the rolling statistics of the window
+        mean = self.sum / self.seq_size
+        var = (self.sum_sq - self.sum * mean) / (self.seq_size - 1)
+        std = var.clamp(min=0).sqrt()
+        std = torch.where(std < 1e-4, torch.ones_like(std), std)
+        X2 = bin_layer.l2[:, 0] * (events - mean.float()) / std.float() + bin_layer.B2[:, 0]
+
+        y1 = torch.where(bin_layer.y1 < 0, torch.full_like(bin_layer.y1, 0.01), bin_layer.y1)
+        y2 = torch.where(bin_layer.y2 < 0, torch.full_like(bin_layer.y2, 0.01), bin_layer.y2)
+        # first_layer(y1 * X1 + y2 * X2), with X1 = l1 * z + B1 for each position
+        X1_projection = bin_layer.l1 * projections + bin_layer.B1 * first_layer.weight.sum(dim=1)
+        x = y1 * X1_projection + y2 * (X2 @ first_layer.weight.T) + first_layer.bias
+
+        x = x.unsqueeze(0).permute(0, 2, 1)
+        for layer in self.model.layers[1:]:
+            x = layer(x)
+            x = x.permute(0, 2, 1)
+        x = x.reshape(x.shape[0], -1)
+        for layer in self.model.final_layers:
+            x = layer(x)
+        return x[0]
+
+
+class DeepLOBStream:
+    ''' Rolling-window inference for DeepLOB, one LOB event at a time.
+
+    The convolution blocks have no padding, so each of their output columns depends only on the last
+    receptive_field events and is computed once. The inception modules use 'same' padding with a radius of 2,
+    their outputs are cached for the positions that have all their neighbours inside the window, and only the
+    two positions at each edge of the window are recomputed.
+    In "exact" mode the LSTM is run on the whole window, and the output matches DeepLOB.forward.
+    In "approximate" mode the LSTM state is carried from one event to the next, so every event costs constant
+    work: the state is advanced with the cached positions and only the two right edge positions are run on
+    top of it. The LSTM then sees all the history instead of starting from a zero state at the beginning of
+    the window, compare_with_batch_forward measures the effect on the predictions.
+    '''
+    def __init__(self, model, seq_size, mode="exact"):
+        if mode not in ["exact", "approximate"]:
+            raise ValueError("Streaming mode not found")
+        self.model = model.eval()
+        self.seq_size = seq_size
+        self.mode = mode
+        convs = [m for block in [model.conv1, model.conv2, model.conv3] for m in block if isinstance(m, nn.Conv2d)]
+        self.receptive_field = 1 + sum(conv.kernel_size[0] - 1 for conv in convs)
+        self.num_positions = seq_size - self.receptive_field + 1
+        self.reset()
+
+    def reset(self):
+        self.events = deque(maxlen=self.receptive_field)
+        self.columns = deque(maxlen=self.num_positions)
+        # inception outputs of the positions that are not affected by the padding at the edges of the window
+        self.inner = deque(maxlen=self.num_positions - 4)
+        self.state = None
+        self.count = 0
+
+    @torch.inference_mode()
+    def push(self, event):
+        ''' adds an event and returns the class probabilities of the window that ends with it,
+        or None until seq_size events have been pushed '''
+        self.events.append(event.float())
+        self.count += 1
+        if len(self.events) < self.receptive_field:
+            return None
+        x = torch.stack(list(self.events))[None, None, :, :]
+        x = self.model.conv3(self.model.conv2(self.model.conv1(x)))
+        self.columns.append(x[0, :, 0, 0])
+        if len(self.columns) < 5:
+            return None
+        right = self._inception(list(self.columns)[-5:])
+        self.inner.append(right[2])
+        if self.mode == "approximate":
+            _, self.state = self.model.lstm(right[2][None, None, :], self.state)
+        if self.count < self.seq_size:
+            return None
+        if self.mode == "exact":
+            left = self._inception(list(self.columns)[:4])
+            x = torch.cat([left[:2], torch.stack(list(self.inner)), right[3:]])
+            out, _ = self.model.lstm(x[None, :, :])
+        else:
+            out, _ = self.model.lstm(right[None, 3:], self.state)
+        out = self.model.fc1(out[:, -1, :])
+        return self.model.softmax(out)[0]
+
+    def _inception(self, columns):
+        ''' inception outputs of consecutive positions, with the padding of a window that starts and ends with them '''
+        x = torch.stack(columns, dim=1)[None, :, :, None]
+        x = torch.cat((self.model.inp1(x), self.model.inp2(x), self.model.inp3(x)), dim=1)
+        return x[0, :, :, 0].T
+
+
+def compare_with_batch_forward(stream, events):
+    ''' pushes events one by one into stream and compares its outputs with the ones of the batch forward of
+    the model on the same windows, returns the max absolute difference and the share of equal predictions '''
+    stream.reset()
+    model = stream.model
+    max_diff, equal, total = 0.0, 0, 0
+    for i in range(events.shape[0]):
+        output = stream.push(events[i])
+        if output is None:
+            continue
+        with torch.inference_mode():
+            expected = model(events[i - stream.seq_size + 1:i + 1].unsqueeze(0))
+        if isinstance(expected, tuple):
+            expected = expected[0]
+        max_diff = max(max_diff, float((output - expected[0]).abs().max()))
+        equal += int(output.argmax() == expected[0].argmax())
+        total += 1
+    return {"max_abs_diff": max_diff, "agreement": equal / total}
@@ -14,9 +14,11 @@ import constants as cst
 import hydra
 from config.config import Config
 from run import run_wandb, run, sweep_init
+from sweep import run_sweep
 from preprocessing.lobster import LOBSTERDataBuilder
 from constants import Dataset
 from config.config import MLPLOB, TLOB
+from utils.utils_autotune import autotune, apply_runtime_settings
 
 @hydra.main(config_path="config", config_name="config")
 def hydra_app(config: Config):
@@ -34,6 +36,26 @@ def hydra_app(config: Config):
         if config.model.type.value == "MLPLOB" or config.model.type.value == "TLOB":
             config.model.hyperparameters_fixed["hidden_dim"] = 46
 
+    if "AUTOTUNE" in config.experiment.type:
+        # each setting is measured in its own process on random data
+        autotune(config)
+        return
+    apply_runtime_settings(config)
+    # the inference modules are imported by their experiment type, onnx and onnxruntime are needed only to use them
+    if "EXPORT" in config.experiment.type:
+        from inference.onnx_backend import export_checkpoint
+        # export the checkpoint to ONNX, no data is needed
+        export_checkpoint(config.experiment.checkpoint_reference)
+        return
+    if "SCORING" in config.experiment.type:
+        from inference.scoring import score_checkpoint
+        # score a preprocessed split with the checkpoint, without the trainer
+        score_checkpoint(config)
+        return
+    if "SERVE" in config.experiment.type:
+        from inference.server import serve_checkpoint
+        serve_checkpoint(config)
+        return
     if config.experiment.dataset_type.value == "LOBSTER" and not config.experiment.is_data_preprocessed:
         # prepare the datasets, this will save train.npy, val.npy and test.npy in the data directory
         data_builder = LOBSTERDataBuilder(
@@ -59,6 +81,20 @@ def hydra_app(config: Config):
             print("Data extracted.")
         except Exception as e:
             raise(f"Error downloading or extracting data: {e}")
+    if "QUANTIZATION" in config.experiment.type:
+        from inference.quantization import quantize_checkpoint
+        quantize_checkpoint(config)
+        return
+    if "EARLY_EXIT" in config.experiment.type:
+        from inference.early_exit import early_exit_report
+        # F1 and latency of the exit heads of the checkpoint at each threshold
+        early_exit_report(config)
+        return
+    if "MULTI_EVALUATION" in config.experiment.type:
+        from inference.evaluation import evaluate_checkpoints
+        # the test windows are read once for all the checkpoints
+        evaluate_checkpoints(config)
+        return
     if config.experiment.is_wandb:
         if config.experiment.is_sweep:
             sweep_config = sweep_init(config)
@@ -69,6 +105,8 @@ def hydra_app(config: Config):
             start_wandb()
 
     # training without using wandb
+    elif config.experiment.is_sweep:
+        run_sweep(config, accelerator)
     else:
         run(config, accelerator)
     
@@ -1,7 +1,6 @@
 from torch import nn
 from models.bin import BiN
 import torch
-import constants as cst
 
 class TABL_layer(nn.Module):
     def __init__(self, d2, d1, t1, t2):
@@ -33,21 +32,14 @@ class TABL_layer(nn.Module):
     def forward(self, X):
         
         #maintaining the weight parameter between 0 and 1.
-        if (self.l[0] < 0): 
-          l = torch.Tensor(1,).to(cst.DEVICE)
-          self.l = nn.Parameter(l)
-          nn.init.constant_(self.l, 0.0)
-
-        if (self.l[0] > 1): 
-          l = torch.Tensor(1,).to(cst.DEVICE)
-          self.l = nn.Parameter(l)
-          nn.init.constant_(self.l, 1.0)
+        l = torch.clamp(self.l[0], 0.0, 1.0)
      
         #modelling the dependence along the first mode of X while keeping the temporal order intact (7)
         X = self.W1 @ X
 
         #enforcing constant (1) on the diagonal
-        W = self.W -self.W *torch.eye(self.t1,dtype=torch.float32).to(cst.DEVICE)+torch.eye(self.t1,dtype=torch.float32).to(cst.DEVICE)/self.t1
+        eye = torch.eye(self.t1, dtype=torch.float32, device=X.device)
+        W = self.W -self.W *eye+eye/self.t1
 
         #attention, the aim of the second step is to learn how important the temporal instances are to each other (8)
         E = X @ W
@@ -57,7 +49,7 @@ class TABL_layer(nn.Module):
 
         #applying a soft attention mechanism  (10)
         #he attention mask A obtained from the third step is used to zero out the effect of unimportant elements
-        X = self.l[0] * (X) + (1.0 - self.l[0])*X*A
+        X = l * (X) + (1.0 - l)*X*A
 
         #the final step of the proposed layer estimates the temporal mapping W2, after the bias shift (11)
         y = X @ self.W2 + self.B
@@ -101,29 +93,26 @@ class BiN_CTABL(nn.Module):
     #first of all we pass the input to the BiN layer, then we use the C(TABL) architecture
     x = self.BiN(x)
 
-    self.max_norm_(self.BL.W1.data)
-    self.max_norm_(self.BL.W2.data)
+    self.max_norm_(self.BL.W1)
+    self.max_norm_(self.BL.W2)
     x = self.BL(x)
     x = self.dropout(x)
     
-    self.max_norm_(self.BL2.W1.data)
-    self.max_norm_(self.BL2.W2.data)
+    self.max_norm_(self.BL2.W1)
+    self.max_norm_(self.BL2.W2)
     x = self.BL2(x)
     x = self.dropout(x)
 
-    self.max_norm_(self.TABL.W1.data)
-    self.max_norm_(self.TABL.W.data)
-    self.max_norm_(self.TABL.W2.data)
+    self.max_norm_(self.TABL.W1)
+    self.max_norm_(self.TABL.W)
+    self.max_norm_(self.TABL.W2)
     x = self.TABL(x)
-    x = torch.squeeze(x)
+    x = torch.squeeze(x, -1)
     x = torch.softmax(x, 1)
     
     return x
 
   def max_norm_(self, w):
     with torch.no_grad():
-      if (torch.linalg.matrix_norm(w) > 10.0):
-        norm = torch.linalg.matrix_norm(w)
-        desired = torch.clamp(norm, min=0.0, max=10.0)
-        w *= (desired / (1e-8 + norm))   
-    
\ No newline at end of file
+      norm = torch.linalg.matrix_norm(w)
+      w *= torch.where(norm > 10.0, 10.0 / (1e-8 + norm), torch.ones_like(norm))
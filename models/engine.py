@@ -1,20 +1,22 @@
+import inspect
 import random
 from lightning import LightningModule
 import numpy as np
-from sklearn.metrics import classification_report, precision_recall_curve
 from torch import nn
 import os
 import torch
 import matplotlib.pyplot as plt
 import wandb
-import seaborn as sns
 from lion_pytorch import Lion
-from torch_ema import ExponentialMovingAverage
 from utils.utils_model import pick_model
+from utils.utils_checkpoint import AsyncCheckpointWriter, weights_only_checkpoint
+from utils.utils_ema import ExponentialMovingAverage
+from utils.utils_metrics import MetricAccumulator, BinnedPRCurve, format_report
+from utils.utils_distillation import distillation_loss
 import constants as cst
 from scipy.stats import mode
 
-from visualizations.attentions import plot_mean_att_distance
+from visualizations.attentions import AttentionRenderer, plot_mean_att_distance
 
 
 class Engine(LightningModule):
@@ -36,12 +38,25 @@ class Engine(LightningModule):
         num_heads=8,
         is_sin_emb=True,
         len_test_dataloader=None,
-        plot_att=False
+        plot_att=False,
+        compile=False,
+        precision="32",
+        ema_decay=0.999,
+        ema_update_every=1,
+        checkpoint_weights_only=True,
+        checkpoint_keep_best=1,
+        horizons=None,
+        distillation_alpha=0.0,
+        distillation_temperature=1.0,
+        early_exit=False
     ):
         super().__init__()
         self.seq_size = seq_size
         self.dataset_type = dataset_type
         self.horizon = horizon
+        # with horizons the model has one head for each horizon and the labels have one column for each horizon
+        self.horizons = list(horizons) if horizons else []
+        self.num_horizons = max(len(self.horizons), 1)
         self.max_epochs = max_epochs
         self.model_type = model_type
         self.num_heads = num_heads
@@ -54,74 +69,108 @@ class Engine(LightningModule):
         self.num_layers = num_layers
         self.num_features = num_features
         self.experiment_type = experiment_type
-        self.model = pick_model(model_type, hidden_dim, num_layers, seq_size, num_features, num_heads, is_sin_emb, dataset_type) 
-        self.ema = ExponentialMovingAverage(self.parameters(), decay=0.999)
+        if precision not in ["32", "bf16"]:
+            raise ValueError("Precision not found")
+        self.precision = precision
+        # weight of the loss on the soft targets of a teacher, used with the batches that carry them
+        self.distillation_alpha = distillation_alpha
+        self.distillation_temperature = distillation_temperature
+        # the exit heads of TLOB are trained jointly with the final layers
+        self.early_exit = early_exit
+        self.model = pick_model(model_type, hidden_dim, num_layers, seq_size, num_features, num_heads, is_sin_emb, dataset_type, compile, self.num_horizons, early_exit, bool(self.horizons))
+        self.ema = ExponentialMovingAverage(self.parameters(), decay=ema_decay, update_every=ema_update_every)
         self.ema.to(cst.DEVICE)
         self.loss_function = nn.CrossEntropyLoss()
-        self.train_losses = []
-        self.val_losses = []
-        self.test_losses = []
-        self.test_targets = []
-        self.test_predictions = []
-        self.test_proba = []
-        self.val_targets = []
+        # losses and confusion matrices are accumulated on the device and read once per epoch
+        self.train_metrics = MetricAccumulator()
+        self.val_metrics = MetricAccumulator()
+        self.test_metrics = MetricAccumulator()
+        self.val_distillation_metrics = MetricAccumulator()
+        self.val_horizon_metrics = [MetricAccumulator() for _ in self.horizons]
+        self.test_horizon_metrics = [MetricAccumulator() for _ in self.horizons]
+        self.test_pr_curve = BinnedPRCurve()
         self.val_loss = np.inf
-        self.val_predictions = []
         self.min_loss = np.inf
         self.save_hyperparameters()
         self.last_path_ckpt = None
         self.first_test = True
         self.plot_att = plot_att
+        self.attention_renderer = None
+        self.checkpoint_weights_only = checkpoint_weights_only
+        self.checkpoint_keep_best = checkpoint_keep_best
+        self.checkpoint_writer = None
+        # early termination of the trials of a local sweep, set by run.train
+        self.scheduler = None
         
     def forward(self, x, plot_this_att=False, batch_idx=None):
-        if self.model_type == "TLOB":
-            output, att_temporal, att_feature = self.model(x, plot_this_att)
-        else:
-            output = self.model(x)
-        if self.is_wandb and plot_this_att and self.model_type == "TLOB":
-            for l in range(len(att_temporal)):
-                for i in range(self.num_heads):
-                    plt.figure(figsize=(10, 8))
-                    sns.heatmap(att_temporal[l, i], fmt=".2f", cmap="viridis")
-                    plt.title(f'Temporal Attention Layer {l} Head {i}')
-                    wandb.log({f"Temporal Attention Layer {l} Head {i} for batch {batch_idx}": wandb.Image(plt)})
-                    plt.close()
-            for l in range(len(att_feature)):
-                for i in range(self.num_heads):
-                    plt.figure(figsize=(10, 8))
-                    sns.heatmap(att_feature[l, i], fmt=".2f", cmap="viridis")
-                    plt.title(f'Feature Attention Layer {l} Head {i}')
-                    wandb.log({f"Feature Attention Layer {l} Head {i}  for batch {batch_idx}": wandb.Image(plt)})
-                    plt.close()
+        # with bf16 the matmuls and convolutions run in bfloat16, the weights, the loss and the EMA stay in float32
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.precision == "bf16"):
+            if self.model_type == "TLOB":
+                output, att_temporal, att_feature = self.model(x, plot_this_att)
+            else:
+                output = self.model(x)
+        output = output.float()
+        if plot_this_att and self.model_type == "TLOB":
+            # the maps are rendered on the thread of the renderer, the test loop only queues them
+            if self.attention_renderer is None:
+                self.attention_renderer = AttentionRenderer(self.is_wandb, cst.DIR_SAVED_MODEL + "/" + str(self.model_type) + "/attention")
+            self.attention_renderer.submit("Temporal", att_temporal, batch_idx)
+            self.attention_renderer.submit("Feature", att_feature, batch_idx)
         return output
     
     def loss(self, y_hat, y):
+        if self.horizons:
+            # the classes go to dim 1, the loss is the mean over the samples and the horizons
+            return self.loss_function(y_hat.transpose(1, 2), y)
         return self.loss_function(y_hat, y)
+
+    def update_metrics(self, metrics, horizon_metrics, batch_loss, y_hat, y):
+        ''' the metrics of the multi-head models are pooled over the horizons, horizon_metrics have those of each horizon '''
+        metrics.update(batch_loss, y.flatten(), y_hat.argmax(dim=-1).flatten())
+        if not horizon_metrics:
+            return
+        with torch.no_grad():
+            horizon_losses = nn.functional.cross_entropy(y_hat.transpose(1, 2), y, reduction="none").mean(dim=0)
+        for i, horizon_metric in enumerate(horizon_metrics):
+            horizon_metric.update(horizon_losses[i], y[:, i], y_hat[:, i].argmax(dim=1))
         
+    def forward_exits(self, x):
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.precision == "bf16"):
+            outputs = self.model.forward_exits(x)
+        return [output.float() for output in outputs]
+
     def training_step(self, batch, batch_idx):
-        x, y = batch
-        y_hat = self.forward(x)
-        batch_loss = self.loss(y_hat, y)
+        x, y = batch[:2]
+        if self.early_exit:
+            # the mean of the losses of the exit heads and of the final layers
+            outputs = self.forward_exits(x)
+            y_hat = outputs[-1]
+            batch_loss = torch.stack([self.loss(output, y) for output in outputs]).mean()
+        else:
+            y_hat = self.forward(x)
+            batch_loss = self.loss(y_hat, y)
+        if len(batch) == 3:
+            batch_loss = (1 - self.distillation_alpha) * batch_loss + self.distillation_alpha * distillation_loss(y_hat, batch[2], self.distillation_temperature)
         batch_loss_mean = torch.mean(batch_loss)
-        self.train_losses.append(batch_loss_mean.item())
+        self.train_metrics.update(batch_loss_mean)
         self.ema.update()
         if batch_idx % 1000 == 0:
-            print(f'train loss: {sum(self.train_losses) / len(self.train_losses)}')
+            print(f'train loss: {self.train_metrics.mean_loss()}')
         return batch_loss_mean
     
     def on_train_epoch_start(self) -> None:
         print(f'learning rate: {self.optimizer.param_groups[0]["lr"]}')
     
     def validation_step(self, batch, batch_idx):
-        x, y = batch
-        # Validation: with EMA
-        with self.ema.average_parameters():
-            y_hat = self.forward(x)
-            batch_loss = self.loss(y_hat, y)
-            self.val_targets.append(y.cpu().numpy())
-            self.val_predictions.append(y_hat.argmax(dim=1).cpu().numpy())
-            batch_loss_mean = torch.mean(batch_loss)
-            self.val_losses.append(batch_loss_mean.item())
+        x, y = batch[:2]
+        # Validation: with EMA, swapped in by on_validation_epoch_start
+        y_hat = self.forward(x)
+        # the validation loss stays the cross entropy, so that the checkpoints of the students compare with the others
+        batch_loss = self.loss(y_hat, y)
+        batch_loss_mean = torch.mean(batch_loss)
+        self.update_metrics(self.val_metrics, self.val_horizon_metrics, batch_loss_mean, y_hat, y)
+        if len(batch) == 3:
+            self.val_distillation_metrics.update(distillation_loss(y_hat, batch[2], self.distillation_temperature))
         return batch_loss_mean
     
     def on_test_epoch_start(self):
@@ -129,46 +178,41 @@ class Engine(LightningModule):
         random_indices = random.sample(range(self.len_test_dataloader), 5)
         print(f'Random indices: {random_indices}')
         self.random_indices = random_indices  # Store the random indices if needed
+        # a loaded model starts its average from the loaded weights, the swap changes only the weights being trained
+        self.ema.store()
+        self.ema.copy_to()
         return 
         
     
     def test_step(self, batch, batch_idx):
         x, y = batch
-        # Test: with EMA
+        # Test: with EMA, swapped in by on_test_epoch_start
         if batch_idx in self.random_indices and self.model_type == "TLOB" and self.first_test and self.plot_att:
             plot_this_att = True
             print(f'Plotting attention for batch {batch_idx}')
         else:
             plot_this_att = False
-        if self.experiment_type == "TRAINING":
-            with self.ema.average_parameters():
-                y_hat = self.forward(x, plot_this_att, batch_idx)
-                batch_loss = self.loss(y_hat, y)
-                self.test_targets.append(y.cpu().numpy())
-                self.test_predictions.append(y_hat.argmax(dim=1).cpu().numpy())
-                self.test_proba.append(torch.softmax(y_hat, dim=1)[:, 1].cpu().numpy())
-                batch_loss_mean = torch.mean(batch_loss)
-                self.test_losses.append(batch_loss_mean.item())
-        else:
-            y_hat = self.forward(x, plot_this_att, batch_idx)
-            batch_loss = self.loss(y_hat, y)
-            self.test_targets.append(y.cpu().numpy())
-            self.test_predictions.append(y_hat.argmax(dim=1).cpu().numpy())
-            self.test_proba.append(torch.softmax(y_hat, dim=1)[:, 1].cpu().numpy())
-            batch_loss_mean = torch.mean(batch_loss)
-            self.test_losses.append(batch_loss_mean.item())
+        y_hat = self.forward(x, plot_this_att, batch_idx)
+        batch_loss = self.loss(y_hat, y)
+        self.test_pr_curve.update(torch.softmax(y_hat, dim=-1)[..., 1].flatten(), y.flatten())
+        batch_loss_mean = torch.mean(batch_loss)
+        self.update_metrics(self.test_metrics, self.test_horizon_metrics, batch_loss_mean, y_hat, y)
         return batch_loss_mean
     
     def on_validation_epoch_start(self) -> None:
-        loss = sum(self.train_losses) / len(self.train_losses)
-        self.train_losses = []
+        loss = self.train_metrics.mean_loss(self.sum_over_processes)
+        self.train_metrics.reset()
         if self.is_wandb:
             wandb.log({"train_loss": loss})
-        print(f'Train loss on epoch {self.current_epoch}: {loss}')
+        if self.trainer.is_global_zero:
+            print(f'Train loss on epoch {self.current_epoch}: {loss}')
+        self.ema.store()
+        self.ema.copy_to()
         
     def on_validation_epoch_end(self) -> None:
-        self.val_loss = sum(self.val_losses) / len(self.val_losses)
-        self.val_losses = []
+        results = self.val_metrics.compute(self.sum_over_processes)
+        self.val_metrics.reset()
+        self.val_loss = results["loss"]
         
         # model checkpointing
         if self.val_loss < self.min_loss:
@@ -181,49 +225,72 @@ class Engine(LightningModule):
             self.optimizer.param_groups[0]["lr"] /= 2
         
         self.log("val_loss", self.val_loss)
-        print(f'Validation loss on epoch {self.current_epoch}: {self.val_loss}')
-        targets = np.concatenate(self.val_targets)    
-        predictions = np.concatenate(self.val_predictions)
-        class_report = classification_report(targets, predictions, digits=4, output_dict=True)
-        print(classification_report(targets, predictions, digits=4))
-        self.log("val_f1_score", class_report["macro avg"]["f1-score"])
-        self.log("val_accuracy", class_report["accuracy"])
-        self.log("val_precision", class_report["macro avg"]["precision"])
-        self.log("val_recall", class_report["macro avg"]["recall"])
-        self.val_targets = []
-        self.val_predictions = [] 
+        if self.trainer.is_global_zero:
+            print(f'Validation loss on epoch {self.current_epoch}: {self.val_loss}')
+            print(format_report(results))
+        self.log("val_f1_score", results["macro_f1"])
+        self.log("val_accuracy", results["accuracy"])
+        self.log("val_precision", results["macro_precision"])
+        self.log("val_recall", results["macro_recall"])
+        if self.val_distillation_metrics.num_batches > 0:
+            distillation = self.val_distillation_metrics.mean_loss(self.sum_over_processes)
+            self.val_distillation_metrics.reset()
+            self.log("val_distillation_loss", distillation)
+            if self.trainer.is_global_zero:
+                print(f'Validation distillation loss on epoch {self.current_epoch}: {distillation}')
+        for horizon, horizon_metric in zip(self.horizons, self.val_horizon_metrics):
+            horizon_results = horizon_metric.compute(self.sum_over_processes)
+            horizon_metric.reset()
+            self.log(f"val_loss_h{horizon}", horizon_results["loss"])
+            self.log(f"val_f1_score_h{horizon}", horizon_results["macro_f1"])
+        self.ema.restore()
+        if self.scheduler is not None and not self.scheduler.should_continue(self.current_epoch + 1, self.val_loss):
+            print(f'Trial stopped by the scheduler after epoch {self.current_epoch}')
+            self.trainer.should_stop = True
         
 
     def on_test_epoch_end(self) -> None:
-        targets = np.concatenate(self.test_targets)    
-        predictions = np.concatenate(self.test_predictions)
-        class_report = classification_report(targets, predictions, digits=4, output_dict=True)
-        print(classification_report(targets, predictions, digits=4))
-        self.log("test_loss", sum(self.test_losses) / len(self.test_losses))
-        self.log("f1_score", class_report["macro avg"]["f1-score"])
-        self.log("accuracy", class_report["accuracy"])
-        self.log("precision", class_report["macro avg"]["precision"])
-        self.log("recall", class_report["macro avg"]["recall"])
+        results = self.test_metrics.compute(self.sum_over_processes)
+        if self.trainer.is_global_zero:
+            print(format_report(results))
+        self.log("test_loss", results["loss"])
+        self.log("f1_score", results["macro_f1"])
+        self.log("accuracy", results["accuracy"])
+        self.log("precision", results["macro_precision"])
+        self.log("recall", results["macro_recall"])
+        for horizon, horizon_metric in zip(self.horizons, self.test_horizon_metrics):
+            horizon_results = horizon_metric.compute(self.sum_over_processes)
+            horizon_metric.reset()
+            if self.trainer.is_global_zero:
+                print(f'Horizon {horizon}')
+                print(format_report(horizon_results))
+            self.log(f"test_loss_h{horizon}", horizon_results["loss"])
+            self.log(f"f1_score_h{horizon}", horizon_results["macro_f1"])
+            self.log(f"accuracy_h{horizon}", horizon_results["accuracy"])
         filename_ckpt = ("val_loss=" + str(round(self.val_loss, 3)) +
                              "_epoch=" + str(self.current_epoch) +
                              "_" + self.filename_ckpt +
                              "last.ckpt"
                              )
         path_ckpt = cst.DIR_SAVED_MODEL + "/" + str(self.model_type) + "/" + filename_ckpt
-        self.test_targets = []
-        self.test_predictions = []
-        self.test_losses = []  
+        self.test_metrics.reset()
         self.first_test = False
-        test_proba = np.concatenate(self.test_proba)
-        precision, recall, _ = precision_recall_curve(targets, test_proba, pos_label=1)
-        self.plot_pr_curves(recall, precision, self.is_wandb)
-        with self.ema.average_parameters():
-            self.trainer.save_checkpoint(path_ckpt)   
-        if self.model_type == "TLOB" and self.plot_att:
+        precision, recall, _ = self.test_pr_curve.compute(self.sum_over_processes)
+        self.test_pr_curve.reset()
+        if self.trainer.is_global_zero:
+            self.plot_pr_curves(recall, precision, self.is_wandb)
+        assert self.ema.is_swapped, "The EMA weights must be swapped in by on_test_epoch_start"
+        self.save_checkpoint(path_ckpt)
+        self.ema.restore()
+        if self.model_type == "TLOB" and self.plot_att and len(self.model.mean_att_distance_temporal) > 0:
             plot = plot_mean_att_distance(np.array(self.model.mean_att_distance_temporal).mean(axis=0))
             if self.is_wandb:
                 wandb.log({"mean_att_distance": wandb.Image(plot)})
         
+    def sum_over_processes(self, tensor):
+        ''' sum over the processes of a distributed run, the identity with a single process '''
+        return self.trainer.strategy.reduce(tensor, reduce_op="sum")
+
     def configure_optimizers(self):
         if self.model_type == "DEEPLOB":
             eps = 1
@@ -241,7 +308,7 @@ class Engine(LightningModule):
         wandb.define_metric("val_loss", summary="min")
 
     def model_checkpointing(self, loss):        
-        if self.last_path_ckpt is not None:
+        if self.last_path_ckpt is not None and self.trainer.is_global_zero and not self.checkpoint_weights_only:
             os.remove(self.last_path_ckpt)
         filename_ckpt = ("val_loss=" + str(round(loss, 3)) +
                              "_epoch=" + str(self.current_epoch) +
@@ -249,9 +316,37 @@ class Engine(LightningModule):
                              ".ckpt"
                              )
         path_ckpt = cst.DIR_SAVED_MODEL + "/" + str(self.model_type) + "/" + filename_ckpt
-        with self.ema.average_parameters():
-            self.trainer.save_checkpoint(path_ckpt)
+        assert self.ema.is_swapped, "The EMA weights must be swapped in by on_validation_epoch_start"
+        # the previous checkpoints beyond the best checkpoint_keep_best are removed by the writer
+        self.save_checkpoint(path_ckpt, loss)
         self.last_path_ckpt = path_ckpt  
+
+    def save_checkpoint(self, path_ckpt, score=None):
+        ''' weights only checkpoints are copied to the CPU and written on a background thread by the global zero,
+        full checkpoints are saved with the trainer by every process '''
+        if not self.checkpoint_weights_only:
+            self.trainer.save_checkpoint(path_ckpt)
+            return
+        if not self.trainer.is_global_zero:
+            return
+        if self.checkpoint_writer is None:
+            self.checkpoint_writer = AsyncCheckpointWriter(self.checkpoint_keep_best)
+        checkpoint = weights_only_checkpoint(self, self.current_epoch, self.global_step)
+        self.checkpoint_writer.submit(checkpoint, path_ckpt, score)
+
+    def wait_for_checkpoints(self):
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.wait()
+        self.trainer.strategy.barrier()
+
+    def on_fit_end(self):
+        # the best checkpoint is loaded right after the fit
+        self.wait_for_checkpoints()
+
+    def on_test_end(self):
+        if self.attention_renderer is not None:
+            self.attention_renderer.wait()
+        self.wait_for_checkpoints()
         
     def plot_pr_curves(self, recall, precision, is_wandb):
         plt.figure(figsize=(20, 10), dpi=80)
@@ -265,6 +360,18 @@ class Engine(LightningModule):
         #plt.show()
         plt.close()
         
+def build_engine(checkpoint, **overrides):
+    ''' rebuilds an Engine from a checkpoint loaded with read_checkpoint, the stored hyperparameters are the arguments of
+    the Engine except for the overrides '''
+    hparams = {**checkpoint["hyper_parameters"], **overrides}
+    arguments = inspect.signature(Engine.__init__).parameters
+    engine = Engine(**{key: value for key, value in hparams.items() if key in arguments})
+    engine.load_state_dict(checkpoint["state_dict"])
+    # the average starts from the loaded weights, not from the random initialization
+    engine.ema.copy_from()
+    return engine
+
+
 def compute_most_attended(att_feature):
     ''' att_feature: list of tensors of shape (num_samples, num_layers, 2, num_heads, num_features) '''
     att_feature = np.stack(att_feature)
@@ -8,13 +8,20 @@ class MLPLOB(nn.Module):
                  num_layers: int,
                  seq_size: int,
                  num_features: int,
-                 dataset_type: str
+                 dataset_type: str,
+                 num_horizons: int = 1,
+                 is_multi_head: bool = False
                  ) -> None:
         super().__init__()
         
         self.hidden_dim = hidden_dim
         self.num_layers = num_layers
         self.dataset_type = dataset_type
+        self.num_horizons = num_horizons
+        self.is_multi_head = is_multi_head or num_horizons > 1
+        self.is_lobster = dataset_type == "LOBSTER"
+        # indices of the continuous features of LOBSTER inputs, the order type (column 41) is embedded apart
+        self.register_buffer("continuous_features", torch.tensor([i for i in range(num_features) if i != 41]), persistent=False)
         self.layers = nn.ModuleList()
         self.order_type_embedder = nn.Embedding(3, 1)
         self.first_layer = nn.Linear(num_features, hidden_dim)
@@ -35,11 +42,12 @@ class MLPLOB(nn.Module):
             self.final_layers.append(nn.Linear(total_dim, total_dim//4))
             self.final_layers.append(nn.GELU())
             total_dim = total_dim//4
-        self.final_layers.append(nn.Linear(total_dim, 3))
+        # one 3-way head for each horizon on the shared backbone, stacked in a single linear layer
+        self.final_layers.append(nn.Linear(total_dim, 3*num_horizons))
     
     def forward(self, input):
-        if self.dataset_type == "LOBSTER":
-            continuous_features = torch.cat([input[:, :, :41], input[:, :, 42:]], dim=2)
+        if self.is_lobster:
+            continuous_features = input.index_select(2, self.continuous_features)
             order_type = input[:, :, 41].long()
             order_type_emb = self.order_type_embedder(order_type).detach()
             x = torch.cat([continuous_features, order_type_emb], dim=2)
@@ -54,6 +62,8 @@ class MLPLOB(nn.Module):
         x = x.reshape(x.shape[0], -1)
         for layer in self.final_layers:
             x = layer(x)
+        if self.is_multi_head:
+            x = x.view(x.shape[0], self.num_horizons, 3)
         return x
         
         
@@ -36,10 +36,10 @@ class TransformerLayer(nn.Module):
         self.mlp = MLP(hidden_dim, hidden_dim*4, final_dim)
         self.w0 = nn.Linear(hidden_dim*num_heads, hidden_dim)
         
-    def forward(self, x):
+    def forward(self, x, need_weights=False):
         res = x
         q, k, v = self.qkv(x)
-        x, att = self.attention(q, k, v, average_attn_weights=False, need_weights=True)
+        x, att = self.attention(q, k, v, average_attn_weights=False, need_weights=need_weights)
         x = self.w0(x)
         x = x + res
         x = self.norm(x)
@@ -57,7 +57,10 @@ class TLOB(nn.Module):
                  num_features: int,
                  num_heads: int,
                  is_sin_emb: bool,
-                 dataset_type: str
+                 dataset_type: str,
+                 num_horizons: int = 1,
+                 early_exit: bool = False,
+                 is_multi_head: bool = False
                  ) -> None:
         super().__init__()
         
@@ -67,6 +70,11 @@ class TLOB(nn.Module):
         self.seq_size = seq_size
         self.num_heads = num_heads
         self.dataset_type = dataset_type
+        self.num_horizons = num_horizons
+        self.is_multi_head = is_multi_head or num_horizons > 1
+        self.is_lobster = dataset_type == "LOBSTER"
+        # indices of the continuous features of LOBSTER inputs, the order type (column 41) is embedded apart
+        self.register_buffer("continuous_features", torch.tensor([i for i in range(num_features) if i != 41]), persistent=False)
         self.layers = nn.ModuleList()
         self.first_branch = nn.ModuleList()
         self.second_branch = nn.ModuleList()
@@ -94,12 +102,19 @@ class TLOB(nn.Module):
             self.final_layers.append(nn.Linear(total_dim, total_dim//4))
             self.final_layers.append(nn.GELU())
             total_dim = total_dim//4
-        self.final_layers.append(nn.Linear(total_dim, 3))
+        # one 3-way head for each horizon on the shared backbone, stacked in a single linear layer
+        self.final_layers.append(nn.Linear(total_dim, 3*num_horizons))
+        # exit heads on the mean over the sequence after each pair of layers but the last, trained with the final head
+        self.exit_heads = nn.ModuleList()
+        if early_exit:
+            for _ in range(num_layers-1):
+                self.exit_heads.append(nn.Sequential(nn.LayerNorm(hidden_dim), nn.Linear(hidden_dim, 3*num_horizons)))
+        # with exit heads, the inference stops at the first head whose confidence reaches the threshold, 0 runs all the layers
+        self.exit_threshold = 0.0
         
-    
-    def forward(self, input, store_att=False):
-        if self.dataset_type == "LOBSTER":
-            continuous_features = torch.cat([input[:, :, :41], input[:, :, 42:]], dim=2)
+    def embed(self, input):
+        if self.is_lobster:
+            continuous_features = input.index_select(2, self.continuous_features)
             order_type = input[:, :, 41].long()
             order_type_emb = self.order_type_embedder(order_type).detach()
             x = torch.cat([continuous_features, order_type_emb], dim=2)
@@ -109,17 +124,85 @@ class TLOB(nn.Module):
         x = self.norm_layer(x)
         x = rearrange(x, 'b f s -> b s f')
         x = self.emb_layer(x)
-        x = x[:] + self.pos_encoder
-        mean_att_distance_temporal = np.zeros((self.num_layers, self.num_heads))
-        att_max_temporal = np.zeros((self.num_layers, 2, self.num_heads, self.seq_size))
-        att_max_feature = np.zeros((self.num_layers-1, 2, self.num_heads, self.hidden_dim))
-        att_temporal = np.zeros((self.num_layers, self.num_heads, self.seq_size, self.seq_size))
-        att_feature = np.zeros((self.num_layers-1, self.num_heads, self.hidden_dim, self.hidden_dim))
+        return x[:] + self.pos_encoder
+
+    def classify(self, x):
+        x = rearrange(x, 'b s f -> b (f s) 1')              
+        x = x.reshape(x.shape[0], -1)
+        for layer in self.final_layers:
+            x = layer(x)
+        if self.is_multi_head:
+            x = x.view(x.shape[0], self.num_horizons, 3)
+        return x
+
+    def block(self, i, x):
+        ''' the i-th pair of a temporal and a feature layer '''
+        for layer in self.layers[2*i:2*i+2]:
+            x, _ = layer(x)
+            x = x.permute(0, 2, 1)
+        return x
+
+    def exit_output(self, i, x):
+        x = self.exit_heads[i](x.mean(dim=1))
+        if self.is_multi_head:
+            x = x.view(x.shape[0], self.num_horizons, 3)
+        return x
+
+    def forward_exits(self, input):
+        ''' the outputs of the exit heads and of the final layers, in the order of the layers, for the joint training '''
+        x = self.embed(input)
+        outputs = []
+        for i in range(self.num_layers):
+            x = self.block(i, x)
+            outputs.append(self.exit_output(i, x) if i < self.num_layers-1 else self.classify(x))
+        return outputs
+
+    def early_exit(self, input, threshold):
+        ''' runs the pairs of layers on the windows of the batch until the max softmax probability of an exit head
+        reaches threshold, for every horizon, and drops the windows that exit from the following layers. Returns the
+        outputs and the number of pairs of layers run for each window '''
+        x = self.embed(input)
+        batch_size = x.shape[0]
+        output = x.new_empty((batch_size, self.num_horizons, 3) if self.is_multi_head else (batch_size, 3))
+        num_layers_run = torch.full((batch_size,), self.num_layers, dtype=torch.long, device=x.device)
+        remaining = torch.arange(batch_size, device=x.device)
+        for i in range(self.num_layers):
+            x = self.block(i, x)
+            if i == self.num_layers-1:
+                output[remaining] = self.classify(x)
+                break
+            exit_output = self.exit_output(i, x)
+            confidence = torch.softmax(exit_output, dim=-1).amax(dim=-1)
+            if self.is_multi_head:
+                confidence = confidence.amin(dim=-1)
+            done = confidence >= threshold
+            if done.any():
+                output[remaining[done]] = exit_output[done]
+                num_layers_run[remaining[done]] = i+1
+                remaining, x = remaining[~done], x[~done]
+                if remaining.numel() == 0:
+                    break
+        return output, num_layers_run
+    
+    def forward(self, input, store_att=False):
+        if self.exit_threshold > 0 and len(self.exit_heads) > 0 and not self.training and not store_att:
+            output, _ = self.early_exit(input, self.exit_threshold)
+            return output, None, None
+        x = self.embed(input)
+        # the attention maps are collected with numpy only when requested, so that the default path can be compiled without graph breaks
+        att_temporal, att_feature = None, None
+        if store_att:
+            mean_att_distance_temporal = np.zeros((self.num_layers, self.num_heads))
+            att_max_temporal = np.zeros((self.num_layers, 2, self.num_heads, self.seq_size))
+            att_max_feature = np.zeros((self.num_layers-1, 2, self.num_heads, self.hidden_dim))
+            # the full maps are kept in float16, they are only rendered
+            att_temporal = np.zeros((self.num_layers, self.num_heads, self.seq_size, self.seq_size), dtype=np.float16)
+            att_feature = np.zeros((self.num_layers-1, self.num_heads, self.hidden_dim, self.hidden_dim), dtype=np.float16)
         for i in range(len(self.layers)):
-            x, att = self.layers[i](x)
-            att = att.detach()
+            x, att = self.layers[i](x, store_att)
             x = x.permute(0, 2, 1)
             if store_att:
+                att = att.detach().float()
                 if i % 2 == 0:
                     att_temporal[i//2] = att[0].cpu().numpy()
                     values, indices = att[0].max(dim=2)
@@ -131,15 +214,11 @@ class TLOB(nn.Module):
                     values, indices = att[0].max(dim=2)
                     att_max_feature[i//2, 0] = indices.cpu().numpy()
                     att_max_feature[i//2, 1] = values.cpu().numpy()
-        self.mean_att_distance_temporal.append(mean_att_distance_temporal)
         if store_att:
+            self.mean_att_distance_temporal.append(mean_att_distance_temporal)
             self.att_temporal.append(att_max_temporal)
             self.att_feature.append(att_max_feature)
-        x = rearrange(x, 'b s f -> b (f s) 1')              
-        x = x.reshape(x.shape[0], -1)
-        for layer in self.final_layers:
-            x = layer(x)
-        return x, att_temporal, att_feature
+        return self.classify(x), att_temporal, att_feature
     
     
 def sinusoidal_positional_embedding(token_sequence_size, token_embedding_dim, n=10000.0):
@@ -165,13 +244,10 @@ def count_parameters(layer):
     
 
 def compute_mean_att_distance(att):
-    att_distances = np.zeros((att.shape[0], att.shape[1]))
-    for h in range(att.shape[0]):
-        for key in range(att.shape[2]):
-            for query in range(att.shape[1]):
-                distance = abs(query-key)
-                att_distances[h, key] += torch.abs(att[h, query, key]).cpu().item()*distance
-    mean_distances = att_distances.mean(axis=1)
-    return mean_distances
+    ''' att: (num_heads, queries, keys), returns the mean over the keys of the attention weighted |query - key| of each head '''
+    positions = torch.arange(att.shape[1], device=att.device)
+    distances = (positions[:, None] - positions[None, :]).abs().to(att.dtype)
+    att_distances = (att.abs() * distances).sum(dim=1)
+    return att_distances.mean(dim=1).cpu().numpy()
     
     
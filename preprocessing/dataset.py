@@ -7,6 +7,8 @@ import constants as cst
 import time
 from torch.utils import data
 from utils.utils_data import one_hot_encoding_type, tanh_encoding_type
+from preprocessing.fi_2010 import fi_2010_load
+from preprocessing.lobster import lobster_load
 
 class Dataset(data.Dataset):
     """Characterizes a dataset for PyTorch"""
@@ -29,13 +31,44 @@ class Dataset(data.Dataset):
     def __getitem__(self, i):
         input = self.x[i:i+self.seq_size, :]
         return input, self.y[i]
-    
 
 
+class DistillationDataset(Dataset):
+    """Dataset whose samples carry also the soft targets of a teacher, given by the last row of each window"""
+    def __init__(self, x, y, seq_size, teacher_targets):
+        super().__init__(x, y, seq_size)
+        self.teacher_targets = teacher_targets
+
+    def __getitem__(self, i):
+        input, label = super().__getitem__(i)
+        return input, label, self.teacher_targets[i + self.seq_size - 1]
+
+
+def load_split(dataset_type, split, seq_size, horizon, all_features, stock=None):
+    """Loads the train, val or test split of a preprocessed dataset"""
+    if dataset_type == cst.Dataset.LOBSTER.value:
+        path = cst.DATA_DIR + "/" + stock + "/" + split + ".npy"
+        input, labels = lobster_load(path, all_features, cst.LEN_SMOOTH, horizon, seq_size)
+    else:
+        train_input, train_labels, val_input, val_labels, test_input, test_labels = fi_2010_load(cst.DATA_DIR + "/FI_2010", seq_size, horizon, all_features)
+        input, labels = {
+            "train": (train_input, train_labels),
+            "val": (val_input, val_labels),
+            "test": (test_input, test_labels),
+        }[split]
+    return Dataset(input, labels, seq_size)
+
+
+def load_test_sets(dataset_type, seq_size, horizon, all_features, stocks):
+    """Loads the test split of FI-2010, or of each of the stocks for LOBSTER, by the name of the test set"""
+    if dataset_type == cst.Dataset.LOBSTER.value:
+        return {stock: load_split(dataset_type, "test", seq_size, horizon, all_features, stock) for stock in stocks}
+    return {"FI-2010": load_split(dataset_type, "test", seq_size, horizon, all_features)}
+
         
     
 class DataModule(pl.LightningDataModule):
-    def   __init__(self, train_set, val_set, batch_size, test_batch_size,  is_shuffle_train=True, test_set=None, num_workers=16):
+    def   __init__(self, train_set, val_set, batch_size, test_batch_size,  is_shuffle_train=True, test_set=None, num_workers=4):
         super().__init__()
 
         self.train_set = train_set
@@ -58,7 +91,7 @@ class DataModule(pl.LightningDataModule):
             pin_memory=self.pin_memory,
             drop_last=False,
             num_workers=self.num_workers,
-            persistent_workers=True
+            persistent_workers=self.num_workers > 0
         )
 
     def val_dataloader(self):
@@ -69,18 +102,18 @@ class DataModule(pl.LightningDataModule):
             pin_memory=self.pin_memory,
             drop_last=False,
             num_workers=self.num_workers,
-            persistent_workers=True
+            persistent_workers=self.num_workers > 0
         )
     
-    def test_dataloader(self):
+    def test_dataloader(self, test_set=None):
         return DataLoader(
-            dataset=self.test_set,
+            dataset=self.test_set if test_set is None else test_set,
             batch_size=self.test_batch_size,
             shuffle=False,
             pin_memory=self.pin_memory,
             drop_last=False,
             num_workers=self.num_workers,
-            persistent_workers=True
+            persistent_workers=self.num_workers > 0
         )
 
         
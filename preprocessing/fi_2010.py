@@ -4,6 +4,9 @@ import os
 from torch.utils import data
 import torch
 
+# position from the end of the label rows of each horizon, the last rows of the files in the order of FI_2010_HORIZONS
+FI_2010_LABEL_ROWS = {horizon: len(cst.FI_2010_HORIZONS) - i for i, horizon in enumerate(cst.FI_2010_HORIZONS)}
+
   
 def fi_2010_load(path, seq_size, horizon, all_features):
     dec_data = np.loadtxt(path + "/Train_Dst_NoAuction_ZScore_CF_7.txt")
@@ -14,22 +17,19 @@ def fi_2010_load(path, seq_size, horizon, all_features):
     dec_test3 = np.loadtxt(path + '/Test_Dst_NoAuction_ZScore_CF_9.txt')
     full_test = np.hstack((dec_test1, dec_test2, dec_test3))
     
-    if horizon == 1:
-        tmp = 5
-    elif horizon == 2:
-        tmp = 4
-    elif horizon == 3:
-        tmp = 3
-    elif horizon == 5:
-        tmp = 2
-    elif horizon == 10:
-        tmp = 1
-    else:
-        raise ValueError("Horizon not found")
+    # with a list of horizons the labels have one column per horizon
+    horizons = horizon if isinstance(horizon, (list, tuple)) else [horizon]
+    rows = []
+    for h in horizons:
+        if h not in FI_2010_LABEL_ROWS:
+            raise ValueError(f"Horizon {h} not found, the FI-2010 horizons are {cst.FI_2010_HORIZONS}")
+        rows.append(-FI_2010_LABEL_ROWS[h])
     
-    train_labels = full_train[-tmp, :].flatten()
-    val_labels = full_val[-tmp, :].flatten()
-    test_labels = full_test[-tmp, :].flatten()
+    train_labels = full_train[rows, :].T
+    val_labels = full_val[rows, :].T
+    test_labels = full_test[rows, :].T
+    if not isinstance(horizon, (list, tuple)):
+        train_labels, val_labels, test_labels = train_labels[:, 0], val_labels[:, 0], test_labels[:, 0]
     
     train_labels = train_labels[seq_size-1:] - 1
     val_labels = val_labels[seq_size-1:] - 1
@@ -43,11 +43,11 @@ def fi_2010_load(path, seq_size, horizon, all_features):
         val_input = full_val[:40, :].T
         test_input = full_test[:40, :].T
     train_input = torch.from_numpy(train_input).float()
-    train_labels = torch.from_numpy(train_labels).long()
+    train_labels = torch.from_numpy(np.ascontiguousarray(train_labels)).long()
     val_input = torch.from_numpy(val_input).float()
-    val_labels = torch.from_numpy(val_labels).long()
+    val_labels = torch.from_numpy(np.ascontiguousarray(val_labels)).long()
     test_input = torch.from_numpy(test_input).float()
-    test_labels = torch.from_numpy(test_labels).long()
+    test_labels = torch.from_numpy(np.ascontiguousarray(test_labels)).long()
     return train_input, train_labels, val_input, val_labels, test_input, test_labels
     
     
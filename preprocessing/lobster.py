@@ -1,26 +1,42 @@
 import os
-from utils.utils_data import z_score_orderbook, normalize_messages, preprocess_data, one_hot_encoding_type
+from utils.utils_data import z_score_orderbook, normalize_messages, preprocess_data, one_hot_encoding_type, save_normalization_stats
 import pandas as pd
 import numpy as np
 import torch
 import constants as cst
 from torch.utils import data
 
+# position from the end of the label columns of each horizon, written by LOBSTERDataBuilder in the order of LOBSTER_HORIZONS
+LOBSTER_LABEL_COLUMNS = {horizon: len(cst.LOBSTER_HORIZONS) - i for i, horizon in enumerate(cst.LOBSTER_HORIZONS)}
+# columns of the orderbook and message files of LOBSTER
+COLUMNS_NAMES = {"orderbook": ["sell1", "vsell1", "buy1", "vbuy1",
+                              "sell2", "vsell2", "buy2", "vbuy2",
+                              "sell3", "vsell3", "buy3", "vbuy3",
+                              "sell4", "vsell4", "buy4", "vbuy4",
+                              "sell5", "vsell5", "buy5", "vbuy5",
+                              "sell6", "vsell6", "buy6", "vbuy6",
+                              "sell7", "vsell7", "buy7", "vbuy7",
+                              "sell8", "vsell8", "buy8", "vbuy8",
+                              "sell9", "vsell9", "buy9", "vbuy9",
+                              "sell10", "vsell10", "buy10", "vbuy10"],
+                 "message": ["time", "event_type", "order_id", "size", "price", "direction"]}
+
 
 def lobster_load(path, all_features, len_smooth, h, seq_size):
     set = np.load(path)
-    if h == 10:
-        tmp = 5
-    if h == 20:
-        tmp = 4
-    elif h == 50:
-        tmp = 3
-    elif h == 100:
-        tmp = 2
-    elif h == 200:
-        tmp = 1
-    labels = set[seq_size-len_smooth:, -tmp]
-    labels = labels[np.isfinite(labels)]
+    # the labels of the horizons 10, 20, 50 and 100 are the last 4 columns, with a list of horizons the labels
+    # have one column per horizon and are cut to the samples that have the labels of every horizon
+    horizons = h if isinstance(h, (list, tuple)) else [h]
+    columns = []
+    for horizon in horizons:
+        if horizon not in LOBSTER_LABEL_COLUMNS:
+            raise ValueError("Horizon not found")
+        columns.append(-LOBSTER_LABEL_COLUMNS[horizon])
+    labels = set[seq_size-len_smooth:, columns]
+    labels = labels[np.isfinite(labels).all(axis=1)]
+    if not isinstance(h, (list, tuple)):
+        labels = labels[:, 0]
+    labels = np.ascontiguousarray(labels)
     labels = torch.from_numpy(labels).long()
     if all_features:
         input = set[:, cst.LEN_ORDER:cst.LEN_ORDER + 40]
@@ -121,17 +137,6 @@ class LOBSTERDataBuilder:
 
 
     def _prepare_dataframes(self, path, stock):
-        COLUMNS_NAMES = {"orderbook": ["sell1", "vsell1", "buy1", "vbuy1",
-                                       "sell2", "vsell2", "buy2", "vbuy2",
-                                       "sell3", "vsell3", "buy3", "vbuy3",
-                                       "sell4", "vsell4", "buy4", "vbuy4",
-                                       "sell5", "vsell5", "buy5", "vbuy5",
-                                       "sell6", "vsell6", "buy6", "vbuy6",
-                                       "sell7", "vsell7", "buy7", "vbuy7",
-                                       "sell8", "vsell8", "buy8", "vbuy8",
-                                       "sell9", "vsell9", "buy9", "vbuy9",
-                                       "sell10", "vsell10", "buy10", "vbuy10"],
-                         "message": ["time", "event_type", "order_id", "size", "price", "direction"]}
         self.num_trading_days = len(os.listdir(path))//2
         split_days = self._split_days()
         split_days = [i * 2 for i in split_days]
@@ -300,6 +305,11 @@ class LOBSTERDataBuilder:
         for i in range(len(self.dataframes)):
             if (i == 0):
                 self.dataframes[i][1], mean_size, mean_prices, std_size, std_prices = z_score_orderbook(self.dataframes[i][1])
+                # the statistics of the train set are saved with the splits, to normalize the live events in the same way
+                self.normalization_stats = {
+                    "orderbook_mean_size": mean_size, "orderbook_std_size": std_size,
+                    "orderbook_mean_price": mean_prices, "orderbook_std_price": std_prices,
+                }
             else:
                 self.dataframes[i][1], _, _, _, _ = z_score_orderbook(self.dataframes[i][1], mean_size, mean_prices, std_size, std_prices)
 
@@ -307,6 +317,12 @@ class LOBSTERDataBuilder:
         for i in range(len(self.dataframes)):
             if (i == 0):
                 self.dataframes[i][0], mean_size, mean_prices, std_size, std_prices, mean_time, std_time, mean_depth, std_depth = normalize_messages(self.dataframes[i][0])
+                self.normalization_stats.update({
+                    "message_mean_size": mean_size, "message_std_size": std_size,
+                    "message_mean_price": mean_prices, "message_std_price": std_prices,
+                    "message_mean_time": mean_time, "message_std_time": std_time,
+                    "message_mean_depth": mean_depth, "message_std_depth": std_depth,
+                })
             else:
                 self.dataframes[i][0], _, _, _, _, _, _, _, _ = normalize_messages(self.dataframes[i][0], mean_size, mean_prices, std_size, std_prices, mean_time, std_time, mean_depth, std_depth)
 
@@ -314,6 +330,7 @@ class LOBSTERDataBuilder:
         np.save(path_where_to_save + "/train.npy", self.train_set)
         np.save(path_where_to_save + "/val.npy", self.val_set)
         np.save(path_where_to_save + "/test.npy", self.test_set)
+        save_normalization_stats(path_where_to_save, self.normalization_stats)
 
 
     def _split_days(self):
@@ -1,4 +1,5 @@
 import zipfile
+from enum import Enum
 import lightning as L
 import omegaconf
 import torch
@@ -11,10 +12,13 @@ from torch.utils.data import DataLoader
 from lightning.pytorch.callbacks import TQDMProgressBar
 from lightning.pytorch.callbacks.early_stopping import EarlyStopping
 from config.config import Config
-from models.engine import Engine
+from utils.utils_distributed import distributed_trainer_args, ThreadPinning
+from models.engine import Engine, build_engine
+from utils.utils_checkpoint import read_checkpoint
 from preprocessing.fi_2010 import fi_2010_load
 from preprocessing.lobster import lobster_load
-from preprocessing.dataset import Dataset, DataModule
+from preprocessing.dataset import Dataset, DataModule, DistillationDataset
+from utils.utils_distillation import load_teacher_targets, distillation_report
 import constants as cst
 
 
@@ -27,11 +31,11 @@ def run(config: Config, accelerator, model=None):
         if type(value) == omegaconf.dictconfig.DictConfig:
             for key in value.keys():
                 run_name += str(key[:2]) + "_" + str(value[key]) + "_"
-        else:
+        elif isinstance(value, Enum):
             run_name += str(param[:2]) + "_" + str(value.value) + "_"
     run_name += f"seed_{config.experiment.seed}"
     seq_size = config.model.hyperparameters_fixed["seq_size"]
-    horizon = config.experiment.horizon
+    horizon = horizon_name(config)
     training_stocks = config.experiment.training_stocks
     dataset = config.experiment.dataset_type.value
     if dataset == "LOBSTER":
@@ -40,277 +44,179 @@ def run(config: Config, accelerator, model=None):
         config.experiment.filename_ckpt = f"{dataset}_seq_size_{seq_size}_horizon_{horizon}_{run_name}"
     run_name = config.experiment.filename_ckpt
 
+    callbacks = [
+        EarlyStopping(monitor="val_loss", mode="min", patience=2, verbose=True, min_delta=0.002),
+        TQDMProgressBar(refresh_rate=100)
+        ]
+    if config.experiment.num_processes > 1:
+        callbacks.append(ThreadPinning(config.experiment.num_processes))
     trainer = L.Trainer(
         accelerator=accelerator,
         precision=cst.PRECISION,
         max_epochs=config.experiment.max_epochs,
-        callbacks=[
-            EarlyStopping(monitor="val_loss", mode="min", patience=2, verbose=True, min_delta=0.002),
-            TQDMProgressBar(refresh_rate=100)
-            ],
+        callbacks=callbacks,
         num_sanity_val_steps=0,
         detect_anomaly=False,
         profiler=None,
-        check_val_every_n_epoch=1
+        check_val_every_n_epoch=1,
+        **distributed_trainer_args(config.experiment.num_processes, config.experiment.num_nodes)
     )
-    train(config, trainer)
+    train(config, trainer, num_workers=config.experiment.num_workers)
 
 
-def train(config: Config, trainer: L.Trainer, run=None):
-    print_setup(config)
+def horizon_name(config: Config):
+    ''' horizon of the checkpoint names, the horizons joined by _ for the multi-head models '''
+    if config.experiment.horizons:
+        return "_".join(str(h) for h in config.experiment.horizons)
+    return config.experiment.horizon
+
+
+def load_data(config: Config):
+    ''' returns the train set, the val set and the list of test sets of the experiment, one for each testing stock for LOBSTER.
+    With experiment.horizons the labels have one column for each horizon '''
     dataset_type = config.experiment.dataset_type.value
     seq_size = config.model.hyperparameters_fixed["seq_size"]
     horizon = config.experiment.horizon
-    model_type = config.model.type
+    if config.experiment.horizons:
+        horizon = list(config.experiment.horizons)
     training_stocks = config.experiment.training_stocks
     testing_stocks = config.experiment.testing_stocks
-    dataset_type = config.experiment.dataset_type.value
-    if dataset_type == "FI-2010":
+    if dataset_type == cst.Dataset.FI_2010.value:
         path = cst.DATA_DIR + "/FI_2010"
         train_input, train_labels, val_input, val_labels, test_input, test_labels = fi_2010_load(path, seq_size, horizon, config.model.hyperparameters_fixed["all_features"])
-        data_module = DataModule(
-            train_set=Dataset(train_input, train_labels, seq_size),
-            val_set=Dataset(val_input, val_labels, seq_size),
-            test_set=Dataset(test_input, test_labels, seq_size),
-            batch_size=config.experiment.batch_size,
-            test_batch_size=config.experiment.batch_size*4,
-            num_workers=4
-        )
-        test_loaders = [data_module.test_dataloader()]
-    else:
-        for i in range(len(training_stocks)):
-            if i == 0:
-                for j in range(2):
-                    if j == 0:
-                        path = cst.DATA_DIR + "/" + training_stocks[i] + "/train.npy"
-                        train_input, train_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
-                    if j == 1:
-                        path = cst.DATA_DIR + "/" + training_stocks[i] + "/val.npy"
-                        val_input, val_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
-            else:
-                for j in range(2):
-                    if j == 0:
-                        path = cst.DATA_DIR + "/" + training_stocks[i] + "/train.npy"
-                        train_labels = torch.cat((train_labels, torch.zeros(seq_size+horizon-1, dtype=torch.long)), 0)
-                        train_input_tmp, train_labels_tmp = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
-                        train_input = torch.cat((train_input, train_input_tmp), 0)
-                        train_labels = torch.cat((train_labels, train_labels_tmp), 0)
-                    if j == 1:
-                        path = cst.DATA_DIR + "/" + training_stocks[i] + "/val.npy"
-                        val_labels = torch.cat((val_labels, torch.zeros(seq_size+horizon-1, dtype=torch.long)), 0)
-                        val_input_tmp, val_labels_tmp = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
-                        val_input = torch.cat((val_input, val_input_tmp), 0)
-                        val_labels = torch.cat((val_labels, val_labels_tmp), 0)
-        test_loaders = []
-        for i in range(len(testing_stocks)):
-            path = cst.DATA_DIR + "/" + testing_stocks[i] + "/test.npy"
-            test_input, test_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
-            test_set = Dataset(test_input, test_labels, seq_size)
-            test_dataloader = DataLoader(
-            dataset=test_set,
-            batch_size=config.experiment.batch_size*4,
-            shuffle=False,
-            pin_memory=True,
-            drop_last=False,
-            num_workers=4,
-            persistent_workers=True
-        )
-            test_loaders.append(test_dataloader)
-            train_set = Dataset(train_input, train_labels, seq_size)
-        val_set = Dataset(val_input, val_labels, seq_size)
-        counts_train = torch.unique(train_labels, return_counts=True)
-        counts_val = torch.unique(val_labels, return_counts=True)
-        print("Train set shape: ", train_input.shape)
-        print("Val set shape: ", val_input.shape)
-        print("Classes counts in train set: ", counts_train[1])
-        print("Classes counts in val set: ", counts_val[1])
-        print(f"Classes distribution in train set: up {counts_train[1][0]/train_labels.shape[0]} stat {counts_train[1][1]/train_labels.shape[0]} down {counts_train[1][2]/train_labels.shape[0]} ", )
-        print(f"Classes distribution in val set: up {counts_val[1][0]/val_labels.shape[0]} stat {counts_val[1][1]/val_labels.shape[0]} down {counts_val[1][2]/val_labels.shape[0]} ", )
-        data_module = DataModule(
-            train_set=train_set,
-            val_set=val_set,
-            batch_size=config.experiment.batch_size,
-            test_batch_size=config.experiment.batch_size*4,
-            num_workers=4
-        )
-        
+        return Dataset(train_input, train_labels, seq_size), Dataset(val_input, val_labels, seq_size), [Dataset(test_input, test_labels, seq_size)]
+    max_horizon = max(horizon) if isinstance(horizon, list) else horizon
+    for i in range(len(training_stocks)):
+        if i == 0:
+            for j in range(2):
+                if j == 0:
+                    path = cst.DATA_DIR + "/" + training_stocks[i] + "/train.npy"
+                    train_input, train_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
+                if j == 1:
+                    path = cst.DATA_DIR + "/" + training_stocks[i] + "/val.npy"
+                    val_input, val_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
+        else:
+            for j in range(2):
+                if j == 0:
+                    path = cst.DATA_DIR + "/" + training_stocks[i] + "/train.npy"
+                    train_labels = torch.cat((train_labels, torch.zeros((seq_size+max_horizon-1,) + train_labels.shape[1:], dtype=torch.long)), 0)
+                    train_input_tmp, train_labels_tmp = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
+                    train_input = torch.cat((train_input, train_input_tmp), 0)
+                    train_labels = torch.cat((train_labels, train_labels_tmp), 0)
+                if j == 1:
+                    path = cst.DATA_DIR + "/" + training_stocks[i] + "/val.npy"
+                    val_labels = torch.cat((val_labels, torch.zeros((seq_size+max_horizon-1,) + val_labels.shape[1:], dtype=torch.long)), 0)
+                    val_input_tmp, val_labels_tmp = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
+                    val_input = torch.cat((val_input, val_input_tmp), 0)
+                    val_labels = torch.cat((val_labels, val_labels_tmp), 0)
+    test_sets = []
+    for i in range(len(testing_stocks)):
+        path = cst.DATA_DIR + "/" + testing_stocks[i] + "/test.npy"
+        test_input, test_labels = lobster_load(path, config.model.hyperparameters_fixed["all_features"], cst.LEN_SMOOTH, horizon, seq_size)
+        test_sets.append(Dataset(test_input, test_labels, seq_size))
+    train_set = Dataset(train_input, train_labels, seq_size)
+    val_set = Dataset(val_input, val_labels, seq_size)
+    counts_train = torch.unique(train_labels, return_counts=True)
+    counts_val = torch.unique(val_labels, return_counts=True)
+    print("Train set shape: ", train_input.shape)
+    print("Val set shape: ", val_input.shape)
+    print("Classes counts in train set: ", counts_train[1])
+    print("Classes counts in val set: ", counts_val[1])
+    print(f"Classes distribution in train set: up {counts_train[1][0]/train_labels.numel()} stat {counts_train[1][1]/train_labels.numel()} down {counts_train[1][2]/train_labels.numel()} ", )
+    print(f"Classes distribution in val set: up {counts_val[1][0]/val_labels.numel()} stat {counts_val[1][1]/val_labels.numel()} down {counts_val[1][2]/val_labels.numel()} ", )
+    return train_set, val_set, test_sets
+
+
+def train(config: Config, trainer: L.Trainer, run=None, datasets=None, num_workers=4, scheduler=None):
+    ''' trains and/or tests the model of the config and returns the best validation loss and the test outputs,
+    datasets are the train, val and test sets of load_data, loaded here if not given,
+    scheduler can stop the training at the end of a validation epoch, as the ASHAScheduler of the local sweep '''
+    print_setup(config)
+    dataset_type = config.experiment.dataset_type.value
+    seq_size = config.model.hyperparameters_fixed["seq_size"]
+    horizon = config.experiment.horizon
+    model_type = config.model.type
+    testing_stocks = config.experiment.testing_stocks
+    if datasets is None:
+        datasets = load_data(config)
+    train_set, val_set, test_sets = datasets
     experiment_type = config.experiment.type
+    teacher_path = config.experiment.teacher_checkpoint
+    is_distillation = teacher_path != "" and "TRAINING" in experiment_type
+    if is_distillation:
+        train_set, val_set = distillation_sets(config, train_set, val_set)
+    data_module = DataModule(
+        train_set=train_set,
+        val_set=val_set,
+        batch_size=config.experiment.batch_size,
+        test_batch_size=config.experiment.batch_size*4,
+        num_workers=num_workers
+    )
+    test_loaders = [data_module.test_dataloader(test_set) for test_set in test_sets]
+    num_features = train_set.data.shape[1]
+        
+    # options of the run, the same for a new and a loaded model
+    run_args = dict(
+        is_wandb=config.experiment.is_wandb,
+        experiment_type=experiment_type,
+        num_features=num_features,
+        dataset_type=dataset_type,
+        compile=config.model.compile,
+        precision=config.experiment.precision,
+        ema_decay=config.experiment.ema_decay,
+        ema_update_every=config.experiment.ema_update_every,
+        checkpoint_weights_only=config.experiment.checkpoint_weights_only,
+        checkpoint_keep_best=config.experiment.checkpoint_keep_best,
+        len_test_dataloader=len(test_loaders[0])
+    )
     if "FINETUNING" in experiment_type or "EVALUATION" in experiment_type:
-        checkpoint = config.experiment.checkpoint_reference
-        if checkpoint != "":
-            checkpoint = torch.load(config.experiment.checkpoint_reference, map_location=cst.DEVICE)
-        else:
-            # Find best checkpoint matching model type and horizon
+        checkpoint_path = config.experiment.checkpoint_reference
+        if checkpoint_path == "":
+            # the released checkpoint of the model type and horizon
             model_type_str = config.model.type.value
             checkpoints_dir = f"data/checkpoints/{model_type_str.upper()}/HuggingFace/"
             horizon_str = str(config.experiment.horizon)
-            
-            # Find all matching checkpoint files
-            checkpoint_name = f"FI-2010_horizon_{horizon_str}_{model_type_str.upper()}_seed_{config.experiment.seed}.ckpt"            
-            checkpoint = torch.load(checkpoints_dir + checkpoint_name, map_location=cst.DEVICE)
-            print(f"Selected checkpoint: {config.experiment.checkpoint_reference}")
-            
-        print("Loading model from checkpoint: ", config.experiment.checkpoint_reference) 
-        lr = checkpoint["hyper_parameters"]["lr"]
-        filename_ckpt = checkpoint["hyper_parameters"]["filename_ckpt"]
-        hidden_dim = checkpoint["hyper_parameters"]["hidden_dim"]
-        num_layers = checkpoint["hyper_parameters"]["num_layers"]
-        optimizer = checkpoint["hyper_parameters"]["optimizer"]
-        model_type = checkpoint["hyper_parameters"]["model_type"]
-        max_epochs = checkpoint["hyper_parameters"]["max_epochs"]
-        horizon = checkpoint["hyper_parameters"]["horizon"]
-        seq_size = checkpoint["hyper_parameters"]["seq_size"]
-        if model_type == "MLPLOB":
-            model = Engine.load_from_checkpoint(
-                config.experiment.checkpoint_reference, 
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=max_epochs,
-                model_type=model_type,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=lr,
-                optimizer=optimizer,
-                filename_ckpt=filename_ckpt,
-                hidden_dim=hidden_dim,
-                num_layers=num_layers,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                map_location=cst.DEVICE,
-                )
-        elif model_type == "TLOB":
-            model = Engine.load_from_checkpoint(
-                config.experiment.checkpoint_reference, 
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=max_epochs,
-                model_type=model_type,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=lr,
-                optimizer=optimizer,
-                filename_ckpt=filename_ckpt,
-                hidden_dim=hidden_dim,
-                num_layers=num_layers,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                num_heads=checkpoint["hyper_parameters"]["num_heads"],
-                is_sin_emb=checkpoint["hyper_parameters"]["is_sin_emb"],
-                map_location=cst.DEVICE,
-                len_test_dataloader=len(test_loaders[0])
-                )
-        elif model_type == "BINCTABL":
-            model = Engine.load_from_checkpoint(
-                config.experiment.checkpoint_reference, 
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=max_epochs,
-                model_type=model_type,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=lr,
-                optimizer=optimizer,
-                filename_ckpt=filename_ckpt,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                map_location=cst.DEVICE,
-                len_test_dataloader=len(test_loaders[0])
-                )
-        elif model_type == "DEEPLOB":
-            model = Engine.load_from_checkpoint(
-                config.experiment.checkpoint_reference, 
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=max_epochs,
-                model_type=model_type,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=lr,
-                optimizer=optimizer,
-                filename_ckpt=filename_ckpt,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                map_location=cst.DEVICE,
-                len_test_dataloader=len(test_loaders[0])
-                )
-              
+            checkpoint_path = checkpoints_dir + f"FI-2010_horizon_{horizon_str}_{model_type_str.upper()}_seed_{config.experiment.seed}.ckpt"
+            print(f"Selected checkpoint: {checkpoint_path}")
+
+        print("Loading model from checkpoint: ", checkpoint_path)
+        # the checkpoint is read once, the model is rebuilt from its hyperparameters
+        model = build_engine(read_checkpoint(checkpoint_path, map_location=cst.DEVICE), **run_args)
     else:
-        if model_type == cst.ModelType.MLPLOB:
-            model = Engine(
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=config.experiment.max_epochs,
-                model_type=config.model.type.value,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=config.model.hyperparameters_fixed["lr"],
-                optimizer=config.experiment.optimizer,
-                filename_ckpt=config.experiment.filename_ckpt,
-                hidden_dim=config.model.hyperparameters_fixed["hidden_dim"],
-                num_layers=config.model.hyperparameters_fixed["num_layers"],
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                len_test_dataloader=len(test_loaders[0])
-            )
-        elif model_type == cst.ModelType.TLOB:
-            model = Engine(
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=config.experiment.max_epochs,
-                model_type=config.model.type.value,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=config.model.hyperparameters_fixed["lr"],
-                optimizer=config.experiment.optimizer,
-                filename_ckpt=config.experiment.filename_ckpt,
-                hidden_dim=config.model.hyperparameters_fixed["hidden_dim"],
-                num_layers=config.model.hyperparameters_fixed["num_layers"],
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                num_heads=config.model.hyperparameters_fixed["num_heads"],
-                is_sin_emb=config.model.hyperparameters_fixed["is_sin_emb"],
-                len_test_dataloader=len(test_loaders[0])
-            )
-        elif model_type == cst.ModelType.BINCTABL:
-            model = Engine(
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=config.experiment.max_epochs,
-                model_type=config.model.type.value,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=config.model.hyperparameters_fixed["lr"],
-                optimizer=config.experiment.optimizer,
-                filename_ckpt=config.experiment.filename_ckpt,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                len_test_dataloader=len(test_loaders[0])
-            )
-        elif model_type == cst.ModelType.DEEPLOB:
-            model = Engine(
-                seq_size=seq_size,
-                horizon=horizon,
-                max_epochs=config.experiment.max_epochs,
-                model_type=config.model.type.value,
-                is_wandb=config.experiment.is_wandb,
-                experiment_type=experiment_type,
-                lr=config.model.hyperparameters_fixed["lr"],
-                optimizer=config.experiment.optimizer,
-                filename_ckpt=config.experiment.filename_ckpt,
-                num_features=train_input.shape[1],
-                dataset_type=dataset_type,
-                len_test_dataloader=len(test_loaders[0])
-            )
+        hyperparameters = config.model.hyperparameters_fixed
+        model_args = {}
+        if model_type in [cst.ModelType.MLPLOB, cst.ModelType.TLOB]:
+            model_args.update(hidden_dim=hyperparameters["hidden_dim"], num_layers=hyperparameters["num_layers"])
+        if model_type == cst.ModelType.TLOB:
+            model_args.update(num_heads=hyperparameters["num_heads"], is_sin_emb=hyperparameters["is_sin_emb"], early_exit=hyperparameters["early_exit"])
+        if is_distillation:
+            model_args.update(distillation_alpha=config.experiment.distillation_alpha, distillation_temperature=config.experiment.distillation_temperature)
+        model = Engine(
+            seq_size=seq_size,
+            horizon=horizon,
+            max_epochs=config.experiment.max_epochs,
+            model_type=config.model.type.value,
+            lr=hyperparameters["lr"],
+            optimizer=config.experiment.optimizer,
+            filename_ckpt=config.experiment.filename_ckpt,
+            horizons=list(config.experiment.horizons),
+            **model_args,
+            **run_args
+        )
     
-    print("total number of parameters: ", sum(p.numel() for p in model.parameters()))   
+    print("total number of parameters: ", sum(p.numel() for p in model.parameters()))
+    model.scheduler = scheduler   
     train_dataloader, val_dataloader = data_module.train_dataloader(), data_module.val_dataloader()
     
+    results = {"val_loss": None, "best_model_path": None, "test": []}
     if "TRAINING" in experiment_type or "FINETUNING" in experiment_type:
         trainer.fit(model, train_dataloader, val_dataloader)
         best_model_path = model.last_path_ckpt
+        results["val_loss"] = float(model.min_loss)
+        results["best_model_path"] = best_model_path
         print("Best model path: ", best_model_path) 
         try:
-            best_model = Engine.load_from_checkpoint(best_model_path, map_location=cst.DEVICE)
+            best_model = build_engine(read_checkpoint(best_model_path, map_location=cst.DEVICE))
         except: 
             print("no checkpoints has been saved, selecting the last model")
             best_model = model
@@ -318,20 +224,53 @@ def train(config: Config, trainer: L.Trainer, run=None):
         for i in range(len(test_loaders)):
             test_dataloader = test_loaders[i]
             output = trainer.test(best_model, test_dataloader)
+            results["test"].append(output[0])
             if run is not None and dataset_type == "LOBSTER":
                 run.log({f"f1 {testing_stocks[i]} best": output[0]["f1_score"]}, commit=False)
-            elif run is not None and dataset_type == "FI-2010":
+            elif run is not None and dataset_type == cst.Dataset.FI_2010.value:
                 run.log({f"f1 FI-2010 ": output[0]["f1_score"]}, commit=False)
+            if run is not None:
+                log_horizon_f1(run, output[0], testing_stocks[i] if dataset_type == "LOBSTER" else "FI-2010")
+        if is_distillation and best_model_path is not None:
+            # the latency against F1 trade-off of the student
+            results["distillation"] = distillation_report(teacher_path, best_model_path, config)
     else:
         for i in range(len(test_loaders)):
             test_dataloader = test_loaders[i]
             output = trainer.test(model, test_dataloader)
+            results["test"].append(output[0])
             if run is not None and dataset_type == "LOBSTER":
                 run.log({f"f1 {testing_stocks[i]} best": output[0]["f1_score"]}, commit=False)
-            elif run is not None and dataset_type == "FI-2010":
+            elif run is not None and dataset_type == cst.Dataset.FI_2010.value:
                 run.log({f"f1 FI-2010 ": output[0]["f1_score"]}, commit=False)
-            
-    
+            if run is not None:
+                log_horizon_f1(run, output[0], testing_stocks[i] if dataset_type == "LOBSTER" else "FI-2010")
+    return results
+
+
+def distillation_sets(config: Config, train_set, val_set):
+    ''' the train and val sets with the soft targets of the teacher of experiment.teacher_checkpoint, computed once for
+    each split and cached next to the checkpoint '''
+    horizons = list(config.experiment.horizons) or [config.experiment.horizon]
+    if config.experiment.dataset_type == cst.Dataset.LOBSTER:
+        data_name = "_".join(config.experiment.training_stocks)
+    else:
+        data_name = cst.Dataset.FI_2010.value
+    sets = []
+    for split, dataset in [("train", train_set), ("val", val_set)]:
+        teacher_targets = load_teacher_targets(config.experiment.teacher_checkpoint, dataset.x, horizons, data_name, split)
+        if not config.experiment.horizons:
+            teacher_targets = teacher_targets[:, 0]
+        sets.append(DistillationDataset(dataset.x, dataset.y, dataset.seq_size, teacher_targets))
+    return sets
+
+
+def log_horizon_f1(run, output, test_name):
+    ''' logs the test f1 score of each horizon of a multi-head model '''
+    for key, value in output.items():
+        if key.startswith("f1_score_h"):
+            run.log({f"f1 {test_name} {key[len('f1_score_'):]} best": value}, commit=False)
+
 
 def run_wandb(config: Config, accelerator):
     def wandb_sweep_callback():
@@ -346,7 +285,7 @@ def run_wandb(config: Config, accelerator):
                 if type(value) == omegaconf.dictconfig.DictConfig:
                     for key in value.keys():
                         run_name += str(key[:2]) + "_" + str(value[key]) + "_"
-                else:
+                elif isinstance(value, Enum):
                     run_name += str(param[:2]) + "_" + str(value.value) + "_"
 
         run = wandb.init(project=cst.PROJECT_NAME, name=run_name, entity="") # set entity to your wandb username
@@ -365,7 +304,7 @@ def run_wandb(config: Config, accelerator):
         
         run.name = wandb_instance_name
         seq_size = config.model.hyperparameters_fixed["seq_size"]
-        horizon = config.experiment.horizon
+        horizon = horizon_name(config)
         dataset = config.experiment.dataset_type.value
         training_stocks = config.experiment.training_stocks
         if dataset == "LOBSTER":
@@ -403,7 +342,7 @@ def run_wandb(config: Config, accelerator):
                 run.log({"sampling_time": config.experiment.sampling_time}, commit=False)
             else:
                 run.log({"sampling_quantity": config.experiment.sampling_quantity}, commit=False)
-        train(config, trainer, run)
+        train(config, trainer, run, num_workers=config.experiment.num_workers)
         run.finish()
 
     return wandb_sweep_callback
@@ -423,8 +362,8 @@ def sweep_init(config: Config):
         },
         'early_terminate': {
             'type': 'hyperband',
-            'min_iter': 3,
-            'eta': 1.5
+            'min_iter': config.experiment.sweep_min_iter,
+            'eta': config.experiment.sweep_eta
         },
         'run_cap': 100,
         'parameters': {**parameters}
@@ -438,12 +377,16 @@ def print_setup(config: Config):
     print("Seed: ", config.experiment.seed)
     print("Sequence size: ", config.model.hyperparameters_fixed["seq_size"])
     print("Horizon: ", config.experiment.horizon)
+    if config.experiment.horizons:
+        print("Horizons: ", config.experiment.horizons)
     print("All features: ", config.model.hyperparameters_fixed["all_features"])
     print("Is data preprocessed: ", config.experiment.is_data_preprocessed)
     print("Is wandb: ", config.experiment.is_wandb)
     print("Is sweep: ", config.experiment.is_sweep)
     print(config.experiment.type)
     print("Is debug: ", config.experiment.is_debug) 
+    if config.experiment.teacher_checkpoint != "":
+        print("Teacher checkpoint: ", config.experiment.teacher_checkpoint)
     if config.experiment.dataset_type == cst.Dataset.LOBSTER:
         print("Training stocks: ", config.experiment.training_stocks)
         print("Testing stocks: ", config.experiment.testing_stocks)
@@ -0,0 +1,176 @@
+import copy
+import csv
+import itertools
+import os
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import lightning as L
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from lightning.pytorch.callbacks.early_stopping import EarlyStopping
+from config.config import Config
+from run import horizon_name, load_data, train
+from utils.utils_benchmark import available_cores
+import constants as cst
+
+# datasets of the worker process, one (train_set, val_set, test_sets) for each seq_size of the sweep
+_datasets = {}
+
+
+def expand_sweep(hyperparameters_sweep, method="grid", num_trials=10, seed=42):
+    ''' returns the list of the hyperparameters of each trial, all the combinations of the values of
+    hyperparameters_sweep for grid or num_trials combinations drawn without replacement for random '''
+    keys = list(hyperparameters_sweep.keys())
+    grid = [dict(zip(keys, values)) for values in itertools.product(*[list(hyperparameters_sweep[key]) for key in keys])]
+    if method == "grid":
+        return grid
+    elif method == "random":
+        return random.Random(seed).sample(grid, min(num_trials, len(grid)))
+    else:
+        raise ValueError("Sweep method not found")
+
+
+def successive_halving_rungs(min_iter, eta, max_iter):
+    ''' epochs at which the trials are compared, min_iter * eta^k rounded up and below max_iter '''
+    rungs = []
+    rung = float(min_iter)
+    while rung < max_iter:
+        epoch = int(np.ceil(rung - 1e-9))
+        if epoch < max_iter and epoch not in rungs:
+            rungs.append(epoch)
+        rung *= eta
+    return rungs
+
+
+class ASHAScheduler:
+    ''' asynchronous successive halving on the validation loss. When a trial completes the epoch of a rung its loss is
+    recorded in the results shared by the trials, and it continues only if the loss is in the best 1 / eta of the losses
+    recorded at that rung so far. The first trial to reach a rung always continues '''
+    def __init__(self, results, lock, min_iter=3, eta=1.5, max_iter=10):
+        if eta <= 1:
+            raise ValueError("eta must be greater than 1")
+        self.results = results
+        self.lock = lock
+        self.eta = eta
+        self.rungs = successive_halving_rungs(min_iter, eta, max_iter)
+
+    def should_continue(self, epoch, val_loss):
+        if epoch not in self.rungs:
+            return True
+        with self.lock:
+            recorded = self.results.get(epoch, []) + [val_loss]
+            self.results[epoch] = recorded
+        if len(recorded) == 1:
+            return True
+        cutoff = np.percentile(recorded, 100 / self.eta)
+        return val_loss <= cutoff
+
+
+def run_sweep(config: Config, accelerator):
+    ''' runs the trials of the sweep of config.model in a pool of processes without wandb. The datasets are loaded once
+    for each seq_size of the sweep and shared with the processes, the results are written to a csv file in DIR_EXPERIMENTS '''
+    trials = expand_sweep(config.model.hyperparameters_sweep, config.experiment.sweep_method, config.experiment.sweep_trials, config.experiment.seed)
+    cores = available_cores()
+    num_processes = config.experiment.sweep_processes if config.experiment.sweep_processes > 0 else min(len(trials), cores)
+    num_threads = max(1, cores // num_processes)
+    print(f"Sweep of {len(trials)} trials on {num_processes} processes with {num_threads} threads each")
+
+    datasets = {}
+    for seq_size in sorted({trial.get("seq_size", config.model.hyperparameters_fixed["seq_size"]) for trial in trials}):
+        trial_config = copy.deepcopy(config)
+        trial_config.model.hyperparameters_fixed["seq_size"] = seq_size
+        train_set, val_set, test_sets = load_data(trial_config)
+        for dataset in [train_set, val_set] + test_sets:
+            # the storages are moved to shared memory, so that the processes receive a handle instead of a copy
+            dataset.x.share_memory_()
+            dataset.y.share_memory_()
+        datasets[seq_size] = (train_set, val_set, test_sets)
+
+    rows = []
+    context = mp.get_context("spawn")
+    manager = context.Manager()
+    scheduler = None
+    if config.experiment.sweep_early_terminate:
+        scheduler = ASHAScheduler(manager.dict(), manager.Lock(), config.experiment.sweep_min_iter, config.experiment.sweep_eta, config.experiment.max_epochs)
+        print(f"Successive halving at epochs {scheduler.rungs}")
+    with ProcessPoolExecutor(max_workers=num_processes, mp_context=context, initializer=_init_worker, initargs=(datasets, num_threads)) as executor:
+        futures = [executor.submit(run_trial, config, trial, i, accelerator, scheduler) for i, trial in enumerate(trials)]
+        for future in as_completed(futures):
+            row = future.result()
+            print(f"Trial {row['trial']} finished: {row}")
+            rows.append(row)
+    manager.shutdown()
+    epochs = sum(row.get("epochs", 0) for row in rows)
+    print(f"Epochs trained: {epochs} of {len(trials) * config.experiment.max_epochs} of the full grid")
+    rows.sort(key=lambda row: row["val_loss"] if row["val_loss"] is not None else float("inf"))
+    path = write_results(config, rows)
+    print(f"Sweep results saved in {path}")
+    return rows
+
+
+def _init_worker(datasets, num_threads):
+    global _datasets
+    _datasets = datasets
+    torch.set_num_threads(num_threads)
+
+
+def run_trial(config: Config, hyperparameters, trial_id, accelerator, scheduler=None):
+    ''' trains the model with hyperparameters in place of the fixed ones and returns a row of the results table '''
+    config = copy.deepcopy(config)
+    row = {"trial": trial_id, **hyperparameters}
+    run_name = ""
+    for key, value in hyperparameters.items():
+        config.model.hyperparameters_fixed[key] = value
+        run_name += str(key[:2]) + "_" + str(value) + "_"
+    seq_size = config.model.hyperparameters_fixed["seq_size"]
+    dataset = config.experiment.dataset_type.value
+    config.experiment.filename_ckpt = f"{dataset}_seq_size_{seq_size}_horizon_{horizon_name(config)}_sweep_{trial_id}_{run_name}seed_{config.experiment.seed}"
+    L.seed_everything(config.experiment.seed, verbose=False)
+    trainer = L.Trainer(
+        accelerator=accelerator,
+        precision=cst.PRECISION,
+        max_epochs=config.experiment.max_epochs,
+        callbacks=[EarlyStopping(monitor="val_loss", mode="min", patience=2, verbose=False, min_delta=0.002)],
+        num_sanity_val_steps=0,
+        enable_progress_bar=False,
+        enable_checkpointing=False,
+        logger=False,
+        check_val_every_n_epoch=1
+    )
+    start = time.perf_counter()
+    try:
+        # the datasets are shared, the dataloaders read them in the trial process
+        results = train(config, trainer, datasets=_datasets[seq_size], num_workers=0, scheduler=scheduler)
+        row["val_loss"] = results["val_loss"]
+        row["epochs"] = trainer.current_epoch
+        for i, output in enumerate(results["test"]):
+            row[f"test_f1_{test_name(config, i)}"] = output["f1_score"]
+        row["best_model_path"] = results["best_model_path"]
+    except Exception as e:
+        traceback.print_exc()
+        row["val_loss"] = None
+        row["error"] = repr(e)
+    row["seconds"] = round(time.perf_counter() - start, 1)
+    return row
+
+
+def test_name(config: Config, i):
+    if config.experiment.dataset_type == cst.Dataset.LOBSTER:
+        return config.experiment.testing_stocks[i]
+    return "FI-2010"
+
+
+def write_results(config: Config, rows):
+    os.makedirs(cst.DIR_EXPERIMENTS, exist_ok=True)
+    path = f"{cst.DIR_EXPERIMENTS}/sweep_{config.model.type.value}_{config.experiment.dataset_type.value}_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
@@ -0,0 +1,68 @@
+''' trains and tests an MLPLOB on random data with the data parallel arguments of run.py, the Lightning launcher runs
+this script again for each rank. The global zero writes the test metrics, the same metrics computed on the whole test
+set by a single process and the totals of a MetricAccumulator reduced over the processes to the json file of argv[2] '''
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lightning as L
+import torch
+from torch.utils.data import DataLoader
+import constants as cst
+from models.engine import Engine
+from preprocessing.dataset import Dataset
+from utils.utils_distributed import distributed_trainer_args
+from utils.utils_metrics import MetricAccumulator, confusion_matrix, classification_metrics
+
+
+def main():
+    num_processes, output_path = int(sys.argv[1]), sys.argv[2]
+    os.makedirs(cst.DIR_SAVED_MODEL + "/MLPLOB", exist_ok=True)
+    torch.manual_seed(0)
+    seq_size, num_features, batch_size = 16, 40, 16
+    # every rank gets the same number of full batches, so the mean of the batch losses is the mean over the windows,
+    # and the test loader has at least the 5 batches sampled for the attention plots
+    num_windows = 4 * num_processes * batch_size
+    x = torch.randn(num_windows + seq_size - 1, num_features)
+    y = torch.randint(0, 3, (num_windows,))
+    dataset = Dataset(x, y, seq_size)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+    engine = Engine(
+        seq_size=seq_size, horizon=5, max_epochs=1, model_type="MLPLOB", is_wandb=False, experiment_type=["TRAINING"],
+        lr=1e-3, optimizer="Adam", filename_ckpt="distributed", num_features=num_features, dataset_type="FI_2010",
+        hidden_dim=16, num_layers=2, num_heads=1, len_test_dataloader=len(loader),
+    )
+    trainer = L.Trainer(
+        accelerator="cpu", max_epochs=1, num_sanity_val_steps=0, enable_progress_bar=False, logger=False,
+        enable_checkpointing=False, **distributed_trainer_args(num_processes, 1),
+    )
+    trainer.fit(engine, loader, loader)
+    test_results = trainer.test(engine, loader, verbose=False)[0]
+
+    # each rank adds a loss of rank + 1 and one window of class rank predicted as class 0
+    rank = trainer.global_rank
+    accumulator = MetricAccumulator()
+    accumulator.update(torch.tensor(rank + 1.0), torch.tensor([rank]), torch.tensor([0]))
+    reduced = accumulator.compute(engine.sum_over_processes)
+    loss_sum, num_batches, confusion = accumulator._state(engine.sum_over_processes)
+    if not trainer.is_global_zero:
+        return
+
+    with torch.inference_mode(), engine.ema.average_parameters():
+        windows = torch.stack([dataset[i][0] for i in range(len(dataset))])
+        y_hat = engine.model(windows)
+    expected = classification_metrics(confusion_matrix(y, y_hat.argmax(dim=-1)).numpy())
+    expected["loss"] = torch.nn.functional.cross_entropy(y_hat, y).item()
+    with open(output_path, "w") as f:
+        json.dump({
+            "test": test_results,
+            "expected": {key: float(expected[key]) for key in ["loss", "accuracy", "macro_f1"]},
+            "reduced_loss": reduced["loss"],
+            "loss_sum": loss_sum.item(),
+            "num_batches": num_batches.item(),
+            "confusion": confusion.tolist(),
+        }, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import torch
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "distributed_worker.py")
+
+
+@pytest.mark.skipif(not torch.distributed.is_available() or not torch.distributed.is_gloo_available(), reason="gloo not available")
+def test_two_processes_reduce_loss_and_metrics(tmp_path):
+    output_path = tmp_path / "results.json"
+    # the worker runs as a script, the Lightning launcher starts the second rank by running it again
+    completed = subprocess.run([sys.executable, WORKER, "2", str(output_path)], cwd=tmp_path, capture_output=True, text=True, timeout=600)
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    results = json.loads(output_path.read_text())
+
+    assert results["loss_sum"] == pytest.approx(3.0)
+    assert results["num_batches"] == 2
+    assert results["reduced_loss"] == pytest.approx(1.5)
+    assert results["confusion"] == [[1, 0, 0], [1, 0, 0], [0, 0, 0]]
+
+    test, expected = results["test"], results["expected"]
+    assert test["test_loss"] == pytest.approx(expected["loss"], abs=1e-4)
+    assert test["accuracy"] == pytest.approx(expected["accuracy"], abs=1e-6)
+    assert test["f1_score"] == pytest.approx(expected["macro_f1"], abs=1e-6)
@@ -0,0 +1,47 @@
+import pytest
+import torch
+import constants as cst
+from inference.streaming import MLPLOBStream, DeepLOBStream, compare_with_batch_forward
+from utils.utils_model import pick_model
+from utils.utils_benchmark import default_model_args, random_input
+
+
+@pytest.mark.parametrize("dataset_type", [cst.Dataset.FI_2010.value, cst.Dataset.LOBSTER.value])
+def test_mlplob_stream_matches_forward(dataset_type):
+    torch.manual_seed(0)
+    model_args = default_model_args(cst.ModelType.MLPLOB.value, dataset_type)
+    model_args["seq_size"] = 32
+    model = pick_model(**model_args)
+    events = random_input(1, 80, model_args["num_features"], dataset_type)[0]
+    comparison = compare_with_batch_forward(MLPLOBStream(model), events)
+    assert comparison["max_abs_diff"] < 1e-4
+    assert comparison["agreement"] == 1.0
+
+
+def test_deeplob_stream_exact_matches_forward():
+    torch.manual_seed(0)
+    model = pick_model(cst.ModelType.DEEPLOB.value, 0, 0, 100, 40)
+    events = torch.randn(140, 40)
+    comparison = compare_with_batch_forward(DeepLOBStream(model, 100, "exact"), events)
+    assert comparison["max_abs_diff"] < 1e-5
+    assert comparison["agreement"] == 1.0
+
+
+def test_deeplob_stream_approximate_is_close_to_forward():
+    torch.manual_seed(0)
+    model = pick_model(cst.ModelType.DEEPLOB.value, 0, 0, 100, 40)
+    events = torch.randn(140, 40)
+    stream = DeepLOBStream(model, 100, "approximate")
+    # the LSTM state carries all the history, so the probabilities are only close to the ones of the window
+    comparison = compare_with_batch_forward(stream, events)
+    assert comparison["max_abs_diff"] < 1e-2
+    stream.reset()
+    outputs = [output for output in (stream.push(event) for event in events) if output is not None]
+    assert len(outputs) == 41
+    assert torch.allclose(torch.stack(outputs).sum(dim=-1), torch.ones(41), atol=1e-5)
+
+
+def test_deeplob_stream_mode_not_found():
+    model = pick_model(cst.ModelType.DEEPLOB.value, 0, 0, 100, 40)
+    with pytest.raises(ValueError):
+        DeepLOBStream(model, 100, "fast")
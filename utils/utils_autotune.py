@@ -0,0 +1,171 @@
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+import constants as cst
+from preprocessing.dataset import Dataset
+from utils.utils_model import pick_model
+from utils.utils_benchmark import default_model_args, available_cores, peak_rss_mb, random_input, time_calls
+
+AUTOTUNE_FILE = cst.DIR_EXPERIMENTS + "/autotune.json"
+# DataLoader workers of the runs without a config or an autotuned value
+DEFAULT_NUM_WORKERS = 4
+
+
+def model_args(config):
+    ''' the pick_model arguments of the model of the config, after the dataset specific hidden_dim of main.py '''
+    return default_model_args(config.model.type.value, config.experiment.dataset_type.value, config.model.hyperparameters_fixed)
+
+
+def autotune_key(args):
+    ''' the settings depend on the model, its input and the host '''
+    return (f"{args['model_type']}_{args['dataset_type']}_seq_{args['seq_size']}_hidden_{args['hidden_dim']}_layers_{args['num_layers']}"
+            f"_{platform.node()}_{available_cores()}_cores")
+
+
+def measure(setting):
+    ''' runs in the worker process, returns the throughput in windows per second of one setting of the inference or
+    of the training steps, and the peak memory of the process and of its DataLoader workers '''
+    torch.set_num_threads(setting["threads"])
+    torch.set_num_interop_threads(setting["interop_threads"])
+    torch.manual_seed(0)
+    args = setting["model_args"]
+    model = pick_model(**args)
+    batch_size, steps = setting["batch_size"], setting["steps"]
+    if setting["mode"] == "inference":
+        model.eval()
+        x = random_input(batch_size, args["seq_size"], args["num_features"], args["dataset_type"])
+
+        def predict():
+            with torch.inference_mode():
+                model(x)
+        seconds = time_calls(predict, steps, warmup=2).sum()
+        num_workers = 0
+    else:
+        num_workers = setting["num_workers"]
+        warmup = 2
+        num_rows = (steps + warmup) * batch_size + args["seq_size"] - 1
+        x = random_input(num_rows, 1, args["num_features"], args["dataset_type"])[:, 0]
+        y = torch.randint(0, 3, (num_rows - args["seq_size"] + 1,))
+        loader = DataLoader(Dataset(x, y, args["seq_size"]), batch_size=batch_size, shuffle=True, num_workers=num_workers, drop_last=True)
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.0001)
+        loss_function = nn.CrossEntropyLoss()
+        model.train()
+        for step, (inputs, labels) in enumerate(loader):
+            if step == warmup:
+                start = time.perf_counter()
+            output = model(inputs)
+            loss = loss_function(output[0] if isinstance(output, tuple) else output, labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        seconds = time.perf_counter() - start
+    # every DataLoader worker is counted with the peak of the largest one, an upper bound as the pages shared with the
+    # parent are counted again
+    memory = peak_rss_mb() + num_workers * peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return {**setting, "throughput": steps * batch_size / seconds, "peak_rss_mb": memory}
+
+
+def run_setting(setting):
+    ''' runs measure in a new process, the interop threads can be set only once in a process '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.run([sys.executable, "-m", "utils.utils_autotune", json.dumps(setting)], capture_output=True, text=True, cwd=root)
+    if process.returncode != 0:
+        return {**setting, "error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}"}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def best_setting(results, memory_mb=0):
+    ''' the setting with the highest throughput among those within memory_mb, 0 is no budget '''
+    valid = [r for r in results if "error" not in r and (memory_mb <= 0 or r["peak_rss_mb"] <= memory_mb)]
+    return max(valid, key=lambda r: r["throughput"]) if valid else None
+
+
+def autotune(config):
+    ''' sweeps the threads, interop threads, batch sizes and, for the training, the DataLoader workers of the model of
+    the config, and saves the settings with the highest throughput within experiment.autotune_memory_mb in
+    AUTOTUNE_FILE. Each setting is measured in its own process '''
+    args = model_args(config)
+    threads = list(config.experiment.autotune_threads)
+    if not threads:
+        threads = sorted({2**i for i in range(available_cores().bit_length()) if 2**i <= available_cores()} | {available_cores()})
+    print(f"Autotuning {autotune_key(args)}")
+    print(f"{'mode':<10}{'threads':>8}{'interop':>8}{'workers':>8}{'batch':>7}{'windows/s':>11}{'peak MB':>9}")
+    tuned = {}
+    for mode in ["inference", "training"]:
+        workers = list(config.experiment.autotune_workers) if mode == "training" else [0]
+        results = []
+        for num_threads, interop_threads, num_workers, batch_size in itertools.product(
+                threads, config.experiment.autotune_interop_threads, workers, config.experiment.autotune_batch_sizes):
+            setting = {
+                "mode": mode,
+                "model_args": args,
+                "threads": num_threads,
+                "interop_threads": interop_threads,
+                "num_workers": num_workers,
+                "batch_size": batch_size,
+                "steps": config.experiment.autotune_steps,
+            }
+            result = run_setting(setting)
+            results.append(result)
+            if "error" in result:
+                print(f"{mode:<10}{num_threads:>8}{interop_threads:>8}{num_workers:>8}{batch_size:>7}  failed: {result['error']}")
+                continue
+            print(f"{mode:<10}{num_threads:>8}{interop_threads:>8}{num_workers:>8}{batch_size:>7}{result['throughput']:>11.0f}{result['peak_rss_mb']:>9.0f}")
+        best = best_setting(results, config.experiment.autotune_memory_mb)
+        if best is None:
+            print(f"No {mode} setting within {config.experiment.autotune_memory_mb} MB")
+            continue
+        tuned[mode] = {key: best[key] for key in ["threads", "interop_threads", "num_workers", "batch_size", "throughput", "peak_rss_mb"]}
+        print(f"Best {mode} setting: {tuned[mode]}")
+
+    saved = load_autotune_file()
+    saved[autotune_key(args)] = {**tuned, "date": time.strftime("%Y-%m-%d %H:%M:%S"), "torch": torch.__version__}
+    os.makedirs(os.path.dirname(AUTOTUNE_FILE), exist_ok=True)
+    with open(AUTOTUNE_FILE, "w") as f:
+        json.dump(saved, f, indent=2)
+    print(f"Settings saved in {AUTOTUNE_FILE}")
+    return tuned
+
+
+def load_autotune_file():
+    if not os.path.isfile(AUTOTUNE_FILE):
+        return {}
+    with open(AUTOTUNE_FILE) as f:
+        return json.load(f)
+
+
+def apply_runtime_settings(config):
+    ''' sets the torch threads and experiment.num_workers of the run. The values of the config are used when set,
+    otherwise those autotuned for the model of the config, of the training for the runs that train and of the
+    inference for the others. The autotuned batch sizes are only printed, the batch size changes the optimization '''
+    tuned = {}
+    if config.experiment.use_autotune:
+        mode = "training" if "TRAINING" in config.experiment.type or "FINETUNING" in config.experiment.type else "inference"
+        tuned = load_autotune_file().get(autotune_key(model_args(config)), {}).get(mode, {})
+        if tuned:
+            print(f"Autotuned {mode} setting: {tuned['threads']} threads, {tuned['interop_threads']} interop threads, "
+                  f"{tuned['num_workers']} workers, batch size {tuned['batch_size']} (not applied)")
+    num_threads = config.experiment.num_threads if config.experiment.num_threads > 0 else tuned.get("threads")
+    num_interop_threads = config.experiment.num_interop_threads if config.experiment.num_interop_threads > 0 else tuned.get("interop_threads")
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None and num_interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # e.g. the second run of a hydra multirun in the same process
+            print(f"The interop threads can be set only once in a process, keeping {torch.get_num_interop_threads()}")
+    if config.experiment.num_workers < 0:
+        config.experiment.num_workers = tuned.get("num_workers", DEFAULT_NUM_WORKERS)
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure(json.loads(sys.argv[1]))))
@@ -0,0 +1,85 @@
+import os
+import resource
+import sys
+import time
+import numpy as np
+import torch
+import constants as cst
+from config.config import MLPLOB, TLOB, BiNCTABL, DeepLOB
+
+
+MODEL_CONFIGS = {
+    cst.ModelType.MLPLOB.value: MLPLOB,
+    cst.ModelType.TLOB.value: TLOB,
+    cst.ModelType.BINCTABL.value: BiNCTABL,
+    cst.ModelType.DEEPLOB.value: DeepLOB,
+}
+
+
+def default_model_args(model_type, dataset_type=cst.Dataset.FI_2010.value, hyperparameters=None):
+    ''' returns the pick_model arguments that main.py uses for model_type on dataset_type, with the hyperparameters_fixed
+    of a config when given and those of config/config.py otherwise '''
+    hp = hyperparameters if hyperparameters is not None else MODEL_CONFIGS[model_type]().hyperparameters_fixed
+    if dataset_type == cst.Dataset.LOBSTER.value:
+        num_features = 46 if hp["all_features"] else 40
+        hidden_dim = 46
+    else:
+        num_features = 144 if hp["all_features"] else 40
+        hidden_dim = 144
+    return {
+        "model_type": model_type,
+        "hidden_dim": hp.get("hidden_dim", hidden_dim) if hyperparameters is not None else hidden_dim,
+        "num_layers": hp.get("num_layers", 4),
+        "seq_size": hp["seq_size"],
+        "num_features": num_features,
+        "num_heads": hp.get("num_heads", 8),
+        "is_sin_emb": hp.get("is_sin_emb", True),
+        "dataset_type": dataset_type,
+    }
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def random_input(batch_size, seq_size, num_features, dataset_type=cst.Dataset.FI_2010.value):
+    x = torch.randn(batch_size, seq_size, num_features)
+    if dataset_type == cst.Dataset.LOBSTER.value and num_features > 41:
+        # the order type column is embedded, so it has to contain valid class indices
+        x[:, :, 41] = torch.randint(0, 3, (batch_size, seq_size)).float()
+    return x
+
+
+def logits(output):
+    # TLOB returns also the attention maps
+    return output[0] if isinstance(output, tuple) else output
+
+
+def time_calls(fn, iters, warmup=5):
+    ''' returns the wall time in seconds of each of the iters calls of fn '''
+    for _ in range(warmup):
+        fn()
+    times = np.empty(iters)
+    for i in range(iters):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def latency_summary(times, batch_size=1):
+    return {
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p90_ms": float(np.percentile(times, 90) * 1000),
+        "p99_ms": float(np.percentile(times, 99) * 1000),
+        "mean_ms": float(times.mean() * 1000),
+        "throughput": float(batch_size / times.mean()),
+    }
@@ -0,0 +1,86 @@
+import os
+import queue
+import threading
+import zipfile
+import lightning
+import torch
+from omegaconf import OmegaConf
+
+
+def weights_only_checkpoint(module, epoch, global_step):
+    ''' checkpoint with a CPU copy of the state dict and the hyperparameters of a LightningModule, without optimizer
+    and loop states, it can be loaded with build_engine and load_model but not used to resume a fit '''
+    return {
+        "state_dict": {key: value.detach().to("cpu", copy=True) for key, value in module.state_dict().items()},
+        # the hydra containers are stored as lists and dicts, so that the checkpoint loads with weights_only
+        "hyper_parameters": {key: OmegaConf.to_container(value) if OmegaConf.is_config(value) else value for key, value in module.hparams.items()},
+        "epoch": epoch,
+        "global_step": global_step,
+        "pytorch-lightning_version": lightning.__version__,
+    }
+
+
+def read_checkpoint(checkpoint_path, map_location="cpu"):
+    ''' loads a checkpoint with a single torch.load, the tensors are memory-mapped from the file instead of copied. The
+    load mode is picked from the globals of the pickle before the load: weights only checkpoints unpickle only tensors
+    and plain containers, trainer checkpoints with other objects, e.g. the hydra configs in the hyperparameters, are
+    unpickled entirely. Files in the legacy format of torch.save are read without mmap '''
+    if not zipfile.is_zipfile(checkpoint_path):
+        return torch.load(checkpoint_path, map_location=map_location, weights_only=False)
+    # only the pickle in the zip is scanned, the tensors are read once by the load
+    weights_only = not torch.serialization.get_unsafe_globals_in_checkpoint(checkpoint_path)
+    return torch.load(checkpoint_path, map_location=map_location, weights_only=weights_only, mmap=True)
+
+
+class AsyncCheckpointWriter:
+    ''' writes checkpoints with torch.save on a background thread. Each file is written to a temporary path in the same
+    directory and renamed, so a checkpoint is either complete or absent. Of the checkpoints submitted with a score,
+    only the keep_best with the lowest score are kept on disk '''
+    def __init__(self, keep_best=1):
+        if keep_best < 1:
+            raise ValueError("keep_best must be at least 1")
+        self.keep_best = keep_best
+        self.best = []
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def submit(self, checkpoint, path, score=None):
+        ''' checkpoint must not be modified after the submit, e.g. a snapshot from weights_only_checkpoint '''
+        self._raise_error()
+        self.queue.put((checkpoint, path, score))
+
+    def wait(self):
+        ''' blocks until every submitted checkpoint is on disk '''
+        self.queue.join()
+        self._raise_error()
+
+    def _work(self):
+        while True:
+            checkpoint, path, score = self.queue.get()
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp_path = path + ".tmp"
+                torch.save(checkpoint, tmp_path)
+                os.replace(tmp_path, path)
+                if score is not None:
+                    self._retain(path, score)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _retain(self, path, score):
+        self.best = [(s, p) for s, p in self.best if p != path]
+        self.best.append((score, path))
+        self.best.sort(key=lambda item: item[0])
+        for _, old_path in self.best[self.keep_best:]:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        self.best = self.best[:self.keep_best]
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("A checkpoint could not be written") from error
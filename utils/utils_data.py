@@ -1,3 +1,4 @@
+import json
 import pandas as pd
 import numpy as np
 import os
@@ -75,6 +76,21 @@ def normalize_messages(data, mean_size=None, mean_prices=None, std_size=None,  s
     return data, mean_size, mean_prices, std_size,  std_prices, mean_time, std_time, mean_depth, std_depth
 
 
+def save_normalization_stats(path, stats):
+    """ saves the means and stds of the train set of a stock next to its splits """
+    with open(path + "/normalization.json", "w") as f:
+        json.dump({key: float(value) for key, value in stats.items()}, f, indent=4)
+
+
+def load_normalization_stats(stock, data_dir=cst.DATA_DIR):
+    """ returns the means and stds saved by the LOBSTER preprocessing of stock """
+    path = data_dir + "/" + stock + "/normalization.json"
+    if not os.path.isfile(path):
+        raise ValueError(f"Normalization statistics of {stock} not found, run the preprocessing of the stock again to save them")
+    with open(path) as f:
+        return json.load(f)
+
+
 def reset_indexes(dataframes):
     # reset the indexes of the messages and orderbooks
     dataframes[0] = dataframes[0].reset_index(drop=True)
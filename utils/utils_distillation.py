@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import torch
+from torch import nn
+import constants as cst
+from inference.evaluation import MultiModelEvaluator, checkpoint_horizons, load_test_rows
+from utils.utils_model import load_model, probabilities
+from utils.utils_benchmark import time_calls, latency_summary
+
+
+def teacher_log_probs(model, hparams, input, batch_size=1024):
+    ''' log class probabilities of the teacher for the window ending at each row of input, with shape
+    (rows, horizons, classes), NaN for the first seq_size - 1 rows that have no full window '''
+    seq_size, num_features = hparams["seq_size"], hparams["num_features"]
+    if input.shape[1] < num_features:
+        raise ValueError(f"The teacher takes {num_features} features, the data has {input.shape[1]}")
+    windows = input[:, :num_features].float().unfold(0, seq_size, 1).transpose(1, 2)
+    num_horizons = len(checkpoint_horizons(hparams))
+    log_probs = torch.full((input.shape[0], num_horizons, 3), float("nan"))
+    with torch.inference_mode():
+        for i in range(0, windows.shape[0], batch_size):
+            probs = probabilities(hparams["model_type"], model(windows[i:i + batch_size]))
+            # DeepLOB and BiN-CTABL return probabilities, the soft targets are taken from their log
+            log_probs[seq_size - 1 + i:seq_size - 1 + i + probs.shape[0]] = torch.log(probs.clamp_min(1e-12)).view(probs.shape[0], num_horizons, 3)
+    return log_probs
+
+
+def load_teacher_targets(checkpoint_path, input, horizons, data_name, split):
+    ''' log probabilities of the teacher of checkpoint_path for the heads of horizons, by the last row of the windows of
+    input. The teacher runs once per split, its outputs are cached next to the checkpoint in a .npy file named by the
+    data and the split, and recomputed if the number of rows changes '''
+    cache_path = os.path.splitext(checkpoint_path)[0] + f"_soft_targets_{data_name}_{split}.npy"
+    model, hparams = load_model(checkpoint_path)
+    teacher_horizons = checkpoint_horizons(hparams)
+    for horizon in horizons:
+        if horizon not in teacher_horizons:
+            raise ValueError(f"Horizon {horizon} not found in the teacher, trained on {teacher_horizons}")
+    if os.path.isfile(cache_path) and np.load(cache_path, mmap_mode="r").shape[0] == input.shape[0]:
+        print(f"Loading the soft targets of the {split} split from {cache_path}")
+        log_probs = torch.from_numpy(np.load(cache_path))
+    else:
+        print(f"Computing the soft targets of the {split} split with {hparams['model_type']}")
+        log_probs = teacher_log_probs(model, hparams, input)
+        np.save(cache_path, log_probs.numpy())
+    return log_probs[:, [teacher_horizons.index(horizon) for horizon in horizons]]
+
+
+def distillation_loss(y_hat, teacher_log_probs, temperature):
+    ''' KL divergence between the teacher and the student distributions softened by temperature, scaled by its square
+    so that the gradients keep the scale of the cross entropy. The windows without a teacher output are left out '''
+    student_log_probs = nn.functional.log_softmax(y_hat / temperature, dim=-1)
+    teacher_log_probs = nn.functional.log_softmax(teacher_log_probs / temperature, dim=-1)
+    valid = torch.isfinite(teacher_log_probs).all(dim=-1)
+    if not valid.any():
+        return y_hat.new_zeros(())
+    # a NaN in the masked windows would still reach the gradients
+    teacher_log_probs = torch.where(valid.unsqueeze(-1), teacher_log_probs, 0.0)
+    kl = (teacher_log_probs.exp() * (teacher_log_probs - student_log_probs)).sum(dim=-1)
+    return kl[valid].mean() * temperature ** 2
+
+
+def distillation_report(teacher_path, student_path, config, iters=200):
+    ''' F1 score on the same test windows and batch-1 latency of the teacher and the student '''
+    evaluator = MultiModelEvaluator.from_checkpoints([teacher_path, student_path])
+    evaluator.names = ["teacher", "student"]
+    latencies = {}
+    for name, model, hparams in zip(evaluator.names, evaluator.models, evaluator.hparams):
+        x = torch.randn(1, hparams["seq_size"], hparams["num_features"])
+        if evaluator.dataset_type == cst.Dataset.LOBSTER.value and hparams["num_features"] > 41:
+            # the order type column is embedded
+            x[:, :, 41] = 1
+
+        def predict():
+            with torch.inference_mode():
+                model(x)
+        latencies[name] = latency_summary(time_calls(predict, iters))
+        latencies[name]["parameters"] = sum(p.numel() for p in model.parameters())
+    results = {}
+    for name, (input, labels) in load_test_rows(evaluator.dataset_type, evaluator.horizons, config.experiment.testing_stocks).items():
+        test_results = evaluator.evaluate(input, labels, config.experiment.evaluation_batch_size)
+        print(f"Test set {name}")
+        print(f"{'model':<14}{'params':>10}{'p50 ms':>9}{'p99 ms':>9}{'f1':>9}{'accuracy':>10}")
+        for key, result in test_results.items():
+            if key.startswith("ensemble"):
+                continue
+            latency = latencies[key.split(" ")[0]]
+            print(f"{key:<14}{latency['parameters']:>10}{latency['p50_ms']:>9.3f}{latency['p99_ms']:>9.3f}{result['macro_f1']:>9.4f}{result['accuracy']:>10.4f}")
+        results[name] = test_results
+    print(f"Student speedup at batch 1: {latencies['teacher']['p50_ms'] / latencies['student']['p50_ms']:.2f}x")
+    return results, latencies
@@ -0,0 +1,47 @@
+import os
+from lightning.pytorch.callbacks import Callback
+from lightning.pytorch.strategies import DDPStrategy
+import torch
+
+
+def distributed_trainer_args(num_processes, num_nodes):
+    ''' returns the L.Trainer arguments of the data parallel training with gloo, num_processes ranks on each of num_nodes
+    nodes. With more than one node MASTER_ADDR, MASTER_PORT and NODE_RANK have to be set on every node '''
+    if num_processes == 1 and num_nodes == 1:
+        return {}
+    return {
+        "devices": num_processes,
+        "num_nodes": num_nodes,
+        # the order type embedding and the unused branches of the models do not receive gradients on every dataset
+        "strategy": DDPStrategy(process_group_backend="gloo", find_unused_parameters=True),
+    }
+
+
+def pinned_cores(local_rank, num_processes, cores=None):
+    ''' splits the cores available to the process in num_processes contiguous blocks and returns the block of local_rank,
+    with fewer cores than processes every process gets one core '''
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0))
+    if len(cores) < num_processes:
+        return [cores[local_rank % len(cores)]]
+    size, remainder = divmod(len(cores), num_processes)
+    start = local_rank * size + min(local_rank, remainder)
+    return cores[start:start + size + (1 if local_rank < remainder else 0)]
+
+
+class ThreadPinning(Callback):
+    ''' pins each local rank to its own block of cores and sets the intra-op threads to the size of the block,
+    so that the ranks of a node do not oversubscribe the cores '''
+    def __init__(self, num_processes):
+        self.num_processes = num_processes
+        self.cores = None
+
+    def setup(self, trainer, pl_module, stage):
+        if not hasattr(os, "sched_setaffinity"):
+            return
+        if self.cores is None:
+            # setup is called again by test, the cores are split only once
+            self.cores = pinned_cores(trainer.local_rank, self.num_processes)
+            print(f"rank {trainer.global_rank} pinned to cores {self.cores[0]}-{self.cores[-1]} with {len(self.cores)} threads")
+        os.sched_setaffinity(0, self.cores)
+        torch.set_num_threads(len(self.cores))
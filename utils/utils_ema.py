@@ -0,0 +1,73 @@
+import contextlib
+import torch
+
+
+class ExponentialMovingAverage:
+    ''' exponential moving average of a list of parameters, with the same decay schedule of torch_ema.
+    The shadow parameters are updated with one fused foreach lerp every update_every steps, using the decay of
+    update_every single steps, so that the average covers the same number of steps of the per-step update.
+    store/copy_to/restore let the caller swap the average in once for a whole validation or test epoch '''
+    def __init__(self, parameters, decay=0.999, update_every=1, use_num_updates=True):
+        if decay < 0.0 or decay > 1.0:
+            raise ValueError("Decay must be between 0 and 1")
+        if update_every < 1:
+            raise ValueError("update_every must be at least 1")
+        self.parameters = [p for p in parameters if p.requires_grad]
+        self.decay = decay
+        self.update_every = update_every
+        self.num_updates = 0 if use_num_updates else None
+        self.num_steps = 0
+        self.shadow_params = [p.detach().clone() for p in self.parameters]
+        self.collected_params = None
+
+    @torch.no_grad()
+    def update(self):
+        self.num_steps += 1
+        if self.num_steps % self.update_every != 0:
+            return
+        decay = self.decay
+        if self.num_updates is not None:
+            self.num_updates += self.update_every
+            decay = min(decay, (1 + self.num_updates) / (10 + self.num_updates))
+        torch._foreach_lerp_(self.shadow_params, [p.detach() for p in self.parameters], 1.0 - decay ** self.update_every)
+
+    @torch.no_grad()
+    def copy_to(self):
+        torch._foreach_copy_([p.data for p in self.parameters], self.shadow_params)
+
+    @torch.no_grad()
+    def copy_from(self):
+        ''' restarts the average from the current parameters, e.g. after loading a state dict '''
+        torch._foreach_copy_(self.shadow_params, [p.detach() for p in self.parameters])
+
+    @torch.no_grad()
+    def store(self):
+        self.collected_params = [p.detach().clone() for p in self.parameters]
+
+    @torch.no_grad()
+    def restore(self):
+        if self.collected_params is None:
+            raise RuntimeError("This ExponentialMovingAverage has no stored parameters to restore")
+        torch._foreach_copy_([p.data for p in self.parameters], self.collected_params)
+        self.collected_params = None
+
+    @property
+    def is_swapped(self):
+        return self.collected_params is not None
+
+    @contextlib.contextmanager
+    def average_parameters(self):
+        ''' swaps the average in for the duration of the context, nothing is done if it is already swapped in '''
+        if self.is_swapped:
+            yield
+            return
+        self.store()
+        self.copy_to()
+        try:
+            yield
+        finally:
+            self.restore()
+
+    def to(self, device):
+        self.shadow_params = [p.to(device) for p in self.shadow_params]
+        return self
@@ -0,0 +1,154 @@
+import numpy as np
+import torch
+
+
+class MetricAccumulator:
+    ''' sum of the batch losses and confusion matrix of an epoch, kept on the device of the batches,
+    so that the only synchronization with the host is in compute '''
+    def __init__(self, num_classes=3):
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self.loss_sum = None
+        self.confusion = None
+        self.num_batches = 0
+
+    def update(self, loss, targets=None, predictions=None):
+        if self.loss_sum is None:
+            self.loss_sum = torch.zeros((), dtype=torch.float64, device=loss.device)
+            self.confusion = torch.zeros((self.num_classes, self.num_classes), dtype=torch.long, device=loss.device)
+        self.loss_sum += loss.detach()
+        self.num_batches += 1
+        if targets is not None:
+            self.confusion += confusion_matrix(targets, predictions, self.num_classes)
+
+    def mean_loss(self, reduce=None):
+        ''' reduce sums a tensor over the processes of a distributed run, e.g. the reduce of the Lightning strategy '''
+        loss_sum, num_batches, _ = self._state(reduce)
+        if num_batches == 0:
+            return float("nan")
+        return loss_sum.item() / num_batches.item()
+
+    def compute(self, reduce=None):
+        ''' returns the mean batch loss and the metrics of the confusion matrix, as classification_metrics '''
+        loss_sum, num_batches, confusion = self._state(reduce)
+        results = classification_metrics(confusion.cpu().numpy())
+        results["loss"] = loss_sum.item() / num_batches.item() if num_batches > 0 else float("nan")
+        return results
+
+    def _state(self, reduce):
+        if self.loss_sum is None:
+            loss_sum = torch.zeros((), dtype=torch.float64)
+            confusion = torch.zeros((self.num_classes, self.num_classes), dtype=torch.long)
+        else:
+            loss_sum, confusion = self.loss_sum, self.confusion
+        num_batches = torch.tensor(self.num_batches, device=loss_sum.device)
+        if reduce is not None:
+            # the reduce of the strategies can be in place
+            loss_sum, num_batches, confusion = reduce(loss_sum.clone()), reduce(num_batches), reduce(confusion.clone())
+        return loss_sum, num_batches, confusion
+
+
+def confusion_matrix(targets, predictions, num_classes=3):
+    ''' confusion matrix with the targets on the rows and the predictions on the columns, computed on the device of the inputs '''
+    indices = targets.long() * num_classes + predictions.long()
+    return torch.bincount(indices.flatten(), minlength=num_classes * num_classes).view(num_classes, num_classes)
+
+
+def classification_metrics(confusion):
+    ''' precision, recall and f1 score of each class and their macro and weighted averages, as in sklearn classification_report:
+    the averages are over the classes that appear in the targets or in the predictions and undefined ratios are 0 '''
+    confusion = np.asarray(confusion, dtype=np.float64)
+    true_positives = np.diag(confusion)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+    denominator = support + predicted
+    f1 = np.divide(2 * true_positives, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+    labels = np.flatnonzero(denominator > 0)
+    total = support.sum()
+    results = {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "support": support.astype(np.int64),
+        "labels": labels,
+        "accuracy": true_positives.sum() / total if total > 0 else 0.0,
+    }
+    for name in ["precision", "recall", "f1"]:
+        results["macro_" + name] = results[name][labels].mean() if len(labels) > 0 else 0.0
+        results["weighted_" + name] = (results[name] * support).sum() / total if total > 0 else 0.0
+    return results
+
+
+def format_report(results, digits=4):
+    ''' text table of classification_metrics with the layout of sklearn classification_report '''
+    headers = ["precision", "recall", "f1-score", "support"]
+    width = len("weighted avg")
+    lines = [f"{'':>{width}} " + "".join(f" {h:>9}" for h in headers), ""]
+    for label in results["labels"]:
+        values = [results["precision"][label], results["recall"][label], results["f1"][label]]
+        lines.append(f"{label:>{width}} " + "".join(f" {v:>9.{digits}f}" for v in values) + f" {results['support'][label]:>9}")
+    total = results["support"].sum()
+    lines.append("")
+    lines.append(f"{'accuracy':>{width}} " + f" {'':>9} {'':>9} {results['accuracy']:>9.{digits}f} {total:>9}")
+    for average in ["macro", "weighted"]:
+        values = [results[f"{average}_{name}"] for name in ["precision", "recall", "f1"]]
+        lines.append(f"{average + ' avg':>{width}} " + "".join(f" {v:>9.{digits}f}" for v in values) + f" {total:>9}")
+    return "\n".join(lines)
+
+
+class BinnedPRCurve:
+    ''' precision-recall curve of the scores of pos_label, from histograms of the scores of the positive and negative
+    samples over num_bins equal bins of [0, 1]. The memory does not depend on the number of samples and two curves
+    are merged by summing their histograms. The points are exact for the thresholds at the bin edges, so every
+    point of the exact curve lies between two of them and its threshold is at most 1 / num_bins away '''
+    def __init__(self, num_bins=1000, pos_label=1):
+        self.num_bins = num_bins
+        self.pos_label = pos_label
+        self.reset()
+
+    def reset(self):
+        # row 0 counts the negative samples and row 1 the positive ones
+        self.histogram = None
+
+    def update(self, scores, targets):
+        if self.histogram is None:
+            self.histogram = torch.zeros((2, self.num_bins), dtype=torch.long, device=scores.device)
+        bins = torch.clamp((scores.detach() * self.num_bins).long(), 0, self.num_bins - 1)
+        indices = (targets == self.pos_label).long() * self.num_bins + bins
+        self.histogram += torch.bincount(indices.flatten(), minlength=2 * self.num_bins).view(2, self.num_bins)
+
+    def merge(self, other):
+        if other.histogram is not None:
+            if self.histogram is None:
+                self.histogram = other.histogram.clone()
+            else:
+                self.histogram += other.histogram.to(self.histogram.device)
+        return self
+
+    def compute(self, reduce=None):
+        ''' returns precision, recall and thresholds in the format of sklearn precision_recall_curve,
+        reduce sums the histograms over the processes of a distributed run '''
+        histogram = self.histogram
+        if histogram is None:
+            histogram = torch.zeros((2, self.num_bins), dtype=torch.long)
+        if reduce is not None:
+            histogram = reduce(histogram.clone())
+        histogram = histogram.cpu().numpy()
+        if histogram.sum() == 0:
+            return np.ones(1), np.zeros(1), np.zeros(0)
+        # samples with a score above each bin edge
+        false_positives = np.cumsum(histogram[0, ::-1])[::-1]
+        true_positives = np.cumsum(histogram[1, ::-1])[::-1]
+        thresholds = np.arange(self.num_bins) / self.num_bins
+        predicted = true_positives + false_positives
+        # as in sklearn, one threshold for each distinct score, here each non empty bin
+        keep = histogram.sum(axis=0) > 0
+        true_positives, predicted, thresholds = true_positives[keep], predicted[keep], thresholds[keep]
+        precision = true_positives / predicted
+        total_positives = histogram[1].sum()
+        recall = true_positives / total_positives if total_positives > 0 else np.ones_like(precision)
+        return np.r_[precision, 1], np.r_[recall, 0], thresholds
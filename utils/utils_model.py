@@ -1,18 +1,73 @@
+import torch
+import constants as cst
 from models.mlplob import MLPLOB
 from models.tlob import TLOB
 from models.binctabl import BiN_CTABL
 from models.deeplob import DeepLOB
+from utils.utils_checkpoint import read_checkpoint
 from transformers import AutoModelForSeq2SeqLM
 
 
-def pick_model(model_type, hidden_dim, num_layers, seq_size, num_features, num_heads=8, is_sin_emb=False, dataset_type=None):
+def pick_model(model_type, hidden_dim, num_layers, seq_size, num_features, num_heads=8, is_sin_emb=False, dataset_type=None, compile=False, num_horizons=1, early_exit=False, is_multi_head=False):
     if model_type == "MLPLOB":
-        return MLPLOB(hidden_dim, num_layers, seq_size, num_features, dataset_type)
+        model = MLPLOB(hidden_dim, num_layers, seq_size, num_features, dataset_type, num_horizons, is_multi_head)
     elif model_type == "TLOB":
-        return TLOB(hidden_dim, num_layers, seq_size, num_features, num_heads, is_sin_emb, dataset_type)
+        model = TLOB(hidden_dim, num_layers, seq_size, num_features, num_heads, is_sin_emb, dataset_type, num_horizons, early_exit, is_multi_head)
+    elif early_exit:
+        raise ValueError("Early exit heads not found for " + str(model_type))
+    elif is_multi_head or num_horizons > 1:
+        raise ValueError("Multi-horizon heads not found for " + str(model_type))
     elif model_type == "BINCTABL":
-        return BiN_CTABL(60, num_features, seq_size, seq_size, 120, 5, 3, 1)
+        model = BiN_CTABL(60, num_features, seq_size, seq_size, 120, 5, 3, 1)
     elif model_type == "DEEPLOB":
-        return DeepLOB()
+        model = DeepLOB()
     else:
-        raise ValueError("Model not found")
\ No newline at end of file
+        raise ValueError("Model not found")
+    if compile:
+        # compiling in place keeps the parameter names, so the checkpoints stay interchangeable with the eager models
+        model.compile()
+    return model
+
+
+def probabilities(model_type, output):
+    ''' class probabilities of the output of a model, DeepLOB and BiN-CTABL end with a softmax, TLOB returns also the attention maps '''
+    if isinstance(output, tuple):
+        output = output[0]
+    if model_type in [cst.ModelType.DEEPLOB.value, cst.ModelType.BINCTABL.value]:
+        return output.float()
+    return torch.softmax(output.float(), dim=-1)
+
+
+def build_model(checkpoint):
+    ''' rebuilds the bare model of an Engine checkpoint loaded with read_checkpoint, the checkpoints are saved with the
+    EMA weights swapped in '''
+    hparams = checkpoint["hyper_parameters"]
+    model = pick_model(
+        hparams["model_type"],
+        hparams["hidden_dim"],
+        hparams["num_layers"],
+        hparams["seq_size"],
+        hparams["num_features"],
+        hparams["num_heads"],
+        hparams["is_sin_emb"],
+        hparams["dataset_type"],
+        num_horizons=max(len(hparams.get("horizons") or []), 1),
+        early_exit=hparams.get("early_exit", False),
+        # the runs with a list of horizons have multi-head outputs, (batch, horizons, 3), also with a single horizon
+        is_multi_head=bool(hparams.get("horizons")),
+    )
+    state_dict = {key[len("model."):]: value for key, value in checkpoint["state_dict"].items() if key.startswith("model.")}
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
+
+def load_model(checkpoint_path, map_location="cpu", exit_threshold=0.0):
+    ''' exit_threshold is the confidence of the early exit of the TLOB models trained with exit heads, 0 runs all the layers '''
+    checkpoint = read_checkpoint(checkpoint_path, map_location)
+    model = build_model(checkpoint)
+    if exit_threshold > 0:
+        if not getattr(model, "exit_heads", None):
+            raise ValueError("Exit heads not found in " + checkpoint_path)
+        model.exit_threshold = exit_threshold
+    return model, checkpoint["hyper_parameters"]
@@ -1,5 +1,13 @@
+import io
+import os
+import queue
+import threading
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
+from PIL import Image
+import seaborn as sns
+import wandb
 
 def plot_mean_att_distance(mean_att_dist):
     'mean_att_dist shape: (num_layers, num_heads)'
@@ -27,4 +35,62 @@ def plot_mean_att_distance(mean_att_dist):
     plt.legend(handles, labels, loc='lower right', ncol=2, fontsize='small')
     plt.tight_layout()
     
-    return plt
\ No newline at end of file
+    return plt
+
+
+class AttentionRenderer:
+    ''' renders the attention maps captured in the test loop on a background thread. submit takes the maps of a batch
+    as float16 arrays of shape (num_layers, num_heads, tokens, tokens) and never blocks: when the queue already holds
+    max_pending batches the maps are dropped. Each head is rendered with its own Figure, without the pyplot state,
+    and logged to wandb or saved as png in save_dir '''
+    def __init__(self, is_wandb, save_dir, max_pending=16):
+        self.is_wandb = is_wandb
+        self.save_dir = save_dir
+        self.dropped = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def submit(self, kind, maps, batch_idx):
+        ''' kind is Temporal or Feature '''
+        try:
+            self.queue.put_nowait((kind, np.asarray(maps, dtype=np.float16), batch_idx))
+        except queue.Full:
+            self.dropped += 1
+
+    def wait(self):
+        ''' blocks until every submitted batch is rendered '''
+        self.queue.join()
+        if self.dropped > 0:
+            print(f"{self.dropped} batches of attention maps were dropped, the renderer queue was full")
+            self.dropped = 0
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("The attention maps could not be rendered") from error
+
+    def _work(self):
+        while True:
+            kind, maps, batch_idx = self.queue.get()
+            try:
+                for l in range(maps.shape[0]):
+                    for i in range(maps.shape[1]):
+                        self._render(maps[l, i].astype(np.float32), f'{kind} Attention Layer {l} Head {i}', batch_idx)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _render(self, att, title, batch_idx):
+        figure = Figure(figsize=(10, 8))
+        ax = figure.add_subplot()
+        sns.heatmap(att, fmt=".2f", cmap="viridis", ax=ax)
+        ax.set_title(title)
+        if self.is_wandb:
+            buffer = io.BytesIO()
+            figure.savefig(buffer, format="png")
+            buffer.seek(0)
+            wandb.log({f"{title} for batch {batch_idx}": wandb.Image(Image.open(buffer))})
+        else:
+            os.makedirs(self.save_dir, exist_ok=True)
+            figure.savefig(f"{self.save_dir}/{title.replace(' ', '_')}_batch_{batch_idx}.png")